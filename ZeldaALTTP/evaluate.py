@@ -0,0 +1,124 @@
+from ZeldaALTTP.utils.settings import load_config
+from ZeldaALTTP.utils.evaluation import (
+    EPISODE_FIELDS, SUMMARY_FIELDS, MILESTONES, find_checkpoints, checkpoint_steps, evaluate_model, summarize_episodes
+)
+from ZeldaALTTP.utils.device_utils import setup_device, plan_cpu_layout, format_cpu_layout
+from ZeldaALTTP.utils.env_factory import make_env, WORKER_MODULES
+from ZeldaALTTP.utils import session_manager
+from pygba.preload import enable_forkserver_preload
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from datetime import datetime
+from pathlib import Path
+import csv
+
+# Checkpoint evaluation ([EvalModel] in config.toml): deterministic episodes of one or many checkpoints on a pool of
+# headless env workers, written out as a per-episode CSV and a comparison table (one row per checkpoint).
+# Env observation / action settings come from [TrainModel], so the envs match what the checkpoints were trained on.
+
+
+def resolve_model_path(model_path):
+    """model_path from the config, or the latest session of the latest model if it is empty."""
+    if model_path:
+        return Path(model_path)
+    model_dir = session_manager.get_latest_model_dir(BASE_SESSIONS_DIR)
+    if model_dir is None:
+        raise FileNotFoundError(f"No model directories found in {BASE_SESSIONS_DIR}")
+    session_dir = session_manager.get_latest_session_dir(model_dir)
+    if session_dir is None:
+        raise FileNotFoundError(f"No session directories found in {model_dir}")
+    return session_dir
+
+
+def format_table(summaries):
+    milestone_columns = [f"{name}_reached" for name in MILESTONES]
+    header = f"{'checkpoint':<36} {'steps':>10} {'reward':>9} {'areas':>6} {'explored':>9} " + " ".join(
+        f"{name:>11}" for name in MILESTONES)
+    lines = [header, "-" * len(header)]
+    for summary in summaries:
+        steps = summary["num_timesteps"] if summary["num_timesteps"] is not None else "-"
+        lines.append(
+            f"{summary['checkpoint'][:36]:<36} {steps:>10} {summary['reward_mean']:>9.2f} "
+            f"{summary['areas_reached_mean']:>6.2f} {summary['explored_locations_mean']:>9.1f} "
+            + " ".join(f"{summary[column]:>11.0%}" for column in milestone_columns)
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print("\nStarting evaluation...")
+    config = load_config()
+    print()
+    # ====== GLOBAL CONFIG AND VARS ======
+    paths_config = config["Paths"]
+    train_config = config["TrainModel"]
+    general_config = config["General"]
+    eval_config = config["EvalModel"]
+    BASE_SESSIONS_DIR = Path(paths_config["session_path"])
+    NUM_ENVS = eval_config["num_envs"]
+    EPISODE_COUNT = eval_config["episode_count"]
+    MODEL_PATH = eval_config.get("model_path", "")
+    CHECKPOINTS = eval_config.get("checkpoints", "all")
+    DETERMINISTIC = eval_config.get("deterministic", True)
+    SEED = eval_config.get("seed", 0)
+    OUTPUT_DIR = Path(eval_config.get("output_path", "eval_results"))
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    WORKER_START_METHOD = train_config.get("worker_start_method", "forkserver")
+
+    checkpoints = find_checkpoints(resolve_model_path(MODEL_PATH), CHECKPOINTS)
+    if not checkpoints:
+        raise FileNotFoundError(f"No checkpoints found for model_path '{MODEL_PATH}'")
+    print(f"Evaluating {len(checkpoints)} checkpoint(s), {EPISODE_COUNT} episode(s) each on {NUM_ENVS} env worker(s)")
+
+    # the eval pool always runs headless; deterministic envs and a fixed seed give every checkpoint the same episodes
+    env_config = dict(
+        train_config,
+        action_freq=eval_config["action_freq"],
+        episode_length=eval_config["episode_length"],
+        num_envs=NUM_ENVS,
+        headless=True,
+        deterministic=DETERMINISTIC,
+        profile=False,
+    )
+    general = dict(general_config, enable_stream_wrapper=False)
+    cpu_layout = plan_cpu_layout(NUM_ENVS, env_config)
+    print(format_cpu_layout(cpu_layout))
+    if WORKER_START_METHOD == "forkserver" and train_config.get("preload_rom", True):
+        enable_forkserver_preload([paths_config["gb_path"], paths_config["init_state"]], WORKER_MODULES)
+    env = SubprocVecEnv(
+        [make_env(i, paths_config, env_config, general, cpu_layout) for i in range(NUM_ENVS)],
+        start_method=WORKER_START_METHOD,
+    )
+    device = setup_device(eval_config, cpu_layout)
+
+    timestamp = f"{datetime.now():%Y%m%d_%H%M%S}"
+    episodes_path = OUTPUT_DIR / f"eval_{timestamp}_episodes.csv"
+    summary_path = OUTPUT_DIR / f"eval_{timestamp}.csv"
+    summaries = []
+    try:
+        with open(episodes_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=EPISODE_FIELDS)
+            writer.writeheader()
+            for i, checkpoint in enumerate(checkpoints):
+                print(f"\n[{i + 1}/{len(checkpoints)}] {checkpoint}")
+                model = PPO.load(checkpoint, device=device)
+                fields = dict(checkpoint=checkpoint.name, num_timesteps=checkpoint_steps(checkpoint) or model.num_timesteps)
+                episodes = evaluate_model(model, env, EPISODE_COUNT, seed=SEED, deterministic=DETERMINISTIC, **fields)
+                writer.writerows(episodes)
+                f.flush()
+                summary = summarize_episodes(episodes, **fields)
+                summaries.append(summary)
+                print(f"reward {summary['reward_mean']:.2f} ± {summary['reward_std']:.2f} | "
+                      f"areas {summary['areas_reached_mean']:.2f} (max {summary['areas_reached_max']}) | "
+                      f"explored {summary['explored_locations_mean']:.1f}")
+                del model
+    finally:
+        env.close()
+
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+    print(f"\n{format_table(summaries)}")
+    print(f"\nComparison table saved to: {summary_path}\nPer-episode results saved to: {episodes_path}")
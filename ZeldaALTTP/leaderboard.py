@@ -0,0 +1,186 @@
+from ZeldaALTTP.utils.settings import load_config
+from ZeldaALTTP.utils.evaluation import SUMMARY_FIELDS, checkpoint_steps, evaluate_model, summarize_episodes, file_sha256
+from ZeldaALTTP.utils.device_utils import setup_device, plan_cpu_layout, format_cpu_layout
+from ZeldaALTTP.utils.env_factory import make_env, WORKER_MODULES
+from ZeldaALTTP.utils.population import DEFAULT_REWARD_WEIGHTS
+from pygba.preload import enable_forkserver_preload
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from pathlib import Path
+import hashlib
+import json
+import csv
+import os
+
+# Checkpoint leaderboard ([Leaderboard] in config.toml): finds every checkpoint under the sessions directory, evaluates
+# each on a fixed suite of start states with one shared pool of headless env workers and ranks them.
+# Results are cached per checkpoint content hash and suite, so reruns only evaluate new checkpoints.
+
+LEADERBOARD_FIELDS = ["rank", "model", "session", "checkpoint", "sha256", "error"]
+# [TrainModel] keys the evaluation envs are built from (make_env), besides the palette (hashed by content)
+ENV_KEYS = ["observation_mode", "obs_type", "downscale", "frame_stack", "action_set"]
+
+
+def discover_checkpoints(base_sessions_dir):
+    """Every sessions/model N/session_*/models/*.zip, grouped by content hash: {sha256: [paths]}."""
+    checkpoints = {}
+    for path in sorted(Path(base_sessions_dir).glob("model */session_*/models/*.zip")):
+        checkpoints.setdefault(file_sha256(path), []).append(path)
+    return checkpoints
+
+
+def suite_fingerprint():
+    """
+    Hash of everything that makes results comparable: start state contents, evaluation settings, the env settings
+    of [TrainModel] (observations, action set, palette contents) and the reward weights of the game wrapper.
+    """
+    digest = hashlib.sha256()
+    for state in START_STATES:
+        digest.update(file_sha256(state).encode())
+    settings = dict(
+        action_freq=EVAL_CONFIG["action_freq"], episode_length=EVAL_CONFIG["episode_length"],
+        episodes_per_state=EPISODES_PER_STATE, deterministic=DETERMINISTIC, seed=SEED,
+        env={key: train_config.get(key) for key in ENV_KEYS},
+        palette=file_sha256(train_config["palette_path"]) if train_config.get("palette_path") else None,
+        # the evaluation envs build the wrapper with its defaults, so edited defaults change the rewards
+        reward_weights=DEFAULT_REWARD_WEIGHTS,
+    )
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def load_cache(path):
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_cache(path, cache):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def make_pool():
+    """Headless env workers: START_STATES[i % len(START_STATES)] is worker i's start state."""
+    num_envs = len(START_STATES) * WORKERS_PER_STATE
+    env_config = dict(
+        train_config,
+        action_freq=EVAL_CONFIG["action_freq"],
+        episode_length=EVAL_CONFIG["episode_length"],
+        num_envs=num_envs,
+        headless=True,
+        deterministic=DETERMINISTIC,
+        profile=False,
+    )
+    general = dict(general_config, enable_stream_wrapper=False)
+    cpu_layout = plan_cpu_layout(num_envs, env_config)
+    print(format_cpu_layout(cpu_layout))
+    if WORKER_START_METHOD == "forkserver" and train_config.get("preload_rom", True):
+        enable_forkserver_preload([paths_config["gb_path"], *START_STATES], WORKER_MODULES)
+    env_fns = [
+        make_env(i, dict(paths_config, init_state=START_STATES[i % len(START_STATES)]), env_config, general, cpu_layout)
+        for i in range(num_envs)
+    ]
+    return SubprocVecEnv(env_fns, start_method=WORKER_START_METHOD), cpu_layout
+
+
+def evaluate_checkpoint(path, env, device):
+    """Summary row over the whole suite plus the mean reward per start state (reward@<state>)."""
+    # a checkpoint whose observation settings don't match the envs fails in predict() and is recorded as an error
+    model = PPO.load(path, device=device)
+    episodes_per_worker = -(-EPISODES_PER_STATE // WORKERS_PER_STATE)
+    episodes = evaluate_model(model, env, episodes_per_worker * env.num_envs, seed=SEED, deterministic=DETERMINISTIC)
+    summary = summarize_episodes(episodes, num_timesteps=checkpoint_steps(path) or model.num_timesteps)
+    for state in START_STATES:
+        rewards = [e["reward"] for e in episodes if START_STATES[e["rank"] % len(START_STATES)] == state]
+        summary[f"reward@{Path(state).stem}"] = sum(rewards) / len(rewards)
+    return summary
+
+
+def rank_key(row):
+    # errors and missing values rank last
+    value = row.get(RANK_BY)
+    return (row.get("error") is not None or value is None, -(value or 0))
+
+
+if __name__ == "__main__":
+    print("\nBuilding checkpoint leaderboard...")
+    config = load_config()
+    print()
+    # ====== GLOBAL CONFIG AND VARS ======
+    paths_config = config["Paths"]
+    train_config = config["TrainModel"]
+    general_config = config["General"]
+    EVAL_CONFIG = config["EvalModel"]
+    leaderboard_config = config["Leaderboard"]
+    BASE_SESSIONS_DIR = Path(paths_config["session_path"])
+    START_STATES = leaderboard_config["start_states"] or [paths_config["init_state"]]
+    WORKERS_PER_STATE = leaderboard_config["workers_per_state"]
+    EPISODES_PER_STATE = leaderboard_config["episodes_per_state"]
+    RANK_BY = leaderboard_config["rank_by"]
+    DETERMINISTIC = EVAL_CONFIG.get("deterministic", True)
+    SEED = EVAL_CONFIG.get("seed", 0)
+    WORKER_START_METHOD = train_config.get("worker_start_method", "forkserver")
+    OUTPUT_DIR = Path(leaderboard_config["output_path"])
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    cache_path = OUTPUT_DIR / "leaderboard_cache.json"
+
+    checkpoints = discover_checkpoints(BASE_SESSIONS_DIR)
+    suite = suite_fingerprint()
+    cache = load_cache(cache_path)
+    results = cache.setdefault(suite, {})
+    # failed evaluations (e.g. out of memory) are retried on every run
+    pending = [sha for sha in checkpoints if sha not in results or "error" in results[sha]]
+    print(f"{sum(len(paths) for paths in checkpoints.values())} checkpoint file(s), {len(checkpoints)} unique, "
+          f"{len(pending)} to evaluate on {len(START_STATES)} start state(s) (suite {suite})")
+
+    if pending:
+        env, cpu_layout = make_pool()
+        device = setup_device(EVAL_CONFIG, cpu_layout)
+        try:
+            for i, sha in enumerate(pending):
+                path = checkpoints[sha][0]
+                print(f"\n[{i + 1}/{len(pending)}] {path}")
+                try:
+                    results[sha] = evaluate_checkpoint(path, env, device)
+                    print(f"{RANK_BY}: {results[sha].get(RANK_BY)}")
+                except Exception as e:
+                    print(f"Evaluation failed: {e}")
+                    results[sha] = {"error": str(e)}
+                # cached after every checkpoint, so an interrupted run keeps its progress
+                save_cache(cache_path, cache)
+        finally:
+            env.close()
+
+    rows = []
+    for sha, paths in checkpoints.items():
+        path = paths[0]
+        rows.append({
+            "model": path.parents[2].name,
+            "session": path.parents[1].name,
+            "checkpoint": path.name,
+            "sha256": sha[:12],
+            **results[sha],
+        })
+    rows.sort(key=rank_key)
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+
+    state_fields = [f"reward@{Path(state).stem}" for state in START_STATES]
+    fieldnames = LEADERBOARD_FIELDS + [name for name in SUMMARY_FIELDS if name != "checkpoint"] + state_fields
+    leaderboard_path = OUTPUT_DIR / "leaderboard.csv"
+    with open(leaderboard_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n{'rank':>4} {'model':<10} {'checkpoint':<36} {RANK_BY:>16}")
+    for row in rows[:20]:
+        value = row.get(RANK_BY)
+        shown = f"{value:.3f}" if isinstance(value, (int, float)) else row.get("error", "-")
+        print(f"{row['rank']:>4} {row['model']:<10} {row['checkpoint'][:36]:<36} {shown:>16}")
+    print(f"\nLeaderboard saved to: {leaderboard_path}")
@@ -0,0 +1,115 @@
+from ZeldaALTTP.utils.settings import load_config
+from ZeldaALTTP.utils.population import Member, PopulationTrainer, split_member_config
+from ZeldaALTTP.utils.rollout_buffer import compact_rollout_buffer_class
+from ZeldaALTTP.utils.device_utils import setup_device, plan_cpu_layout, format_cpu_layout
+from ZeldaALTTP.utils.env_factory import make_env, default_ppo_kwargs, POLICY_TYPES, WORKER_MODULES
+from ZeldaALTTP.utils.supervised_vec_env import SupervisedSubprocVecEnv
+from pygba.preload import enable_forkserver_preload
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from datetime import datetime
+from pathlib import Path
+import json
+
+# Population training ([Population] in config.toml): several PPO learners with their own reward weights and
+# hyperparameters take turns on one pool of emulator workers (see PopulationTrainer), optionally with PBT-style
+# exploit / explore between them. Everything else ([TrainModel]) is shared by all members.
+
+
+def create_member(index, member_config):
+    weights, hyperparams = split_member_config(member_config)
+    kwargs = dict(default_ppo_kwargs(model_config), **hyperparams)
+    model = PPO(
+        POLICY_TYPES[OBSERVATION_MODE],
+        env,
+        verbose=0,
+        device=DEVICE,
+        seed=SEED + index if SEED is not None else None,
+        rollout_buffer_class=compact_rollout_buffer_class(env.observation_space) if COMPACT_ROLLOUT else None,
+        **kwargs
+    )
+    member_dir = POPULATION_DIR / f"member_{index}"
+    (member_dir / "models").mkdir(parents=True, exist_ok=True)
+    return Member(index, model, weights, hyperparams, FITNESS, FITNESS_WINDOW, member_dir)
+
+
+if __name__ == "__main__":
+    print("\nStarting population training...")
+    config = load_config()
+    print()
+    # ====== GLOBAL CONFIG AND VARS ======
+    paths_config = config["Paths"]
+    model_config = config["TrainModel"]
+    general_config = config["General"]
+    population_config = config["Population"]
+    NUM_ENVS = model_config["num_envs"]
+    SEED = model_config.get("seed", -1)
+    SEED = SEED if SEED >= 0 else None
+    OBSERVATION_MODE = model_config.get("observation_mode", "screen")
+    COMPACT_ROLLOUT = model_config.get("compact_rollout", True)
+    WORKER_WATCHDOG = model_config.get("worker_watchdog", True)
+    WORKER_START_METHOD = model_config.get("worker_start_method", "forkserver")
+    MEMBERS = population_config["members"] or [{}]
+    TOTAL_TIMESTEPS = population_config["total_timesteps"] or model_config["episode_length"] * model_config["episode_count"] * NUM_ENVS * len(MEMBERS)
+    SCHEDULE = population_config["schedule"]
+    SLICE_ROLLOUTS = population_config["slice_rollouts"]
+    EXPLOIT_INTERVAL = population_config["exploit_interval"]
+    EXPLOIT_FRACTION = population_config["exploit_fraction"]
+    PERTURB_FACTORS = population_config["perturb_factors"]
+    FITNESS = population_config["fitness"]
+    FITNESS_WINDOW = population_config["fitness_window"]
+    POPULATION_DIR = Path(paths_config["session_path"]) / "populations" / f"population_{datetime.now():%Y%m%d_%H%M%S}"
+    POPULATION_DIR.mkdir(parents=True, exist_ok=True)
+    with open(POPULATION_DIR / "config.json", "w") as f:
+        json.dump(population_config, f, indent=2)
+
+    CPU_LAYOUT = plan_cpu_layout(NUM_ENVS, model_config)
+    print(format_cpu_layout(CPU_LAYOUT))
+    if WORKER_START_METHOD == "forkserver" and model_config.get("preload_rom", True):
+        enable_forkserver_preload([paths_config["gb_path"], paths_config["init_state"]], WORKER_MODULES)
+    # reward weights are switched per member, so the shared envs can't also stream
+    general = dict(general_config, enable_stream_wrapper=False)
+    env_fns = [make_env(i, paths_config, model_config, general, CPU_LAYOUT) for i in range(NUM_ENVS)]
+    if WORKER_WATCHDOG:
+        env = SupervisedSubprocVecEnv(
+            env_fns,
+            start_method=WORKER_START_METHOD,
+            step_timeout=model_config.get("worker_step_timeout_s", 60.0),
+            reset_timeout=model_config.get("worker_reset_timeout_s", 300.0),
+            max_restarts=model_config.get("worker_max_restarts", 10)
+        )
+    else:
+        env = SubprocVecEnv(env_fns, start_method=WORKER_START_METHOD)
+    DEVICE = setup_device(model_config, CPU_LAYOUT)
+
+    members = [create_member(i, member_config) for i, member_config in enumerate(MEMBERS)]
+    print(f"Population of {len(members)} members in {POPULATION_DIR}, {TOTAL_TIMESTEPS} timesteps in total "
+          f"(schedule: {SCHEDULE}, exploit every {EXPLOIT_INTERVAL or '-'} rounds)")
+    trainer = PopulationTrainer(
+        env,
+        members,
+        POPULATION_DIR,
+        schedule=SCHEDULE,
+        slice_rollouts=SLICE_ROLLOUTS,
+        exploit_interval=EXPLOIT_INTERVAL,
+        exploit_fraction=EXPLOIT_FRACTION,
+        perturb_factors=PERTURB_FACTORS,
+        seed=SEED,
+    )
+    try:
+        trainer.run(TOTAL_TIMESTEPS)
+        trainer.save("final")
+        print(f"\nFinal member models saved to: {POPULATION_DIR}")
+    except KeyboardInterrupt:
+        print("\nPopulation training interrupted! Saving members...")
+        trainer.save("interrupted")
+        print(f"Interrupted member models saved to: {POPULATION_DIR}")
+        raise
+    finally:
+        env.close()
+
+    for member in sorted(members, key=lambda member: member.fitness if member.fitness is not None else float("-inf"), reverse=True):
+        fitness = f"{member.fitness:.2f}" if member.fitness is not None else "n/a"
+        print(f"member {member.index}: fitness {fitness}, {member.model.num_timesteps} steps, weights {member.weights}, "
+              f"hyperparams {member.hyperparams}")
@@ -0,0 +1,186 @@
+from ZeldaALTTP.utils.settings import load_config
+from ZeldaALTTP.utils import session_manager
+from pygba.pygba import PyGBA
+from pygba.action_log import ActionLogReader, replay_episode
+from ZeldaALTTP.utils.highlights import HighlightRenderer, HIGHLIGHT_EVENTS, find_clips
+from pygba.game_wrappers.zelda_alttp import ZeldaALTTP
+
+from pathlib import Path
+import multiprocessing as mp
+import numpy as np
+import mediapy as media
+import mgba.log
+import csv
+import os
+
+mgba.log.silence()
+
+# Episode replay ([Replay] in config.toml): re-simulates episodes from a session's action logs (action_log in
+# [TrainModel]) headless, spread over worker processes, and writes videos, frames and/or RAM traces per episode.
+# The replayed return is compared with the logged one to check that the episode was reproduced.
+# With highlights_only, only the highlight clips of the selected episodes are rendered (utils/highlights.py).
+
+SUMMARY_FIELDS = ["rank", "episode", "length", "start_step", "stop_step", "logged_return", "replayed_return", "reproduced", "outputs"]
+
+# per replay worker: the emulator (ROM loaded once), the log reader and the replay settings
+_worker = {}
+
+
+def resolve_log_path(log_path):
+    """log_path from the config (a session or its action_logs dir), or the latest session of the latest model."""
+    if log_path:
+        path = Path(log_path)
+    else:
+        model_dir = session_manager.get_latest_model_dir(BASE_SESSIONS_DIR)
+        if model_dir is None:
+            raise FileNotFoundError(f"No model directories found in {BASE_SESSIONS_DIR}")
+        path = session_manager.get_latest_session_dir(model_dir)
+        if path is None:
+            raise FileNotFoundError(f"No session directories found in {model_dir}")
+    return path / "action_logs" if (path / "action_logs").is_dir() else path
+
+
+def init_worker(rom_path, log_path, outputs, every_frame, start_step, stop_step, output_dir):
+    mgba.log.silence()
+    _worker.update(
+        gba=PyGBA.load(rom_path),
+        reader=ActionLogReader(log_path),
+        outputs=outputs,
+        every_frame=every_frame,
+        start_step=start_step,
+        stop_step=stop_step,
+        output_dir=Path(output_dir),
+    )
+
+
+def replay_task(entry):
+    """Replays one indexed episode in a worker and writes its outputs; returns a SUMMARY_FIELDS row."""
+    rank, episode = entry["rank"], entry["episode"]
+    outputs, output_dir = _worker["outputs"], _worker["output_dir"]
+    log = _worker["reader"].load(rank, episode)
+    start = min(_worker["start_step"], entry["length"])
+    stop = min(_worker["stop_step"] or entry["length"], entry["length"])
+    partial = (start, stop) != (0, entry["length"])
+    name = f"rank_{rank:02d}_episode_{episode:06d}" + (f"_steps_{start}-{stop}" if partial else "")
+    wrapper = ZeldaALTTP()
+    # frames per second of the video: every emulated frame, or one per step
+    fps = 60 if _worker["every_frame"] else 60 / max(float(np.mean(log["frames"])), 1.0)
+    video = None
+    frames = None
+    ram_rows = []
+    replayed_return = 0.0
+    try:
+        for step in replay_episode(_worker["gba"], log, wrapper, every_frame=_worker["every_frame"], start=start, stop=stop):
+            replayed_return += step["reward"]
+            if "video" in outputs:
+                if video is None:
+                    video = media.VideoWriter(str(output_dir / f"{name}.mp4"), step["frames"][0].shape[:2], fps=fps)
+                    video.__enter__()
+                for frame in step["frames"]:
+                    video.add_image(frame)
+            if "frames" in outputs:
+                # one frame per step, written to a memory-mapped .npy instead of being held in memory
+                if frames is None:
+                    frames = np.lib.format.open_memmap(output_dir / f"{name}_frames.npy", mode="w+", dtype=np.uint8,
+                                                       shape=(stop - start, *step["frames"][-1].shape))
+                frames[step["step"] - start] = step["frames"][-1]
+            if "ram" in outputs:
+                scalars = {key: value for key, value in step["info"].items() if isinstance(value, (bool, int, float))}
+                ram_rows.append({
+                    "step": step["step"], "action": step["action"], "reward": step["reward"], **scalars,
+                    **{f"ram_{name}": value for name, value in zip(wrapper.ram_feature_names, step["ram"].tolist())},
+                })
+    finally:
+        if video is not None:
+            video.close()
+        if frames is not None:
+            frames.flush()
+    if ram_rows:
+        with open(output_dir / f"{name}_ram.csv", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(ram_rows[0]))
+            writer.writeheader()
+            writer.writerows(ram_rows)
+    return {
+        "rank": rank,
+        "episode": episode,
+        "length": entry["length"],
+        "start_step": start,
+        "stop_step": stop,
+        "logged_return": entry["return"],
+        "replayed_return": replayed_return,
+        # only checked for whole episodes (the replay uses the logged reward weights)
+        "reproduced": None if partial else abs(replayed_return - entry["return"]) <= 1e-3 * max(1.0, abs(entry["return"])),
+        "outputs": ";".join(outputs),
+    }
+
+
+def render_highlights(reader, selected, output_dir, model_config):
+    """Renders the highlight clips (highlight_* keys of [TrainModel]) of the selected episodes."""
+    skip = {(entry["rank"], entry["episode"]) for entry in reader.episodes}
+    skip -= {(entry["rank"], entry["episode"]) for entry in selected}
+    clips = find_clips(reader, model_config.get("highlight_events", HIGHLIGHT_EVENTS),
+                       model_config.get("highlight_before_steps", 50), model_config.get("highlight_after_steps", 25), skip=skip)
+    print(f"Rendering {len(clips)} highlight clip(s) to {output_dir}")
+    renderer = HighlightRenderer(paths_config["gb_path"], reader.path, output_dir, workers=WORKERS,
+                                 every_frame=EVERY_FRAME, nice=0, start_method=WORKER_START_METHOD)
+    renderer.submit(clips)
+    rows = renderer.close(wait=True)
+    for row in rows:
+        if row["error"]:
+            print(f"rank {row['rank']} episode {row['episode']} steps {row['start']}-{row['stop']}: {row['error']}")
+    print(f"\n{sum(not row['error'] for row in rows)}/{len(rows)} highlight clip(s) rendered. "
+          f"Index saved to: {renderer.index_path}")
+
+
+if __name__ == "__main__":
+    print("\nReplaying logged episodes...")
+    config = load_config()
+    print()
+    # ====== GLOBAL CONFIG AND VARS ======
+    paths_config = config["Paths"]
+    replay_config = config["Replay"]
+    BASE_SESSIONS_DIR = Path(paths_config["session_path"])
+    RANKS = replay_config["ranks"]
+    EPISODES = replay_config["episodes"]
+    OUTPUTS = replay_config["outputs"]
+    EVERY_FRAME = replay_config["every_frame"]
+    START_STEP = replay_config["start_step"]
+    STOP_STEP = replay_config["stop_step"]
+    HIGHLIGHTS_ONLY = replay_config["highlights_only"]
+    WORKERS = replay_config["workers"] or os.cpu_count()
+    WORKER_START_METHOD = config["TrainModel"].get("worker_start_method", "forkserver")
+
+    log_path = resolve_log_path(replay_config["log_path"])
+    reader = ActionLogReader(log_path)
+    selected = [
+        entry for entry in reader.episodes
+        if (not RANKS or entry["rank"] in RANKS) and (not EPISODES or entry["episode"] in EPISODES)
+    ]
+    output_dir = Path(replay_config["output_path"]) / log_path.parent.parent.name / log_path.parent.name
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"{len(reader.episodes)} logged episode(s) in {log_path}, replaying {len(selected)} "
+          f"with {WORKERS} worker(s) -> {', '.join(OUTPUTS)} in {output_dir}")
+
+    if HIGHLIGHTS_ONLY:
+        render_highlights(reader, selected, output_dir / "highlights", config["TrainModel"])
+    else:
+        context = mp.get_context(WORKER_START_METHOD)
+        rows = []
+        init_args = (paths_config["gb_path"], str(log_path), OUTPUTS, EVERY_FRAME, START_STEP, STOP_STEP, str(output_dir))
+        with context.Pool(min(WORKERS, max(len(selected), 1)), initializer=init_worker, initargs=init_args) as pool:
+            # longest episodes first, so the pool doesn't finish on one long straggler
+            for row in pool.imap_unordered(replay_task, sorted(selected, key=lambda entry: -entry["length"])):
+                rows.append(row)
+                print(f"[{len(rows)}/{len(selected)}] rank {row['rank']} episode {row['episode']}: "
+                      f"steps {row['start_step']}-{row['stop_step']} of {row['length']}, return {row['replayed_return']:.2f} "
+                      f"(logged {row['logged_return']:.2f})" + (" - NOT reproduced" if row["reproduced"] is False else ""))
+
+        rows.sort(key=lambda row: (row["rank"], row["episode"]))
+        summary_path = output_dir / "replay_summary.csv"
+        with open(summary_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        checked = [row for row in rows if row["reproduced"] is not None]
+        print(f"\n{sum(row['reproduced'] for row in checked)}/{len(checked)} whole episode(s) reproduced their logged return. "
+              f"Summary saved to: {summary_path}")
@@ -0,0 +1,223 @@
+from ZeldaALTTP.utils.settings import load_config
+from ZeldaALTTP.utils.sweep import ResultsDB, expand_spec, split_trial_params, trial_key
+from ZeldaALTTP.utils.rollout_buffer import compact_rollout_buffer_class
+from ZeldaALTTP.utils.device_utils import setup_device, plan_cpu_layout, available_cpus, pin_to_cpus
+from ZeldaALTTP.utils.env_factory import make_env, POLICY_TYPES, WORKER_MODULES
+from ZeldaALTTP.tune import TrialTimer, steady_mean
+from pygba.preload import enable_forkserver_preload
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from multiprocessing.connection import wait
+from datetime import datetime
+from pathlib import Path
+import multiprocessing as mp
+import numpy as np
+import time
+
+# Hyperparameter sweep ([Sweep] in config.toml): expands a grid or random search over [TrainModel] keys, PPO settings
+# and reward weights, and runs the trials as separate processes side by side within a CPU budget (each trial gets
+# num_envs + torch threads CPUs of its own). Results go to a SQLite database; trials that already ran with the same
+# settings are skipped, so sweeps can be extended or rerun after an interruption.
+
+
+class TrialMetrics(TrialTimer):
+    """TrialTimer plus the return and fitness value (info[fitness_key], its length for collections) of every finished episode."""
+    def __init__(self, fitness_key, verbose=0):
+        super().__init__(verbose)
+        self.fitness_key = fitness_key
+        self.returns = []
+        self.fitness = []
+        self.running = None
+
+    def _on_step(self):
+        rewards, dones, infos = self.locals["rewards"], self.locals["dones"], self.locals["infos"]
+        if self.running is None:
+            self.running = np.zeros(len(rewards))
+        self.running += rewards
+        for i in np.flatnonzero(dones):
+            self.returns.append(float(self.running[i]))
+            self.running[i] = 0.0
+            value = infos[i].get(self.fitness_key)
+            if value is not None:
+                self.fitness.append(len(value) if hasattr(value, "__len__") else float(value))
+        return True
+
+
+def run_trial(trial, paths_config, general_config, cpus, conn):
+    """Runs in its own process, pinned to `cpus`: trains a fresh PPO model for the trial and sends back its metrics."""
+    pin_to_cpus(cpus)
+    train_config = trial["train_config"]
+    num_envs = train_config["num_envs"]
+    start_method = train_config.get("worker_start_method", "forkserver")
+    result = {}
+    env = None
+    try:
+        # plans within this trial's CPUs only, since the process is pinned to them
+        cpu_layout = plan_cpu_layout(num_envs, train_config)
+        if start_method == "forkserver" and train_config.get("preload_rom", True):
+            enable_forkserver_preload([paths_config["gb_path"], paths_config["init_state"]], WORKER_MODULES)
+        general = dict(general_config, enable_stream_wrapper=False)
+        env = SubprocVecEnv([make_env(i, paths_config, train_config, general, cpu_layout) for i in range(num_envs)],
+                            start_method=start_method)
+        env.env_method("configure_wrapper", **trial["weights"])
+        device = setup_device(train_config, cpu_layout)
+        seed = train_config.get("seed", -1)
+        model = PPO(
+            POLICY_TYPES[train_config.get("observation_mode", "screen")],
+            env,
+            verbose=0,
+            device=device,
+            seed=seed if seed >= 0 else None,
+            rollout_buffer_class=compact_rollout_buffer_class(env.observation_space) if train_config.get("compact_rollout", True) else None,
+            **trial["ppo_kwargs"],
+        )
+        metrics = TrialMetrics(trial["fitness_key"])
+        start = time.perf_counter()
+        model.learn(total_timesteps=trial["timesteps"], callback=metrics)
+        wall_s = time.perf_counter() - start
+
+        samples = model.n_steps * num_envs
+        result["samples_per_sec"] = model.num_timesteps / wall_s
+        result["rollout_steps_per_sec"] = samples / steady_mean(metrics.collect_times)
+        result["learner_samples_per_sec"] = samples / steady_mean(metrics.update_times)
+        result["wall_s"] = wall_s
+        result["episodes"] = len(metrics.returns)
+        result["reward_mean"] = float(np.mean(metrics.returns)) if metrics.returns else None
+        result["fitness_mean"] = float(np.mean(metrics.fitness)) if metrics.fitness else None
+        # values logged by the last update (the logger is dumped before each update, not after)
+        for name in ("entropy_loss", "approx_kl", "clip_fraction", "value_loss", "explained_variance"):
+            value = model.logger.name_to_value.get(f"train/{name}")
+            result[name] = float(value) if value is not None else None
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if env is not None:
+            env.close()
+    conn.send(result)
+
+
+def make_trials(param_sets):
+    """Full trial descriptions (settings, CPU cost and key) for the expanded parameter sets, duplicates removed."""
+    trials = {}
+    for params in param_sets:
+        train_config, ppo_kwargs, weights = split_trial_params(params, model_config)
+        episode_length = params.get("episode_length", TRIAL_EPISODE_LENGTH or train_config["episode_length"])
+        train_config = dict(train_config, episode_length=episode_length, headless=True, profile=False)
+        settings = dict(
+            train_config=train_config,
+            ppo_kwargs=ppo_kwargs,
+            weights=weights,
+            timesteps=TRIAL_EPISODES * episode_length * train_config["num_envs"],
+            fitness_key=FITNESS,
+        )
+        key = trial_key(settings, paths_config["gb_path"], paths_config["init_state"])
+        cost = train_config["num_envs"] + (train_config.get("torch_threads", 0) or 1)
+        trials.setdefault(key, dict(settings, key=key, params=params, cost=min(cost, len(BUDGET_CPUS))))
+    return list(trials.values())
+
+
+def format_params(params):
+    return " ".join(f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}" for name, value in params.items())
+
+
+if __name__ == "__main__":
+    print("\nStarting hyperparameter sweep...")
+    config = load_config()
+    print()
+    # ====== GLOBAL CONFIG AND VARS ======
+    paths_config = config["Paths"]
+    model_config = config["TrainModel"]
+    general_config = config["General"]
+    sweep_config = config["Sweep"]
+    MODE = sweep_config["mode"]
+    SAMPLES = sweep_config["samples"]
+    SWEEP_SEED = sweep_config["seed"]
+    TRIAL_EPISODES = sweep_config["trial_episodes"]
+    TRIAL_EPISODE_LENGTH = sweep_config["trial_episode_length"]
+    TRIAL_TIMEOUT_S = sweep_config["trial_timeout_s"]
+    CPU_BUDGET = sweep_config["cpu_budget"]
+    MAX_CONCURRENT = sweep_config["max_concurrent"]
+    OBJECTIVE = sweep_config["objective"]
+    FITNESS = sweep_config["fitness"]
+    DATABASE = Path(sweep_config["database"])
+    BUDGET_CPUS = available_cpus()[:CPU_BUDGET] if CPU_BUDGET else available_cpus()
+    SWEEP_NAME = f"sweep_{datetime.now():%Y%m%d_%H%M%S}"
+
+    trials = make_trials(expand_spec(sweep_config["parameters"], MODE, SAMPLES, SWEEP_SEED))
+    db = ResultsDB(DATABASE)
+    pending = [trial for trial in trials if not db.is_done(trial["key"])]
+    print(f"{SWEEP_NAME}: {len(trials)} trial(s) ({MODE}), {len(trials) - len(pending)} already in {DATABASE}, "
+          f"{len(pending)} to run on a budget of {len(BUDGET_CPUS)} CPU(s)")
+
+    # spawned, so trial processes don't inherit torch threads or this process' CPU pinning
+    context = mp.get_context("spawn")
+    free_cpus = list(BUDGET_CPUS)
+    running = {}
+    done_count = 0
+    try:
+        while pending or running:
+            # first fit: start every pending trial whose CPUs are free, smaller ones may overtake a large one
+            for trial in list(pending):
+                if MAX_CONCURRENT and len(running) >= MAX_CONCURRENT:
+                    break
+                if trial["cost"] > len(free_cpus):
+                    continue
+                cpus, free_cpus = free_cpus[:trial["cost"]], free_cpus[trial["cost"]:]
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=run_trial, args=(trial, paths_config, general_config, cpus, sender))
+                process.start()
+                sender.close()
+                running[process.sentinel] = dict(
+                    trial=trial, process=process, conn=receiver, cpus=cpus, start=time.time(),
+                    started=datetime.now().isoformat(timespec="seconds"),
+                )
+                pending.remove(trial)
+                print(f"[start] {format_params(trial['params'])} on CPU {', '.join(map(str, cpus))}")
+
+            wait(list(running), timeout=5.0)
+            for sentinel, job in list(running.items()):
+                process, trial = job["process"], job["trial"]
+                timed_out = TRIAL_TIMEOUT_S and time.time() - job["start"] > TRIAL_TIMEOUT_S
+                # the result is sent right before the process exits (a crashed one only closes its end of the pipe)
+                if job["conn"].poll():
+                    try:
+                        result = job["conn"].recv()
+                    except EOFError:
+                        process.join()
+                        result = {"error": f"trial process exited with code {process.exitcode}"}
+                elif timed_out:
+                    process.terminate()
+                    result = {"error": f"timed out after {TRIAL_TIMEOUT_S}s"}
+                elif not process.is_alive():
+                    result = {"error": f"trial process exited with code {process.exitcode}"}
+                else:
+                    continue
+                process.join()
+                job["conn"].close()
+                del running[sentinel]
+                free_cpus = sorted(free_cpus + job["cpus"])
+                settings = {name: trial[name] for name in ("train_config", "ppo_kwargs", "weights", "timesteps", "fitness_key")}
+                db.record(trial["key"], SWEEP_NAME, trial["params"], settings, job["started"], result)
+                done_count += 1
+                outcome = result.get("error") or ", ".join(
+                    f"{name} {result[name]:.3g}" for name in ("samples_per_sec", "reward_mean", "fitness_mean") if result.get(name) is not None
+                )
+                print(f"[{done_count}/{done_count + len(running) + len(pending)}] {format_params(trial['params'])}: {outcome}")
+    except KeyboardInterrupt:
+        print("\nSweep interrupted! Stopping running trials (finished trials are kept in the database)...")
+        for job in running.values():
+            job["process"].terminate()
+            job["process"].join()
+        raise
+    finally:
+        ranked = db.ranked([trial["key"] for trial in trials], OBJECTIVE)
+        db.close()
+
+    print(f"\n{'rank':>4} {OBJECTIVE:>20} {'samples/s':>10}  params")
+    for rank, row in enumerate(ranked[:20], start=1):
+        value = row[OBJECTIVE]
+        shown = f"{value:.3f}" if row["status"] == "done" and value is not None else (row["error"] or "-")[:20]
+        samples = f"{row['samples_per_sec']:.0f}" if row["samples_per_sec"] is not None else "-"
+        print(f"{rank:>4} {shown:>20} {samples:>10}  {format_params(row['params'])}")
+    print(f"\nResults of all sweeps are stored in: {DATABASE}")
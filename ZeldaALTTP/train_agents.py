@@ -1,31 +1,40 @@
+import time
+LAUNCH_TIME = time.time()  # taken before the heavy imports, for the startup report
 from ZeldaALTTP.utils.settings import load_config
 from ZeldaALTTP.utils.callbacks.movement_callback import MovementTrackingCallback
 from ZeldaALTTP.utils.callbacks.statistic_callback import StatisticLoggingCallback
 from ZeldaALTTP.utils.callbacks.video_callback import VideoRecordingCallback
-from ZeldaALTTP.utils.device_utils import setup_device
-from ZeldaALTTP.stream_wrapper import StreamWrapper
+from ZeldaALTTP.utils.callbacks.memory_callback import MemoryReportCallback
+from ZeldaALTTP.utils.callbacks.profiling_callback import ProfilingCallback
+from ZeldaALTTP.utils.callbacks.sampling_callback import SamplingProfilerCallback
+from ZeldaALTTP.utils.callbacks.watchdog_callback import WatchdogCallback
+from ZeldaALTTP.utils.callbacks.startup_callback import StartupTimerCallback
+from ZeldaALTTP.utils.callbacks.trajectory_callback import TrajectoryCallback
+from ZeldaALTTP.utils.callbacks.action_log_callback import ActionLogCallback
+from ZeldaALTTP.utils.callbacks.highlight_callback import HighlightCallback
+from ZeldaALTTP.utils.highlights import HIGHLIGHT_EVENTS
+from ZeldaALTTP.utils.profiled_vec_env import ProfiledVecEnv
+from ZeldaALTTP.utils.supervised_vec_env import SupervisedSubprocVecEnv
+from ZeldaALTTP.utils.rollout_buffer import compact_rollout_buffer_class
+from ZeldaALTTP.utils.async_ppo import AsyncPPO
+from ZeldaALTTP.utils.checkpointing import BackgroundCheckpointer, BackgroundCheckpointCallback
+from ZeldaALTTP.utils.resume import ResumeBundleCallback, load_resume_bundle, apply_resume_bundle, bundle_model_file, mark_completed
+from ZeldaALTTP.utils.rollout_inference import InferencePPO
+from ZeldaALTTP.utils.device_utils import setup_device, plan_cpu_layout, format_cpu_layout
+from ZeldaALTTP.utils.env_factory import make_env, default_ppo_kwargs, POLICY_TYPES, WORKER_MODULES
 from ZeldaALTTP.utils import session_manager
+from pygba.preload import enable_forkserver_preload
 
 from stable_baselines3 import PPO
 from stable_baselines3.common.callbacks import BaseCallback, CheckpointCallback, CallbackList
 from stable_baselines3.common.vec_env import SubprocVecEnv
 from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
-from pygba.pygba import PyGBA
-from pygba.gym_env import PyGBAEnv
-from pygba.game_wrappers.zelda_alttp import ZeldaALTTP
 import pygame
 import mgba.log
 from pathlib import Path
 
 mgba.log.silence()
 
-def load_state_to_gba(gba, state_path):
-    from mgba._pylib import ffi
-    save_data = Path(state_path).read_bytes()
-    state = ffi.new("uint8_t[]", save_data)
-    gba.core.load_raw_state(state)
-
-
 class VisualizeCallback(BaseCallback):
     def __init__(self, verbose=0):
         super().__init__(verbose)
@@ -36,11 +45,19 @@ class VisualizeCallback(BaseCallback):
         pygame.event.pump()
         return True
 
+def save_model(model, path, checkpointer=None):
+    """Save synchronously, or through the background checkpointer and wait until the file is written."""
+    if checkpointer is None:
+        model.save(path)
+    else:
+        checkpointer.save(model, path)
+        checkpointer.wait()
+
 def run_agent():
     print("\nStarting agent mode...")
 
     # Set device and utilization for PyTorch using utility
-    DEVICE = setup_device(model_config)
+    DEVICE = setup_device(model_config, CPU_LAYOUT)
 
     # Determine override_model argument
     override_model = int(OVERRIDE_MODEL_PATH) if (OVERRIDE_MODEL_PATH and str(OVERRIDE_MODEL_PATH).isdigit()) else None
@@ -51,10 +68,16 @@ def run_agent():
         session_dir = session_info["session_dir"]
         model_path = session_info["model_path"]
         print(f"Continuing from previous model: {model_path}")
+        # A resume bundle also restores optimizer, env states, wrapper tables, RNGs and callback counters
+        resume_bundle = None
+        if RESUME_FULL_STATE and session_info["resume_path"] is not None:
+            resume_bundle = load_resume_bundle(session_info["resume_path"])
+            print(f"Resuming full session state from: {session_info['resume_path']} ({resume_bundle['num_timesteps']} steps)")
     else:
         session_info = session_manager.create_new_model_and_session(BASE_SESSIONS_DIR, model_config, general_config, DEVICE)
         session_dir = session_info["session_dir"]
         model_path = None
+        resume_bundle = None
         print(f"Created new model/session: {session_dir}")
     print(f"\nSession Information:")
     print(f"├── Directory: {session_dir}")
@@ -64,17 +87,30 @@ def run_agent():
     # Setup callbacks
     callbacks = []
     
+    # Snapshot the model (and resume bundles) in memory and serialize them in a background thread, so envs don't wait on saves
+    checkpointer = None
+    if (CHECKPOINTING or RESUME_BUNDLE_FREQ > 0) and BACKGROUND_CHECKPOINTING:
+        checkpointer = BackgroundCheckpointer(max_pending=CHECKPOINT_QUEUE_SIZE, stats_path=session_dir / "checkpoint_stats.csv")
+
     # Add checkpoint callback if enabled in config
     if CHECKPOINTING:
         # Calculate total timesteps
         total_timesteps = EPISODE_LENGTH * EPISODE_COUNT 
         save_freq = total_timesteps // CHECKPOINT_SAVE_FREQ
         
-        checkpoint_callback = CheckpointCallback(
-            save_freq=save_freq,
-            save_path=session_dir / "models",
-            name_prefix="zelda_model"
-        )
+        if checkpointer is not None:
+            checkpoint_callback = BackgroundCheckpointCallback(
+                checkpointer,
+                save_freq=save_freq,
+                save_path=session_dir / "models",
+                name_prefix="zelda_model"
+            )
+        else:
+            checkpoint_callback = CheckpointCallback(
+                save_freq=save_freq,
+                save_path=session_dir / "models",
+                name_prefix="zelda_model"
+            )
         callbacks.append(checkpoint_callback)
         print(f"Checkpointing enabled - saving {CHECKPOINT_SAVE_FREQ} checkpoints during training (every {save_freq * NUM_ENVS} steps)")
     
@@ -82,8 +118,8 @@ def run_agent():
     if RENDER_MODE == "human":
         callbacks.extend([VisualizeCallback()])
 
-    # Add video recording callback if enabled
-    if SAVE_VIDEO and RENDER_MODE == "rgb_array":
+    # Add video recording callback if enabled (highlight clips replace it)
+    if SAVE_VIDEO and RENDER_MODE == "rgb_array" and not HIGHLIGHT_CLIPS:
         video_callback = VideoRecordingCallback(session_dir / "videos", record_freq=1, max_videos=10)
         callbacks.append(video_callback)
     
@@ -95,25 +131,98 @@ def run_agent():
     statistical_callback = StatisticLoggingCallback(session_dir)
     callbacks.append(statistical_callback)
 
-    
-    
+    # Report learner memory (peak RSS) so rollout sizes can be compared
+    callbacks.append(MemoryReportCallback())
+
+    # Per-phase timing breakdown per rollout (session_dir/profiles) if enabled
+    if PROFILE:
+        callbacks.append(ProfilingCallback(session_dir))
+
+    # Stack sampling of chosen env workers, at start and/or whenever session_dir/profiles/sample.trigger appears
+    if SAMPLING_PROFILER:
+        callbacks.append(SamplingProfilerCallback(
+            session_dir,
+            ranks=SAMPLING_RANKS,
+            window_s=SAMPLING_WINDOW_S,
+            interval_ms=SAMPLING_INTERVAL_MS,
+            sample_on_start=SAMPLING_ON_START
+        ))
+
+    # Start state, keys and frames of every episode, enough to re-simulate it (session_dir/action_logs)
+    if ACTION_LOG:
+        callbacks.append(ActionLogCallback(session_dir))
+
+    # Videos of the steps around area discoveries, the sword, deaths and small keys, rendered from the action logs
+    # in the background (session_dir/highlights)
+    if HIGHLIGHT_CLIPS:
+        if ACTION_LOG:
+            callbacks.append(HighlightCallback(
+                session_dir,
+                paths_config["gb_path"],
+                events=HIGHLIGHT_EVENT_TYPES,
+                before_steps=HIGHLIGHT_BEFORE_STEPS,
+                after_steps=HIGHLIGHT_AFTER_STEPS,
+                max_clips=HIGHLIGHT_MAX_CLIPS,
+                workers=HIGHLIGHT_WORKERS,
+                start_method=WORKER_START_METHOD
+            ))
+        else:
+            print("highlight_clips needs action_log enabled, no highlight clips will be rendered")
+
+    # Actions, rewards, dones, RAM features (and frames) of every worker (session_dir/trajectories)
+    if RECORD_TRAJECTORIES:
+        callbacks.append(TrajectoryCallback(session_dir))
+
+    # Time from launch to the first rollout step (session_dir/startup.json)
+    callbacks.append(StartupTimerCallback(session_dir, LAUNCH_TIME, ENV_READY_TIME, start_method=WORKER_START_METHOD))
+
+    # Worker restarts of the supervised VecEnv (session_dir/worker_restarts.csv, watchdog/* in the logs)
+    if WORKER_WATCHDOG:
+        callbacks.append(WatchdogCallback(session_dir))
+
+    # Periodically bundle the full training state so a crashed or preempted run can continue where it stopped
+    if RESUME_BUNDLE_FREQ > 0:
+        callbacks.append(ResumeBundleCallback(session_dir, callbacks=list(callbacks), save_freq=RESUME_BUNDLE_FREQ, checkpointer=checkpointer))
+
     # Create callback list
     callback_list = CallbackList(callbacks)
     
     
+    # Keep uint8 observations in the rollout buffer if enabled (SB3 picks its default buffer otherwise)
+    rollout_buffer_class = compact_rollout_buffer_class(env.observation_space) if COMPACT_ROLLOUT else None
+
+    # Async mode keeps the env workers stepping while the learner updates
+    # A non-eager inference backend collects rollouts with an exported CPU copy of the policy
+    if ASYNC_TRAINING:
+        algorithm = AsyncPPO
+        algorithm_kwargs = dict(queue_size=ASYNC_QUEUE_SIZE, inference_backend=INFERENCE_BACKEND)
+    elif INFERENCE_BACKEND != "eager":
+        algorithm = InferencePPO
+        algorithm_kwargs = dict(inference_backend=INFERENCE_BACKEND)
+    else:
+        algorithm = PPO
+        algorithm_kwargs = {}
+    print(f"Training mode: {'asynchronous actor-learner' if ASYNC_TRAINING else 'synchronous'} ({algorithm.__name__}, "
+          f"rollout inference: {INFERENCE_BACKEND})")
+
     # Create or load model
-    if (USE_PREV_MODEL or (OVERRIDE_MODEL_PATH and Path(OVERRIDE_MODEL_PATH).exists())) and model_path:
-        print(f"Loading model from: {model_path}")
-        model = PPO.load(
-            model_path,
+    if (USE_PREV_MODEL or (OVERRIDE_MODEL_PATH and Path(OVERRIDE_MODEL_PATH).exists())) and (model_path or resume_bundle):
+        print(f"Loading model from: {session_info['resume_path'] if resume_bundle else model_path}")
+        # load() rebuilds the rollout buffer from these overrides (n_envs is taken from env)
+        load_kwargs = dict(n_steps=UPDATE_FREQ, **algorithm_kwargs)
+        if rollout_buffer_class is not None:
+            load_kwargs["rollout_buffer_class"] = rollout_buffer_class
+        model = algorithm.load(
+            bundle_model_file(resume_bundle) if resume_bundle else model_path,
             env=env,
-            device=DEVICE
+            device=DEVICE,
+            **load_kwargs
         )
-        model.n_steps = UPDATE_FREQ
-        model.n_envs = NUM_ENVS
-        model.rollout_buffer.buffer_size = UPDATE_FREQ
-        model.rollout_buffer.n_envs = NUM_ENVS
-        model.rollout_buffer.reset()
+        if resume_bundle:
+            # env states are restored on the first reset in learn(); RNGs continue instead of being reseeded
+            apply_resume_bundle(resume_bundle, model, callbacks)
+        elif SEED is not None:
+            model.set_random_seed(SEED)
     else:
         print("\nCreating PPO model...")
         policy_kwargs = dict(
@@ -122,16 +231,15 @@ def run_agent():
             optimizer_kwargs=dict(weight_decay=1e-4) 
         )
 
-        model = PPO(
-            "CnnPolicy",
+        model = algorithm(
+            POLICY_TYPES[OBSERVATION_MODE],
             env,
             verbose=1,
-            n_steps=UPDATE_FREQ,
-            batch_size=BATCH_SIZE,
-            n_epochs=1,
-            gamma=0.997,
-            ent_coef=ENT_COEF,
+            **default_ppo_kwargs(model_config),
             device=DEVICE,
+            seed=SEED,
+            rollout_buffer_class=rollout_buffer_class,
+            **algorithm_kwargs,
             # policy_kwargs=policy_kwargs
         )
     
@@ -142,47 +250,38 @@ def run_agent():
     TOTAL_TIMESTEPS = EPISODE_LENGTH * EPISODE_COUNT * NUM_ENVS
     print(f"\nStarting training for {EPISODE_COUNT} episodes per environment (total {TOTAL_TIMESTEPS} timesteps across {NUM_ENVS} environments)...")
     
+    if resume_bundle:
+        print(f"Continuing at step {model.num_timesteps} ({max(TOTAL_TIMESTEPS - model.num_timesteps, 0)} timesteps left)")
+
     try:
         model.learn(
-            total_timesteps=TOTAL_TIMESTEPS,
+            total_timesteps=max(TOTAL_TIMESTEPS - model.num_timesteps, 0) if resume_bundle else TOTAL_TIMESTEPS,
             callback=callback_list,
+            reset_num_timesteps=not resume_bundle,
         )
         
         # Save final model if checkpointing is enabled
         if CHECKPOINTING:
             final_model_path = session_dir / "models" / "final_model.zip"
-            model.save(final_model_path)
+            save_model(model, final_model_path, checkpointer)
             print(f"\nFinal model saved to: {final_model_path}")
+        # the run is done: its last resume bundle is one rollout short of the end and must not be resumed
+        if checkpointer is not None:
+            checkpointer.wait()
+        mark_completed(session_dir)
         
     except KeyboardInterrupt:
         print("\nTraining interrupted!")
         if CHECKPOINTING:
             print("Saving checkpoint...")
             interrupt_path = session_dir / "models" / "interrupted_model.zip"
-            model.save(interrupt_path)
+            save_model(model, interrupt_path, checkpointer)
             print(f"Interrupted model saved to: {interrupt_path}")
         raise
+    finally:
+        if checkpointer is not None:
+            checkpointer.close()
     
-def make_env(rank):
-    def _init():
-        gba = PyGBA.load(ROM_PATH)
-        load_state_to_gba(gba, STATE_PATH)
-        zelda_wrapper = ZeldaALTTP()
-        env = PyGBAEnv(
-            gba,
-            game_wrapper=zelda_wrapper,
-            frameskip=FRAMESKIP,
-            render_mode=RENDER_MODE,
-            max_episode_steps=EPISODE_LENGTH,
-            reset_to_initial_state=True
-        )
-        env.rank = rank  # Attach rank to environment
-        # Conditionally wrap with streaming wrapper
-        if ENABLE_STREAM_WRAPPER:
-            env = StreamWrapper(env, ws_address="ws://localhost:8765", stream_metadata={"env_rank": rank})
-        return env
-    return _init
-
 if __name__ == "__main__":
     print("\nStarting training...")
     config = load_config()
@@ -192,30 +291,81 @@ if __name__ == "__main__":
     model_config = config["TrainModel"]
     general_config = config["General"]
     # path variables
-    ROM_PATH = paths_config["gb_path"]
-    STATE_PATH = paths_config["init_state"]  
     SESSION_PATH = paths_config["session_path"]    
     # model variables
-    FRAMESKIP = model_config["action_freq"]
     EPISODE_LENGTH = model_config["episode_length"]
     RENDER_MODE = "rgb_array" if model_config["headless"] else "human"
     EPISODE_COUNT = model_config["episode_count"]
-    BATCH_SIZE = model_config["batch_size"]
-    ENT_COEF = model_config["ent_coef"]
     NUM_ENVS = model_config["num_envs"]
     CHECKPOINTING = model_config["checkpointing"]
     CHECKPOINT_SAVE_FREQ = model_config["checkpoint_save_freq"]
+    BACKGROUND_CHECKPOINTING = model_config.get("background_checkpointing", True)
+    CHECKPOINT_QUEUE_SIZE = model_config.get("checkpoint_queue_size", 1)
+    RESUME_BUNDLE_FREQ = model_config.get("resume_bundle_freq", -1)
+    RESUME_FULL_STATE = model_config.get("resume_full_state", True)
     UPDATE_FREQ = model_config["update_freq"]
+    if RESUME_BUNDLE_FREQ < 0:
+        # one resume bundle per model checkpoint: every bundle pauses training for a full model + env snapshot
+        RESUME_BUNDLE_FREQ = max(1, EPISODE_LENGTH * EPISODE_COUNT // CHECKPOINT_SAVE_FREQ // UPDATE_FREQ)
     USE_PREV_MODEL = model_config["use_prev_model"]
+    SEED = model_config.get("seed", -1)
+    SEED = SEED if SEED >= 0 else None
+    OBSERVATION_MODE = model_config.get("observation_mode", "screen")
+    COMPACT_ROLLOUT = model_config.get("compact_rollout", True)
+    ASYNC_TRAINING = model_config.get("async_training", False)
+    ASYNC_QUEUE_SIZE = model_config.get("async_queue_size", 1)
+    INFERENCE_BACKEND = model_config.get("inference_backend", "eager")
+    PROFILE = model_config.get("profile", False)
+    SAMPLING_PROFILER = model_config.get("sampling_profiler", False)
+    SAMPLING_RANKS = model_config.get("sampling_ranks", [0])
+    SAMPLING_WINDOW_S = model_config.get("sampling_window_s", 10.0)
+    SAMPLING_INTERVAL_MS = model_config.get("sampling_interval_ms", 5.0)
+    SAMPLING_ON_START = model_config.get("sampling_on_start", False)
+    WORKER_WATCHDOG = model_config.get("worker_watchdog", True)
+    WORKER_STEP_TIMEOUT_S = model_config.get("worker_step_timeout_s", 60.0)
+    WORKER_RESET_TIMEOUT_S = model_config.get("worker_reset_timeout_s", 300.0)
+    WORKER_MAX_RESTARTS = model_config.get("worker_max_restarts", 10)
+    WORKER_START_METHOD = model_config.get("worker_start_method", "forkserver")
+    PRELOAD_ROM = model_config.get("preload_rom", True)
+    RECORD_TRAJECTORIES = model_config.get("record_trajectories", False)
+    ACTION_LOG = model_config.get("action_log", True)
+    HIGHLIGHT_CLIPS = model_config.get("highlight_clips", False)
+    HIGHLIGHT_EVENT_TYPES = model_config.get("highlight_events", HIGHLIGHT_EVENTS)
+    HIGHLIGHT_BEFORE_STEPS = model_config.get("highlight_before_steps", 50)
+    HIGHLIGHT_AFTER_STEPS = model_config.get("highlight_after_steps", 25)
+    HIGHLIGHT_MAX_CLIPS = model_config.get("highlight_max_clips", 100)
+    HIGHLIGHT_WORKERS = model_config.get("highlight_workers", 1)
     # general variables
-    ENABLE_STREAM_WRAPPER = general_config["enable_stream_wrapper"]
     SAVE_VIDEO = general_config["save_video"]
     OVERRIDE_MODEL_PATH = paths_config["override_model_path"]
     # Create base sessions directory
     BASE_SESSIONS_DIR = Path(SESSION_PATH)
     BASE_SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
 
-    env = SubprocVecEnv([
-        make_env(i) for i in range(NUM_ENVS)
-    ])
+    # Split cores between the env workers and torch before any worker starts
+    CPU_LAYOUT = plan_cpu_layout(NUM_ENVS, model_config)
+    print(format_cpu_layout(CPU_LAYOUT))
+
+    # With preload_rom the fork server imports torch, SB3 and the env modules and reads ROM and init state once;
+    # workers are forked from it copy-on-write instead of each importing and reading everything again
+    if WORKER_START_METHOD == "forkserver" and PRELOAD_ROM:
+        enable_forkserver_preload([paths_config["gb_path"], paths_config["init_state"]], WORKER_MODULES)
+
+    env_fns = [
+        make_env(i, paths_config, model_config, general_config, CPU_LAYOUT, action_log=ACTION_LOG) for i in range(NUM_ENVS)
+    ]
+    if WORKER_WATCHDOG:
+        # hung or crashed workers are respawned instead of blocking or killing the run
+        env = SupervisedSubprocVecEnv(
+            env_fns,
+            start_method=WORKER_START_METHOD,
+            step_timeout=WORKER_STEP_TIMEOUT_S,
+            reset_timeout=WORKER_RESET_TIMEOUT_S,
+            max_restarts=WORKER_MAX_RESTARTS
+        )
+    else:
+        env = SubprocVecEnv(env_fns, start_method=WORKER_START_METHOD)
+    ENV_READY_TIME = time.time()
+    if PROFILE:
+        env = ProfiledVecEnv(env)
     run_agent()
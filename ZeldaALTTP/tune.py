@@ -0,0 +1,200 @@
+from ZeldaALTTP.utils.settings import load_config
+from ZeldaALTTP.utils.callbacks.memory_callback import total_rss_mb
+from ZeldaALTTP.utils.rollout_buffer import compact_rollout_buffer_class
+from ZeldaALTTP.utils.rollout_inference import InferencePPO
+from ZeldaALTTP.utils.device_utils import setup_device, plan_cpu_layout, format_cpu_layout, available_cpus, pin_to_cpus
+from ZeldaALTTP.utils.env_factory import make_env, default_ppo_kwargs, POLICY_TYPES
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from datetime import datetime
+from pathlib import Path
+import itertools
+import time
+import csv
+import numpy as np
+
+# Throughput autotuner: short timed trials over a grid of [TrainModel] settings (see [Tune] in config.toml).
+# Every trial starts fresh env workers, measures raw env stepping, then a few PPO rollouts + updates,
+# and the best configuration is written out as a suggested [TrainModel] block.
+
+RESULT_FIELDS = [
+    "num_envs", "action_freq", "update_freq", "batch_size",
+    "env_steps_per_sec", "rollout_steps_per_sec", "learner_samples_per_sec",
+    "samples_per_sec", "frames_per_sec", "rss_mb", "error",
+]
+
+
+class TrialTimer(BaseCallback):
+    """Records the wall time of every rollout collection and every update that follows it."""
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self.collect_times = []
+        self.update_times = []
+        self.rollout_start = None
+        self.rollout_end = None
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self.rollout_end is not None:
+            self.update_times.append(now - self.rollout_end)
+        self.rollout_start = now
+
+    def _on_rollout_end(self):
+        self.rollout_end = time.perf_counter()
+        self.collect_times.append(self.rollout_end - self.rollout_start)
+
+    def _on_training_end(self):
+        if self.rollout_end is not None and len(self.update_times) < len(self.collect_times):
+            self.update_times.append(time.perf_counter() - self.rollout_end)
+
+    def _on_step(self):
+        return True
+
+
+def steady_mean(times):
+    """Mean time without the first (warm-up) measurement when there is more than one."""
+    return float(np.mean(times[1:] if len(times) > 1 else times))
+
+
+def measure_env_steps(env, n_steps):
+    """Batched env steps per second with random actions (no policy in the loop)."""
+    env.reset()
+    actions = np.array([env.action_space.sample() for _ in range(env.num_envs)])
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        env.step(actions)
+    return n_steps * env.num_envs / (time.perf_counter() - start)
+
+
+def run_trial(num_envs, action_freq, update_freq, batch_size):
+    result = dict(num_envs=num_envs, action_freq=action_freq, update_freq=update_freq, batch_size=batch_size)
+    trial_config = dict(model_config, num_envs=num_envs, action_freq=action_freq, update_freq=update_freq,
+                        batch_size=batch_size, headless=True)
+    # setup_device pins this process to the trial's torch CPUs; later trials have to plan from all of them again
+    process_cpus = available_cpus()
+    cpu_layout = plan_cpu_layout(num_envs, trial_config)
+    general = dict(general_config, enable_stream_wrapper=False)
+    env = SubprocVecEnv([make_env(i, paths_config, trial_config, general, cpu_layout) for i in range(num_envs)])
+    try:
+        device = setup_device(trial_config, cpu_layout)
+        result["env_steps_per_sec"] = measure_env_steps(env, ENV_STEPS)
+
+        algorithm = InferencePPO if INFERENCE_BACKEND != "eager" else PPO
+        algorithm_kwargs = dict(inference_backend=INFERENCE_BACKEND) if INFERENCE_BACKEND != "eager" else {}
+        model = algorithm(
+            POLICY_TYPES[trial_config.get("observation_mode", "screen")],
+            env,
+            verbose=0,
+            **default_ppo_kwargs(trial_config),
+            device=device,
+            rollout_buffer_class=compact_rollout_buffer_class(env.observation_space) if COMPACT_ROLLOUT else None,
+            **algorithm_kwargs,
+        )
+        timer = TrialTimer()
+        model.learn(total_timesteps=ROLLOUTS * update_freq * num_envs, callback=timer)
+
+        samples = update_freq * num_envs
+        collect_time, update_time = steady_mean(timer.collect_times), steady_mean(timer.update_times)
+        result["rollout_steps_per_sec"] = samples / collect_time
+        result["learner_samples_per_sec"] = samples / update_time
+        result["samples_per_sec"] = samples / (collect_time + update_time)
+        # a step emulates frameskip + 1 frames
+        result["frames_per_sec"] = result["samples_per_sec"] * (action_freq + 1)
+        result["rss_mb"] = total_rss_mb()
+        del model
+    except Exception as e:
+        print(f"Trial failed: {e}")
+        result["error"] = str(e)
+    finally:
+        env.close()
+        pin_to_cpus(process_cpus)
+    return result
+
+
+def pick_best(results):
+    """Best valid trial for the configured objective, within the memory budget (None if no trial qualifies)."""
+    key = "frames_per_sec" if OBJECTIVE == "frames" else "samples_per_sec"
+    valid = [
+        r for r in results
+        if not r.get("error") and r.get(key) is not None
+        and (not MAX_MEMORY_MB or r.get("rss_mb") is None or r["rss_mb"] <= MAX_MEMORY_MB)
+    ]
+    return max(valid, key=lambda r: r[key]) if valid else None
+
+
+def format_suggestion(best):
+    layout = plan_cpu_layout(best["num_envs"], model_config)
+    rss = f"{best['rss_mb']:.0f} MB" if best.get("rss_mb") is not None else "n/a"
+    return "\n".join([
+        f"# Suggested by tune.py on {datetime.now():%Y-%m-%d %H:%M} (objective: {OBJECTIVE})",
+        f"# {best['samples_per_sec']:.0f} samples/s end to end, {best['frames_per_sec']:.0f} emulator frames/s, "
+        f"env {best['env_steps_per_sec']:.0f} steps/s, learner {best['learner_samples_per_sec']:.0f} samples/s, RSS {rss}",
+        "[TrainModel]",
+        f"num_envs = {best['num_envs']}",
+        f"action_freq = {best['action_freq']}",
+        f"update_freq = {best['update_freq']}",
+        f"batch_size = {best['batch_size']}",
+        f"torch_threads = {layout['intra_op_threads']}",
+        "",
+    ])
+
+
+if __name__ == "__main__":
+    print("\nStarting throughput tuning...")
+    config = load_config()
+    print()
+    # ====== GLOBAL CONFIG AND VARS ======
+    paths_config = config["Paths"]
+    model_config = config["TrainModel"]
+    general_config = config["General"]
+    tune_config = config["Tune"]
+    COMPACT_ROLLOUT = model_config.get("compact_rollout", True)
+    INFERENCE_BACKEND = model_config.get("inference_backend", "eager")
+    # grid and trial variables
+    NUM_ENVS_GRID = tune_config["num_envs"]
+    ACTION_FREQ_GRID = tune_config["action_freq"]
+    UPDATE_FREQ_GRID = tune_config["update_freq"]
+    BATCH_SIZE_GRID = tune_config["batch_size"]
+    ENV_STEPS = tune_config["env_steps"]
+    ROLLOUTS = tune_config["rollouts"]
+    MAX_MEMORY_MB = tune_config["max_memory_mb"]
+    OBJECTIVE = tune_config["objective"]
+    OUTPUT_DIR = Path(tune_config["output_path"])
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    grid = [
+        (num_envs, action_freq, update_freq, batch_size)
+        for num_envs, action_freq, update_freq, batch_size
+        in itertools.product(NUM_ENVS_GRID, ACTION_FREQ_GRID, UPDATE_FREQ_GRID, BATCH_SIZE_GRID)
+        # a minibatch can't be larger than the rollout
+        if batch_size <= num_envs * update_freq
+    ]
+    print(f"Running {len(grid)} trials ({ROLLOUTS} rollouts each)")
+
+    results_path = OUTPUT_DIR / f"tune_{datetime.now():%Y%m%d_%H%M%S}.csv"
+    results = []
+    with open(results_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        for i, params in enumerate(grid):
+            print(f"\n[{i + 1}/{len(grid)}] num_envs={params[0]} action_freq={params[1]} update_freq={params[2]} batch_size={params[3]}")
+            print(format_cpu_layout(plan_cpu_layout(params[0], model_config)))
+            result = run_trial(*params)
+            results.append(result)
+            writer.writerow(result)
+            f.flush()
+            if not result.get("error"):
+                print(f"env {result['env_steps_per_sec']:.0f} steps/s | rollout {result['rollout_steps_per_sec']:.0f} steps/s | "
+                      f"learner {result['learner_samples_per_sec']:.0f} samples/s | end to end {result['samples_per_sec']:.0f} samples/s")
+    print(f"\nTrial results saved to: {results_path}")
+
+    best = pick_best(results)
+    if best is None:
+        print("No trial finished within the memory budget; nothing to suggest.")
+    else:
+        suggestion = format_suggestion(best)
+        suggestion_path = OUTPUT_DIR / "suggested_config.toml"
+        suggestion_path.write_text(suggestion)
+        print(f"\n{suggestion}\nSuggested [TrainModel] block saved to: {suggestion_path}")
@@ -0,0 +1,333 @@
+from stable_baselines3 import PPO
+from stable_baselines3.common.utils import obs_as_tensor
+from ZeldaALTTP.utils.rollout_inference import RolloutInference
+from gymnasium import spaces
+import numpy as np
+import torch as th
+import threading
+import queue
+import copy
+
+
+class AsyncPPO(PPO):
+    """
+    PPO with an asynchronous actor-learner split (IMPALA style).
+    - An actor thread keeps stepping the VecEnv with a copy of the policy and fills rollout buffers.
+    - The learner (calling thread) consumes finished rollouts from a bounded queue and runs the PPO update,
+      so emulator workers keep producing experience during gradient steps.
+    - Rollouts are collected by a slightly stale policy; before each update the returns and advantages are
+      recomputed with V-trace (truncated importance weights rho_bar / c_bar) under the current policy.
+    - queue_size bounds how many finished rollouts may wait for the learner, which also bounds policy lag
+      (queue_size + 1 rollout buffers are allocated).
+    - inference_backend other than "eager" makes the actor act through a RolloutInference copy of the policy.
+    Callback hooks run on the actor thread, in the same order as in PPO.collect_rollouts, holding _log_lock so
+      their logger.record calls don't race the learner's dump_logs.
+    Model snapshots requested from the actor thread (between_updates) are taken by the learner before its next
+      update, so the actor never waits for a gradient update to finish.
+    """
+    def __init__(self, *args, queue_size=1, vtrace_rho_bar=1.0, vtrace_c_bar=1.0, inference_backend="eager", **kwargs):
+        self.queue_size = queue_size
+        self.vtrace_rho_bar = vtrace_rho_bar
+        self.vtrace_c_bar = vtrace_c_bar
+        self.inference_backend = inference_backend
+        self._init_async_state()
+        super().__init__(*args, **kwargs)
+
+    def _init_async_state(self):
+        self.actor_policy = None
+        self.rollout_inference = None
+        self._weights_lock = threading.Lock()  # actor forward vs. weight sync
+        self._log_lock = threading.RLock()  # episode info buffer / logger between actor and learner
+        self._train_lock = threading.RLock()  # held by the learner while updating, taken by save()
+        self._snapshot_requests = queue.Queue()  # between_updates calls from the actor, run by the learner
+        self._policy_version = 0
+        self._actor_thread = None
+        self._actor_error = None
+        self._stop_event = threading.Event()
+        self._free_buffers = None
+        self._rollout_queue = None
+
+    def _excluded_save_params(self):
+        return super()._excluded_save_params() + [
+            "actor_policy", "rollout_inference", "_weights_lock", "_log_lock", "_train_lock", "_actor_thread", "_actor_error",
+            "_stop_event", "_free_buffers", "_rollout_queue", "_snapshot_requests",
+        ]
+
+    def _setup_model(self):
+        super()._setup_model()
+        assert not self.use_sde, "AsyncPPO does not support gSDE"
+        self.actor_policy = copy.deepcopy(self.policy)
+        self.actor_policy.set_training_mode(False)
+        if self.inference_backend != "eager":
+            self.rollout_inference = RolloutInference(self.policy, self.inference_backend)
+
+    def save(self, *args, **kwargs):
+        # don't serialize parameters halfway through an update (callbacks may save from the actor thread)
+        with self._train_lock:
+            return super().save(*args, **kwargs)
+
+    def between_updates(self, fn):
+        """
+        Call fn() while the model is between two updates. From the actor thread it is queued and the learner runs it
+        before its next update (or after the last one); from any other thread it runs right away.
+        """
+        if threading.current_thread() is self._actor_thread:
+            self._snapshot_requests.put(fn)
+        else:
+            fn()
+
+    def _serve_snapshot_requests(self):
+        while True:
+            try:
+                fn = self._snapshot_requests.get_nowait()
+            except queue.Empty:
+                return
+            fn()
+
+    def learn(
+        self,
+        total_timesteps,
+        callback=None,
+        log_interval=1,
+        tb_log_name="AsyncPPO",
+        reset_num_timesteps=True,
+        progress_bar=False,
+    ):
+        iteration = 0
+
+        total_timesteps, callback = self._setup_learn(
+            total_timesteps,
+            callback,
+            reset_num_timesteps,
+            tb_log_name,
+            progress_bar,
+        )
+
+        callback.on_training_start(locals(), globals())
+
+        assert self.env is not None
+
+        self._start_actor(callback, total_timesteps)
+        try:
+            while True:
+                rollout_buffer = self._rollout_queue.get()
+                if rollout_buffer is None:
+                    break
+
+                iteration += 1
+                # snapshots the actor asked for while collecting this rollout
+                self._serve_snapshot_requests()
+                self._update_current_progress_remaining(self.num_timesteps, total_timesteps)
+
+                # Display training infos
+                if log_interval is not None and iteration % log_interval == 0:
+                    with self._log_lock:
+                        self.logger.record("async/policy_lag", self._policy_version - rollout_buffer.policy_version)
+                        self.logger.record("async/queued_rollouts", self._rollout_queue.qsize())
+                        if self.rollout_inference is not None:
+                            self.rollout_inference.record(self.logger)
+                        self.dump_logs(iteration)
+
+                with self._train_lock:
+                    self._vtrace_correct(rollout_buffer)
+                    self.rollout_buffer = rollout_buffer
+                    self.train()
+                self._sync_actor()
+                self._free_buffers.put(rollout_buffer)
+        finally:
+            self._stop_actor()
+        self._serve_snapshot_requests()
+
+        if self._actor_error is not None:
+            raise self._actor_error
+
+        callback.on_training_end()
+
+        return self
+
+    def _start_actor(self, callback, total_timesteps):
+        self._sync_actor()
+        self._stop_event.clear()
+        self._actor_error = None
+        self._rollout_queue = queue.Queue()
+        self._free_buffers = queue.Queue()
+        self._free_buffers.put(self.rollout_buffer)
+        for _ in range(self.queue_size):
+            self._free_buffers.put(self.rollout_buffer_class(
+                self.n_steps,
+                self.observation_space,
+                self.action_space,
+                device=self.device,
+                gamma=self.gamma,
+                gae_lambda=self.gae_lambda,
+                n_envs=self.n_envs,
+                **self.rollout_buffer_kwargs,
+            ))
+        self._actor_thread = threading.Thread(
+            target=self._actor_loop, args=(callback, total_timesteps), name="AsyncPPO-actor", daemon=True
+        )
+        self._actor_thread.start()
+
+    def _stop_actor(self):
+        self._stop_event.set()
+        if self._actor_thread is not None:
+            self._actor_thread.join(timeout=60)
+            self._actor_thread = None
+
+    def _sync_actor(self):
+        with self._weights_lock:
+            self.actor_policy.load_state_dict(self.policy.state_dict())
+            if self.rollout_inference is not None:
+                self.rollout_inference.sync(self.policy)
+            self._policy_version += 1
+
+    def _next_free_buffer(self):
+        # the pool of free buffers is what bounds the queue: block until the learner hands one back
+        while not self._stop_event.is_set():
+            try:
+                return self._free_buffers.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _actor_loop(self, callback, total_timesteps):
+        try:
+            while not self._stop_event.is_set() and self.num_timesteps < total_timesteps:
+                rollout_buffer = self._next_free_buffer()
+                if rollout_buffer is None:
+                    break
+                if not self._collect_rollout(callback, rollout_buffer):
+                    break
+                self._rollout_queue.put(rollout_buffer)
+        except BaseException as e:
+            self._actor_error = e
+        finally:
+            # tell the learner that no more rollouts are coming
+            self._rollout_queue.put(None)
+
+    def _policy_step(self, obs):
+        with th.no_grad(), self._weights_lock:
+            if self.rollout_inference is not None:
+                return self.rollout_inference(obs_as_tensor(obs, self.device))
+            return self.actor_policy(obs_as_tensor(obs, self.device))
+
+    def _collect_rollout(self, callback, rollout_buffer):
+        """Same as PPO.collect_rollouts, but acting with actor_policy and leaving returns to the learner."""
+        assert self._last_obs is not None, "No previous observation was provided"
+        env = self.env
+
+        n_steps = 0
+        rollout_buffer.reset()
+        rollout_buffer.policy_version = self._policy_version
+
+        with self._log_lock:
+            callback.on_rollout_start()
+
+        while n_steps < self.n_steps:
+            actions, values, log_probs = self._policy_step(self._last_obs)
+            actions = actions.cpu().numpy()
+
+            # Rescale and perform action
+            clipped_actions = actions
+            if isinstance(self.action_space, spaces.Box):
+                clipped_actions = np.clip(actions, self.action_space.low, self.action_space.high)
+
+            new_obs, rewards, dones, infos = env.step(clipped_actions)
+
+            self.num_timesteps += env.num_envs
+
+            # Give access to local variables
+            with self._log_lock:
+                callback.update_locals(locals())
+                if not callback.on_step():
+                    return False
+                self._update_info_buffer(infos, dones)
+            n_steps += 1
+
+            if isinstance(self.action_space, spaces.Discrete):
+                # Reshape in case of discrete action
+                actions = actions.reshape(-1, 1)
+
+            # Handle timeout by bootstrapping with value function
+            for idx, done in enumerate(dones):
+                if (
+                    done
+                    and infos[idx].get("terminal_observation") is not None
+                    and infos[idx].get("TimeLimit.truncated", False)
+                ):
+                    terminal_obs = self.actor_policy.obs_to_tensor(infos[idx]["terminal_observation"])[0]
+                    with th.no_grad(), self._weights_lock:
+                        terminal_value = self.actor_policy.predict_values(terminal_obs)[0]
+                    rewards[idx] += self.gamma * terminal_value
+
+            rollout_buffer.add(
+                self._last_obs,
+                actions,
+                rewards,
+                self._last_episode_starts,
+                values,
+                log_probs,
+            )
+            self._last_obs = new_obs
+            self._last_episode_starts = dones
+
+        # the learner bootstraps from here with its own value estimate
+        rollout_buffer.last_obs = new_obs
+        rollout_buffer.last_dones = dones
+
+        with self._log_lock:
+            callback.update_locals(locals())
+            callback.on_rollout_end()
+
+        return True
+
+    def _evaluate_rollout(self, rollout_buffer):
+        """Values and log-probs of the stored actions under the current (learner) policy, shape (n_steps, n_envs)."""
+        n_steps, n_envs = rollout_buffer.buffer_size, rollout_buffer.n_envs
+        values = np.zeros((n_steps, n_envs), dtype=np.float32)
+        log_probs = np.zeros((n_steps, n_envs), dtype=np.float32)
+        chunk = max(1, self.batch_size // n_envs)
+        self.policy.set_training_mode(False)
+        with th.no_grad():
+            for start in range(0, n_steps, chunk):
+                end = min(start + chunk, n_steps)
+                if isinstance(rollout_buffer.observations, dict):
+                    obs = {key: o[start:end].reshape(-1, *o.shape[2:]) for key, o in rollout_buffer.observations.items()}
+                else:
+                    obs = rollout_buffer.observations[start:end].reshape(-1, *rollout_buffer.obs_shape)
+                actions = th.as_tensor(rollout_buffer.actions[start:end].reshape(-1, rollout_buffer.action_dim), device=self.device)
+                if isinstance(self.action_space, spaces.Discrete):
+                    actions = actions.long().flatten()
+                v, log_prob, _ = self.policy.evaluate_actions(obs_as_tensor(obs, self.device), actions)
+                values[start:end] = v.flatten().cpu().numpy().reshape(end - start, n_envs)
+                log_probs[start:end] = log_prob.cpu().numpy().reshape(end - start, n_envs)
+            last_values = self.policy.predict_values(obs_as_tensor(rollout_buffer.last_obs, self.device))
+        return values, log_probs, last_values.flatten().cpu().numpy()
+
+    def _vtrace_correct(self, rollout_buffer):
+        """Replace returns/advantages of a rollout by V-trace targets for the current policy (Espeholt et al. 2018)."""
+        values, log_probs, last_values = self._evaluate_rollout(rollout_buffer)
+        ratios = np.exp(log_probs - rollout_buffer.log_probs)
+        rhos = np.minimum(self.vtrace_rho_bar, ratios)
+        cs = self.gae_lambda * np.minimum(self.vtrace_c_bar, ratios)
+
+        vs = np.zeros_like(values)
+        advantages = np.zeros_like(values)
+        next_values = last_values
+        next_vs = last_values
+        for step in reversed(range(rollout_buffer.buffer_size)):
+            if step == rollout_buffer.buffer_size - 1:
+                next_non_terminal = 1.0 - rollout_buffer.last_dones.astype(np.float32)
+            else:
+                next_non_terminal = 1.0 - rollout_buffer.episode_starts[step + 1]
+                next_values = values[step + 1]
+                next_vs = vs[step + 1]
+            rewards = rollout_buffer.rewards[step]
+            delta = rhos[step] * (rewards + self.gamma * next_values * next_non_terminal - values[step])
+            vs[step] = values[step] + delta + self.gamma * cs[step] * next_non_terminal * (next_vs - next_values)
+            advantages[step] = rhos[step] * (rewards + self.gamma * next_non_terminal * next_vs - values[step])
+
+        # log_probs stay those of the behaviour policy, so the PPO ratio is taken against the acting policy
+        rollout_buffer.values = values
+        rollout_buffer.returns = vs
+        rollout_buffer.advantages = advantages
@@ -0,0 +1,23 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from pathlib import Path
+
+
+class ActionLogCallback(BaseCallback):
+    """
+    Starts the env workers' action loggers (pygba.action_log.ActionLogger, enabled by action_log) writing every episode
+    to session_dir/action_logs once training starts, so any episode can be re-simulated later (replay_episodes.py).
+    Workers that were respawned by the watchdog continue their log (SupervisedSubprocVecEnv replays the call).
+    """
+    def __init__(self, session_dir, verbose=0):
+        super().__init__(verbose)
+        self.log_dir = Path(session_dir) / "action_logs"
+
+    def _on_training_start(self):
+        paths = self.training_env.env_method("start_action_log", str(self.log_dir))
+        print(f"Logging the episodes of {len(paths)} env workers to {self.log_dir}")
+
+    def _on_training_end(self):
+        self.training_env.env_method("stop_action_log")
+
+    def _on_step(self):
+        return True
@@ -1,13 +1,17 @@
 from stable_baselines3.common.callbacks import BaseCallback
 import numpy as np
+import copy
 
 class EpisodeAwareCallback(BaseCallback):
     """
     Base class for RL callbacks that need per-environment episode tracking and episode boundary detection.
     - Initializes per-env episode counters in _on_training_start.
     - Provides is_episode_end() static method for episode boundary detection.
+    - state_dict() / load_state_dict() carry resume_attrs over to a resumed session (applied once training starts).
     Inherit from this class in callbacks that need to track episode state per environment.
     """
+    resume_attrs = ("episode_count",)
+
     def _on_training_start(self):
         self.num_envs = self.training_env.num_envs
         self.episode_count = [0 for _ in range(self.num_envs)]
@@ -19,4 +23,20 @@ class EpisodeAwareCallback(BaseCallback):
             truncateds[idx] if (truncateds is not None and isinstance(truncateds, (list, np.ndarray)))
             else (truncateds if truncateds is not None else False)
         )
-        return done or truncated 
\ No newline at end of file
+        return done or truncated 
+
+    def state_dict(self):
+        return {name: copy.deepcopy(getattr(self, name)) for name in self.resume_attrs}
+
+    def load_state_dict(self, state):
+        # _on_training_start (re)initializes the per-env state, so the loaded values are applied after it
+        self._resume_state = state
+
+    def on_training_start(self, locals_, globals_):
+        super().on_training_start(locals_, globals_)
+        state = getattr(self, "_resume_state", None)
+        if state:
+            for name in self.resume_attrs:
+                if name in state:
+                    setattr(self, name, state[name])
+        self._resume_state = None
@@ -0,0 +1,70 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from ZeldaALTTP.utils.highlights import HighlightRenderer, HIGHLIGHT_EVENTS, find_clips
+from pygba.action_log import ActionLogReader
+from pathlib import Path
+
+
+class HighlightCallback(BaseCallback):
+    """
+    Renders highlight clips (utils/highlights.py) of finished episodes to session_dir/highlights: after each rollout
+    the action log (session_dir/action_logs, action_log must be enabled) is scanned for episodes that ended, and the
+    windows around their events are re-simulated from the nearest keyframe in background processes.
+    """
+    def __init__(self, session_dir, rom_path, events=HIGHLIGHT_EVENTS, before_steps=50, after_steps=25, max_clips=100,
+                 workers=1, every_frame=True, start_method="forkserver", verbose=0):
+        super().__init__(verbose)
+        self.log_dir = Path(session_dir) / "action_logs"
+        self.output_dir = Path(session_dir) / "highlights"
+        self.rom_path = rom_path
+        self.events = events
+        self.before_steps = before_steps
+        self.after_steps = after_steps
+        self.max_clips = max_clips
+        self.workers = workers
+        self.every_frame = every_frame
+        self.start_method = start_method
+        self.renderer = None
+        self.seen = set()
+        self.rendered = 0
+        self.failed = 0
+
+    def _on_training_start(self):
+        self.renderer = HighlightRenderer(self.rom_path, self.log_dir, self.output_dir, workers=self.workers,
+                                          every_frame=self.every_frame, start_method=self.start_method)
+        print(f"Rendering highlight clips ({', '.join(self.events)}) to {self.output_dir}")
+
+    def _scan(self):
+        if not self.log_dir.is_dir():
+            return
+        reader = ActionLogReader(self.log_dir)
+        clips = find_clips(reader, self.events, self.before_steps, self.after_steps, skip=self.seen)
+        self.seen.update((entry["rank"], entry["episode"]) for entry in reader.episodes)
+        if self.max_clips:
+            clips = clips[:max(self.max_clips - self.renderer.submitted, 0)]
+        self.renderer.submit(clips)
+
+    def _count(self, rows):
+        for row in rows:
+            if row["error"]:
+                self.failed += 1
+                print(f"Highlight clip of rank {row['rank']} episode {row['episode']} failed: {row['error']}")
+            else:
+                self.rendered += 1
+
+    def _on_rollout_end(self):
+        self._scan()
+        self._count(self.renderer.collect())
+        self.logger.record("highlights/rendered", self.rendered)
+        self.logger.record("highlights/pending", len(self.renderer.pending))
+
+    def _on_training_end(self):
+        # ActionLogCallback (added before this one) has stopped the loggers, which wrote the unfinished episodes
+        self._scan()
+        if self.renderer.pending:
+            print(f"Waiting for {len(self.renderer.pending)} highlight clip(s) to render...")
+        self._count(self.renderer.close(wait=True))
+        print(f"{self.rendered} highlight clip(s) rendered to {self.output_dir}"
+              + (f", {self.failed} failed" if self.failed else ""))
+
+    def _on_step(self):
+        return True
@@ -0,0 +1,67 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from ZeldaALTTP.utils.rollout_buffer import rollout_buffer_nbytes
+import os
+import sys
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None if it can't be determined)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        memory_info = psutil.Process(os.getpid()).memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def total_rss_mb():
+    """Current RSS of this process plus its child processes (env workers) in MB (None without psutil)"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process(os.getpid())
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / (1024 * 1024)
+
+
+class MemoryReportCallback(BaseCallback):
+    """Reports the learner's peak RSS before training and after the first rollout + update, and logs it every rollout."""
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self.start_peak_rss = None
+        self.rollouts = 0
+
+    def _on_training_start(self):
+        self.start_peak_rss = peak_rss_mb()
+        buffer = self.model.rollout_buffer
+        print(f"\nRollout buffer: {type(buffer).__name__} "
+              f"(observations: {rollout_buffer_nbytes(buffer) / (1024 * 1024):.0f} MB)")
+        if self.start_peak_rss is not None:
+            print(f"Peak RSS before training: {self.start_peak_rss:.0f} MB")
+
+    def _on_rollout_start(self):
+        # the first rollout start after the first rollout end means the first update has finished
+        if self.rollouts == 1 and self.start_peak_rss is not None:
+            print(f"Peak RSS after first rollout + update: {peak_rss_mb():.0f} MB (before training: {self.start_peak_rss:.0f} MB)")
+
+    def _on_rollout_end(self):
+        self.rollouts += 1
+        peak = peak_rss_mb()
+        if peak is not None:
+            self.logger.record("memory/peak_rss_mb", peak)
+
+    def _on_step(self):
+        return True
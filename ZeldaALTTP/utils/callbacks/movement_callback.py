@@ -29,6 +29,8 @@ def convert_numpy_types(obj):
 
 class MovementTrackingCallback(EpisodeAwareCallback):
     """Callback for tracking Link's movements during training and evaluation (supports multiple envs)"""
+    resume_attrs = ("episode_count", "movements", "current_area", "seen_coords")
+
     def __init__(self, session_dir, verbose=0):
         super().__init__(verbose)
         self.session_dir = session_dir
@@ -36,9 +38,11 @@ class MovementTrackingCallback(EpisodeAwareCallback):
         self.movement_dirs = []  # List of Path objects, one per env
         self.current_area = []  # List, one per env
         self.seen_coords = []  # List of sets, one per env
+        self.actions = None  # Action set of the envs (may be customized in config)
     
     def _on_training_start(self):
         super()._on_training_start()
+        self.actions = self.training_env.get_attr("actions", [0])[0]
         self.movement_dir = self.session_dir / "movements"
         self.movement_dir.mkdir(exist_ok=True)
         self.movements = [[] for _ in range(self.num_envs)]
@@ -65,7 +69,7 @@ class MovementTrackingCallback(EpisodeAwareCallback):
                     if coord_tuple not in self.seen_coords[i]:
                         self.seen_coords[i].add(coord_tuple)
                         action = actions[i] if isinstance(actions, (list, np.ndarray)) else actions
-                        direction = get_direction_from_action(action)
+                        direction = get_direction_from_action(action, self.actions)
                         movement_data = {
                             'tile_x': tile_x,
                             'tile_y': tile_y,
@@ -100,22 +104,23 @@ class MovementTrackingCallback(EpisodeAwareCallback):
             self.seen_coords[env_idx] = set()  # Reset seen coords for next episode
             self.episode_count[env_idx] += 1
 
-def decode_action(action_idx):
-    # Reproduce the action space logic from PyGBAEnv
-    arrow_keys = [None, "up", "down", "right", "left"]
-    buttons = [None, "A", "B", "L", "R"]
-    actions = [(a, b) for a in arrow_keys for b in buttons]
+def decode_action(action_idx, actions=None):
+    if actions is None:
+        # Reproduce the default action space logic from PyGBAEnv
+        arrow_keys = [None, "up", "down", "right", "left"]
+        buttons = [None, "A", "B", "L", "R"]
+        actions = [(a, b) for a in arrow_keys for b in buttons]
     if hasattr(action_idx, 'item'):
         action_idx = action_idx.item()
     return actions[action_idx]
 
-def get_direction_from_action(action):
-    arrow, button = decode_action(action)
+def get_direction_from_action(action, actions=None):
+    keys = decode_action(action, actions)
     direction_map = {
         "up": "up",
         "right": "right",
         "down": "down",
         "left": "left",
-        None: "none"  # No direction
     }
-    return direction_map.get(arrow, "none")
+    arrow = next((key for key in keys if key in direction_map), None)
+    return direction_map.get(arrow, "none")  # No direction
@@ -0,0 +1,74 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import unwrap_vec_wrapper
+from ZeldaALTTP.utils.profiled_vec_env import ProfiledVecEnv
+from pygba.profiling import merge_summaries
+from pathlib import Path
+import json
+import time
+
+
+class ProfilingCallback(BaseCallback):
+    """
+    Writes a timing breakdown per rollout to session_dir/profiles/rollout_XXXXX.json:
+    - learner: rollout collection, VecEnv step/reset (incl. IPC), the remainder of collection (policy forward,
+      buffer writes, callbacks) and the PPO update that followed the rollout
+    - workers: per-env phase histograms (emulate / observe / reward / info / reset) and their merge
+    Needs the training env wrapped in ProfiledVecEnv and worker envs created with profile=True.
+    """
+    def __init__(self, session_dir, verbose=0):
+        super().__init__(verbose)
+        self.profile_dir = Path(session_dir) / "profiles"
+        self.rollouts = 0
+        self.rollout_start = None
+        self.rollout_end = None
+        self.pending = None
+
+    def _on_training_start(self):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self.vec_env = unwrap_vec_wrapper(self.training_env, ProfiledVecEnv)
+        if self.vec_env is None:
+            print("ProfilingCallback: training env is not wrapped in ProfiledVecEnv, VecEnv/worker timings are skipped")
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        self._flush(now)
+        self.rollout_start = now
+
+    def _on_rollout_end(self):
+        self.rollout_end = time.perf_counter()
+        learner = {"collect_s": self.rollout_end - self.rollout_start}
+        workers = []
+        if self.vec_env is not None:
+            learner.update(self.vec_env.profiler.summary(reset=True))
+            vec_time = sum(phase["total_s"] for phase in learner.values() if isinstance(phase, dict))
+            learner["policy_and_buffer_s"] = learner["collect_s"] - vec_time
+            workers = self.vec_env.worker_profiles()
+        self.pending = {
+            "rollout": self.rollouts,
+            "num_timesteps": self.num_timesteps,
+            "learner": learner,
+            "workers": {"merged": merge_summaries(workers), "per_worker": workers},
+        }
+        self.rollouts += 1
+
+    def _on_training_end(self):
+        self._flush(time.perf_counter())
+
+    def _flush(self, now):
+        # a rollout's summary is written once its update has finished, i.e. at the next rollout start
+        if self.pending is None:
+            return
+        learner = self.pending["learner"]
+        learner["update_s"] = now - self.rollout_end
+        for name, phase in self.pending["workers"]["merged"].items():
+            self.logger.record(f"profile/worker_{name}_ms", phase["mean_ms"])
+        for name in ("collect_s", "policy_and_buffer_s", "update_s"):
+            if name in learner:
+                self.logger.record(f"profile/{name}", learner[name])
+        path = self.profile_dir / f"rollout_{self.pending['rollout']:05d}.json"
+        with open(path, "w") as f:
+            json.dump(self.pending, f, indent=2)
+        self.pending = None
+
+    def _on_step(self):
+        return True
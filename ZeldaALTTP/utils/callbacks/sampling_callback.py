@@ -0,0 +1,61 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from datetime import datetime
+from pathlib import Path
+import json
+
+
+class SamplingProfilerCallback(BaseCallback):
+    """
+    Starts sampling-profiler windows in env workers while training keeps running.
+    - If sample_on_start is set, the configured ranks are sampled once at the start of training.
+    - Every check_freq steps, the callback looks for session_dir/profiles/sample.trigger (e.g. `touch` it).
+      The trigger may hold JSON overriding the defaults: {"ranks": [0, 3], "window_s": 20, "interval_ms": 2}.
+      It is deleted once the windows have started.
+    Each window writes session_dir/profiles/stacks_rank<R>_<timestamp>.collapsed (see pygba.profiling.StackSampler).
+    """
+    def __init__(self, session_dir, ranks=(0,), window_s=10.0, interval_ms=5.0, sample_on_start=False, check_freq=1000, verbose=0):
+        super().__init__(verbose)
+        self.profile_dir = Path(session_dir) / "profiles"
+        self.trigger_path = self.profile_dir / "sample.trigger"
+        self.ranks = list(ranks)
+        self.window_s = window_s
+        self.interval_ms = interval_ms
+        self.sample_on_start = sample_on_start
+        self.check_freq = check_freq
+
+    def _on_training_start(self):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if self.sample_on_start:
+            self.start_windows(self.ranks, self.window_s, self.interval_ms)
+
+    def _on_step(self):
+        if self.n_calls % self.check_freq == 0 and self.trigger_path.exists():
+            self._handle_trigger()
+        return True
+
+    def _handle_trigger(self):
+        try:
+            text = self.trigger_path.read_text().strip()
+            request = json.loads(text) if text else {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable sampling trigger {self.trigger_path}: {e}")
+            request = {}
+        self.trigger_path.unlink(missing_ok=True)
+        self.start_windows(
+            request.get("ranks", self.ranks),
+            request.get("window_s", self.window_s),
+            request.get("interval_ms", self.interval_ms),
+        )
+
+    def start_windows(self, ranks, window_s, interval_ms):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for rank in ranks:
+            if not 0 <= rank < self.training_env.num_envs:
+                print(f"Sampling profiler: no env worker with rank {rank}")
+                continue
+            path = self.profile_dir / f"stacks_rank{rank}_{timestamp}.collapsed"
+            started = self.training_env.env_method("start_sampling", str(path), window_s, interval_ms / 1000, indices=[rank])[0]
+            if started:
+                print(f"Sampling env worker {rank} for {window_s}s every {interval_ms}ms -> {path}")
+            else:
+                print(f"Sampling profiler: env worker {rank} is still sampling, request skipped")
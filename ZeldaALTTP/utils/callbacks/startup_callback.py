@@ -0,0 +1,51 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from pathlib import Path
+import json
+import time
+
+
+class StartupTimerCallback(BaseCallback):
+    """
+    Reports how long the run took from launch to the first rollout step, split into
+    launch -> VecEnv created (first worker up), -> training start (model built / loaded), -> first step (every worker
+    reset and stepped once), plus each worker's own env construction time. Printed, logged as startup/* and written
+    to session_dir/startup.json.
+    """
+    def __init__(self, session_dir, launch_time, env_ready_time, start_method=None, verbose=0):
+        super().__init__(verbose)
+        self.path = Path(session_dir) / "startup.json"
+        self.launch_time = launch_time
+        self.env_ready_time = env_ready_time
+        self.start_method = start_method
+        self.training_start_time = None
+        self.reported = False
+
+    def _on_training_start(self):
+        self.training_start_time = time.time()
+
+    def _on_step(self):
+        if not self.reported:
+            self.reported = True
+            self._report(time.time())
+        return True
+
+    def _report(self, now):
+        worker_startup = self.training_env.get_attr("startup_s")
+        report = {
+            "start_method": self.start_method,
+            "rom_preloaded": all(self.training_env.get_attr("rom_preloaded")),
+            "env_ready_s": self.env_ready_time - self.launch_time,
+            "training_start_s": self.training_start_time - self.launch_time,
+            "first_step_s": now - self.launch_time,
+            "worker_startup_mean_s": sum(worker_startup) / len(worker_startup),
+            "worker_startup_max_s": max(worker_startup),
+            "worker_startup_s": worker_startup,
+        }
+        print(f"\nStartup ({self.start_method}, ROM preloaded: {report['rom_preloaded']}): "
+              f"envs ready {report['env_ready_s']:.2f}s, training start {report['training_start_s']:.2f}s, "
+              f"first step {report['first_step_s']:.2f}s after launch "
+              f"(worker env init mean {report['worker_startup_mean_s']:.2f}s, max {report['worker_startup_max_s']:.2f}s)")
+        for name in ("env_ready_s", "first_step_s", "worker_startup_max_s"):
+            self.logger.record(f"startup/{name}", report[name])
+        with open(self.path, "w") as f:
+            json.dump(report, f, indent=2)
@@ -5,6 +5,8 @@ import csv
 
 class StatisticLoggingCallback(EpisodeAwareCallback):
     """Callback for logging training statistics including rewards and exploration metrics every N steps during training."""
+    resume_attrs = ("episode_count", "episode_rewards", "episode_reward_components", "last_log_step")
+
     def __init__(self, session_dir, log_freq=4000, verbose=0):
         super().__init__(verbose)
         self.session_dir = session_dir
@@ -0,0 +1,24 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from pathlib import Path
+
+
+class TrajectoryCallback(BaseCallback):
+    """
+    Starts the env workers' trajectory recorders (pygba.trajectory.TrajectoryRecorder, enabled by record_trajectories)
+    writing to session_dir/trajectories/rank_<R> once training starts. Workers that were respawned by the watchdog
+    continue their directory (SupervisedSubprocVecEnv replays the call). Recording stops when training ends or the
+    envs are closed.
+    """
+    def __init__(self, session_dir, verbose=0):
+        super().__init__(verbose)
+        self.trajectory_dir = Path(session_dir) / "trajectories"
+
+    def _on_training_start(self):
+        paths = self.training_env.env_method("start_recording", str(self.trajectory_dir))
+        print(f"Recording trajectories of {len(paths)} env workers to {self.trajectory_dir}")
+
+    def _on_training_end(self):
+        self.training_env.env_method("stop_recording")
+
+    def _on_step(self):
+        return True
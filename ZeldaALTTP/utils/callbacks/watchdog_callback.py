@@ -0,0 +1,39 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from pathlib import Path
+import csv
+
+RESTART_FIELDS = ["time", "num_timesteps", "rank", "during", "error", "restart"]
+
+
+class WatchdogCallback(BaseCallback):
+    """
+    Reports worker restarts of a SupervisedSubprocVecEnv: every rollout, new restart events are appended to
+    session_dir/worker_restarts.csv and the totals are logged as watchdog/restarts and watchdog/restarts_max_worker.
+    """
+    def __init__(self, session_dir, verbose=0):
+        super().__init__(verbose)
+        self.log_path = Path(session_dir) / "worker_restarts.csv"
+
+    def _on_training_start(self):
+        self.vec_env = self.training_env.unwrapped
+        if not hasattr(self.vec_env, "restart_events"):
+            print("WatchdogCallback: training env is not a SupervisedSubprocVecEnv, no restarts to report")
+            self.vec_env = None
+
+    def _on_rollout_end(self):
+        if self.vec_env is None:
+            return
+        events, self.vec_env.restart_events = self.vec_env.restart_events, []
+        if events:
+            new_file = not self.log_path.exists()
+            with open(self.log_path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=RESTART_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                for event in events:
+                    writer.writerow(dict(event, num_timesteps=self.num_timesteps))
+        self.logger.record("watchdog/restarts", sum(self.vec_env.restart_counts))
+        self.logger.record("watchdog/restarts_max_worker", max(self.vec_env.restart_counts))
+
+    def _on_step(self):
+        return True
@@ -0,0 +1,206 @@
+from stable_baselines3.common.callbacks import CheckpointCallback
+from stable_baselines3.common.save_util import data_to_json
+from stable_baselines3.common.utils import get_system_info
+import stable_baselines3 as sb3
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+import torch as th
+import threading
+import zipfile
+import queue
+import time
+import csv
+import os
+
+STATS_FIELDS = ["time", "num_timesteps", "path", "stall_ms", "write_ms", "bytes", "error"]
+
+
+def _to_cpu(obj):
+    """Copy of a (nested) state dict with every tensor cloned to CPU memory."""
+    if isinstance(obj, th.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+def snapshot_model(model, exclude=None, include=None):
+    """
+    In-memory snapshot of everything BaseAlgorithm.save writes (same exclusion rules), detached from the live model:
+    class attributes are JSON-serialized right away and parameters / optimizer state are cloned to CPU.
+    Returns (serialized_data, params, pytorch_variables) for write_checkpoint.
+    """
+    # AsyncPPO: the actor appends to the info buffers and the learner updates the parameters from other threads;
+    # don't copy either halfway through (the actor asks for snapshots through between_updates instead)
+    with getattr(model, "_log_lock", None) or nullcontext(), getattr(model, "_train_lock", None) or nullcontext():
+        data = model.__dict__.copy()
+        exclude = set(exclude or []).union(model._excluded_save_params())
+        if include is not None:
+            exclude = exclude.difference(include)
+        state_dicts_names, torch_variable_names = model._get_torch_save_params()
+        for torch_var in state_dicts_names + torch_variable_names:
+            exclude.add(torch_var.split(".")[0])
+        for param_name in exclude:
+            data.pop(param_name, None)
+
+        pytorch_variables = None
+        if torch_variable_names is not None:
+            pytorch_variables = {}
+            for name in torch_variable_names:
+                obj = model
+                for attr in name.split("."):
+                    obj = getattr(obj, attr)
+                pytorch_variables[name] = _to_cpu(obj)
+
+        params = _to_cpu(model.get_parameters())
+        serialized_data = data_to_json(data)
+    return serialized_data, params, pytorch_variables
+
+
+def write_model_zip(f, serialized_data, params, pytorch_variables):
+    """Write a snapshot in the SB3 zip format (loadable with PPO.load) to a binary file object."""
+    with zipfile.ZipFile(f, mode="w") as archive:
+        archive.writestr("data", serialized_data)
+        if pytorch_variables is not None:
+            with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as pytorch_variables_file:
+                th.save(pytorch_variables, pytorch_variables_file)
+        for file_name, dict_ in params.items():
+            with archive.open(file_name + ".pth", mode="w", force_zip64=True) as param_file:
+                th.save(dict_, param_file)
+        archive.writestr("_stable_baselines3_version", sb3.__version__)
+        archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+
+
+def write_checkpoint(path, serialized_data, params, pytorch_variables):
+    """Write a snapshot as an SB3 zip, atomically: tmp file + fsync + rename."""
+    path = Path(path)
+    if path.suffix != ".zip":
+        path = path.with_suffix(".zip")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        write_model_zip(f, serialized_data, params, pytorch_variables)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def between_updates(model, fn):
+    """Call fn() now, or for an AsyncPPO model called from its actor thread, on the learner before its next update."""
+    if hasattr(model, "between_updates"):
+        model.between_updates(fn)
+    else:
+        fn()
+
+
+class BackgroundCheckpointer:
+    """
+    Saves models without making training wait for serialization:
+    - save() snapshots the model in memory (the only part training waits for) and queues it
+    - a background thread writes queued snapshots with write_checkpoint (atomic rename)
+    - submit() queues any other snapshot with the function that writes it (e.g. resume bundles)
+    - at most max_pending snapshots wait in the queue; save() blocks when it is full, which counts as stall time
+    Stall and write times of every checkpoint are appended to stats_path (CSV) if given.
+    """
+    def __init__(self, max_pending=1, stats_path=None):
+        self.stats_path = Path(stats_path) if stats_path is not None else None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stats_lock = threading.Lock()
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="BackgroundCheckpointer", daemon=True)
+        self._thread.start()
+
+    def save(self, model, path):
+        """Snapshot model and queue it to be written to path. Returns the stall (seconds training was blocked)."""
+        start = time.perf_counter()
+        snapshot = snapshot_model(model)
+        return self.submit(path, write_checkpoint, snapshot, model.num_timesteps, start)
+
+    def submit(self, path, write, snapshot, num_timesteps, start=None):
+        """
+        Queue write(path, *snapshot) (returning the written path) for the background thread.
+        Returns the stall in seconds, from `start` (perf_counter, taken before snapshotting) if given.
+        """
+        start = time.perf_counter() if start is None else start
+        stats = dict(time=datetime.now().isoformat(timespec="seconds"), num_timesteps=num_timesteps, path=str(path))
+        queued = threading.Event()
+        self._queue.put((path, write, snapshot, stats, queued))
+        stall = time.perf_counter() - start
+        stats["stall_ms"] = 1000 * stall
+        queued.set()
+        return stall
+
+    def wait(self):
+        """Block until every queued checkpoint is on disk."""
+        self._queue.join()
+
+    def close(self):
+        self.wait()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            path, write, snapshot, stats, queued = item
+            start = time.perf_counter()
+            try:
+                path = write(path, *snapshot)
+                stats.update(path=str(path), bytes=path.stat().st_size)
+            except Exception as e:
+                self.last_error = e
+                stats["error"] = str(e)
+                print(f"\nBackground checkpoint to {path} failed: {e}")
+            stats["write_ms"] = 1000 * (time.perf_counter() - start)
+            # save() fills in the stall once put() has returned
+            queued.wait()
+            self._write_stats(stats)
+            self._queue.task_done()
+
+    def _write_stats(self, stats):
+        if self.stats_path is None:
+            return
+        with self._stats_lock:
+            new_file = not self.stats_path.exists()
+            with open(self.stats_path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=STATS_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(stats)
+
+
+class BackgroundCheckpointCallback(CheckpointCallback):
+    """
+    CheckpointCallback that saves through a BackgroundCheckpointer and logs the stall as checkpoint/stall_ms.
+    With AsyncPPO the snapshot is taken by the learner between updates (see between_updates).
+    """
+    def __init__(self, checkpointer, save_freq, save_path, name_prefix="rl_model", verbose=0):
+        super().__init__(save_freq, save_path, name_prefix=name_prefix, verbose=verbose)
+        self.checkpointer = checkpointer
+        self.stall = None
+
+    def _on_step(self):
+        if self.n_calls % self.save_freq == 0:
+            model_path = self._checkpoint_path(extension="zip")
+            between_updates(self.model, lambda: self._save(model_path))
+        return True
+
+    def _save(self, model_path):
+        self.stall = self.checkpointer.save(self.model, model_path)
+        if self.verbose >= 2:
+            print(f"Queued model checkpoint {model_path} (stalled {1000 * self.stall:.0f} ms)")
+
+    def _on_rollout_end(self):
+        if self.stall is not None:
+            self.logger.record("checkpoint/stall_ms", 1000 * self.stall)
+            self.stall = None
+
+    def _on_training_end(self):
+        self.checkpointer.wait()
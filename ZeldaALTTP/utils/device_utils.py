@@ -2,24 +2,110 @@ import torch
 import os
 import math
 
-def setup_device(config_section):
+def setup_device(config_section, cpu_layout=None):
     """
     Sets up device and utilization based on config_section (dict-like).
+    If a cpu_layout from plan_cpu_layout is given, torch threads follow it instead of device_util.
     Returns the device string ('cuda' or 'cpu').
     """
     device_type = config_section.get("device_type", "cuda")
     device_util = float(config_section.get("device_util", 1.0))
 
+    if cpu_layout is not None:
+        apply_torch_layout(cpu_layout)
+
     if device_type == "cuda" and torch.cuda.is_available():
         device = "cuda"
         # torch.cuda.set_per_process_memory_fraction(device_util, 0)
         print(f"\nUsing device: {device} (GPU fraction: {device_util*100:.0f}%)")
     elif device_type == "cpu":
         device = "cpu"
-        num_threads = max(1, math.ceil(os.cpu_count() * device_util))
-        torch.set_num_threads(num_threads)
-        print(f"\nUsing device: {device} (CPU threads: {num_threads})")
+        if cpu_layout is None:
+            num_threads = max(1, math.ceil(os.cpu_count() * device_util))
+            torch.set_num_threads(num_threads)
+        print(f"\nUsing device: {device} (CPU threads: {torch.get_num_threads()})")
     else:
         device = "cpu"
         print(f"\nRequested device '{device_type}' not available. Falling back to CPU.")
-    return device 
\ No newline at end of file
+    return device
+
+
+def available_cpus():
+    """CPUs this process is allowed to run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    try:
+        import psutil
+        return sorted(psutil.Process().cpu_affinity())
+    except (ImportError, AttributeError):
+        return list(range(os.cpu_count() or 1))
+
+
+def pin_to_cpus(cpus):
+    """Restrict the calling process to the given CPUs (no-op if cpus is empty or pinning isn't supported)"""
+    if not cpus:
+        return False
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        return True
+    try:
+        import psutil
+        psutil.Process().cpu_affinity(list(cpus))
+        return True
+    except (ImportError, AttributeError):
+        # e.g. macOS has no CPU affinity API
+        return False
+
+
+def plan_cpu_layout(num_envs, config_section):
+    """
+    Splits the available CPUs between the env workers and torch so they don't oversubscribe the machine.
+    - Each env worker gets one CPU of its own (round-robin if there are more workers than CPUs).
+    - torch (the learner process) gets the CPUs left over, at least one.
+    - torch_threads / torch_interop_threads override the thread counts (0 = derive from the layout).
+    Returns a dict with env_cpus (one list per worker rank), torch_cpus, intra_op_threads and inter_op_threads.
+    """
+    cpus = available_cpus()
+    pinning = config_section.get("cpu_pinning", True)
+    device_util = float(config_section.get("device_util", 1.0))
+
+    if num_envs < len(cpus):
+        env_cpus = [[cpu] for cpu in cpus[:num_envs]]
+        torch_cpus = cpus[num_envs:]
+    else:
+        # more workers than cores: share cores between workers and leave the learner the last one
+        env_cpus = [[cpus[rank % len(cpus)]] for rank in range(num_envs)]
+        torch_cpus = cpus[-1:]
+
+    intra_op_threads = config_section.get("torch_threads", 0) or max(1, math.ceil(len(torch_cpus) * device_util))
+    inter_op_threads = config_section.get("torch_interop_threads", 0) or 1
+
+    return dict(
+        pinning=pinning,
+        env_cpus=env_cpus if pinning else [[] for _ in range(num_envs)],
+        torch_cpus=torch_cpus if pinning else [],
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
+    )
+
+
+def apply_torch_layout(cpu_layout):
+    """Pin the learner process and set torch's intra-op / inter-op thread counts from a plan_cpu_layout result."""
+    pin_to_cpus(cpu_layout["torch_cpus"])
+    torch.set_num_threads(cpu_layout["intra_op_threads"])
+    try:
+        torch.set_num_interop_threads(cpu_layout["inter_op_threads"])
+    except RuntimeError:
+        # can only be set once, before any inter-op parallel work has started
+        pass
+
+
+def format_cpu_layout(cpu_layout):
+    """Human readable summary of a plan_cpu_layout result."""
+    lines = [f"CPU layout ({len(available_cpus())} CPUs available, pinning {'on' if cpu_layout['pinning'] else 'off'}):"]
+    if cpu_layout["pinning"]:
+        for rank, cpus in enumerate(cpu_layout["env_cpus"]):
+            lines.append(f"  env worker {rank:>2} -> CPU {', '.join(map(str, cpus))}")
+        lines.append(f"  torch          -> CPU {', '.join(map(str, cpu_layout['torch_cpus']))}")
+    lines.append(f"  torch threads: {cpu_layout['intra_op_threads']} intra-op, {cpu_layout['inter_op_threads']} inter-op")
+    return "\n".join(lines)
@@ -0,0 +1,100 @@
+from ZeldaALTTP.utils.device_utils import pin_to_cpus
+from ZeldaALTTP.stream_wrapper import StreamWrapper
+from pygba.pygba import PyGBA
+from pygba.gym_env import PyGBAEnv
+from pygba.game_wrappers.zelda_alttp import ZeldaALTTP
+from pygba.utils import parse_action
+from pygba.preload import read_file, is_preloaded
+from pygba.trajectory import TrajectoryRecorder
+from pygba.action_log import ActionLogger
+import mgba.log
+import numpy as np
+import time
+
+mgba.log.silence()
+
+# imported once by the fork server (enable_forkserver_preload) instead of by every env worker
+WORKER_MODULES = ["torch", "stable_baselines3", "ZeldaALTTP.utils.env_factory"]
+
+# SB3 policy for each PyGBAEnv observation mode
+POLICY_TYPES = {
+    "screen": "CnnPolicy",
+    "ram": "MlpPolicy",
+    "dict": "MultiInputPolicy",
+}
+
+
+def default_ppo_kwargs(model_config):
+    """PPO settings shared by train_agents, population members and sweep trials, from the [TrainModel] section."""
+    return dict(
+        n_steps=model_config["update_freq"],
+        batch_size=model_config["batch_size"],
+        n_epochs=1,
+        gamma=0.997,
+        ent_coef=model_config["ent_coef"],
+    )
+
+
+def load_state_to_gba(gba, state_path):
+    from mgba._pylib import ffi
+    save_data = read_file(state_path)
+    state = ffi.new("uint8_t[]", save_data)
+    gba.core.load_raw_state(state)
+
+
+def make_env(rank, paths_config, model_config, general_config, cpu_layout=None, action_log=False):
+    """
+    Returns a thunk building the Zelda PyGBAEnv for worker `rank` from the [Paths], [TrainModel] and [General] config sections
+    (for SubprocVecEnv). If a cpu_layout from plan_cpu_layout is given, the worker pins itself to its cores first.
+    With action_log, the env is wrapped in an (idle) ActionLogger for ActionLogCallback to start.
+    """
+    rom_path = paths_config["gb_path"]
+    state_path = paths_config["init_state"]
+    action_set = [parse_action(spec) for spec in model_config.get("action_set", [])] or None
+    palette = np.load(model_config["palette_path"]) if model_config.get("palette_path") else None
+    render_mode = "rgb_array" if model_config["headless"] else "human"
+
+    def _init():
+        start = time.perf_counter()
+        # keep each emulator worker on its own core (see plan_cpu_layout)
+        if cpu_layout is not None:
+            pin_to_cpus(cpu_layout["env_cpus"][rank])
+        # ROM and state come from the fork server's preload cache when it was enabled (see pygba.preload)
+        gba = PyGBA.load(rom_path, rom_data=read_file(rom_path))
+        load_state_to_gba(gba, state_path)
+        zelda_wrapper = ZeldaALTTP()
+        env = PyGBAEnv(
+            gba,
+            game_wrapper=zelda_wrapper,
+            frameskip=model_config["action_freq"],
+            render_mode=render_mode,
+            max_episode_steps=model_config["episode_length"],
+            reset_to_initial_state=True,
+            actions=action_set,
+            deterministic=model_config.get("deterministic", False),
+            obs_type=model_config.get("obs_type", "rgb"),
+            downscale=model_config.get("downscale", 1),
+            frame_stack=model_config.get("frame_stack", 1),
+            palette=palette,
+            observation_mode=model_config.get("observation_mode", "screen"),
+            profile=model_config.get("profile", False)
+        )
+        env.rank = rank  # Attach rank to environment
+        env.startup_s = time.perf_counter() - start
+        env.rom_preloaded = is_preloaded(rom_path)
+        # loggers / recorders are idle until their callbacks start them with the session directory
+        if action_log:
+            env = ActionLogger(env, rank=rank, keyframe_interval=model_config.get("action_log_keyframe_interval", 0))
+        if model_config.get("record_trajectories", False):
+            env = TrajectoryRecorder(
+                env,
+                rank=rank,
+                frames=model_config.get("trajectory_frames", False),
+                frame_downscale=model_config.get("trajectory_frame_downscale", 4),
+                chunk_steps=model_config.get("trajectory_chunk_steps", 16384)
+            )
+        # Conditionally wrap with streaming wrapper
+        if general_config["enable_stream_wrapper"]:
+            env = StreamWrapper(env, ws_address="ws://localhost:8765", stream_metadata={"env_rank": rank})
+        return env
+    return _init
@@ -0,0 +1,165 @@
+from pathlib import Path
+import numpy as np
+import hashlib
+import re
+import os
+
+REWARD_COMPONENTS = ["rupees", "health", "explore", "death", "area_discovery", "sword", "revisit", "enemies_killed", "small_keys"]
+
+# first step of an episode at which each milestone holds (counters are compared with their value at episode start)
+MILESTONES = {
+    "new_area": lambda info, start: len(info.get("discovered_areas", ())) > start["areas"],
+    "first_kill": lambda info, start: info.get("total_enemies_killed", 0) > start["enemies_killed"],
+    "first_key": lambda info, start: info.get("total_small_keys", 0) > start["small_keys"],
+    "sword": lambda info, start: info.get("sword", 0) > 0,
+    "first_death": lambda info, start: info.get("is_dead", False),
+}
+
+EPISODE_FIELDS = [
+    "checkpoint", "num_timesteps", "rank", "episode", "length", "reward",
+    *(f"reward_{name}" for name in REWARD_COMPONENTS),
+    "areas_reached", "areas", "explored_locations", "deaths", "enemies_killed", "small_keys", "rupees",
+    *(f"steps_to_{name}" for name in MILESTONES),
+]
+
+SUMMARY_FIELDS = [
+    "checkpoint", "num_timesteps", "episodes", "reward_mean", "reward_std",
+    *(f"reward_{name}_mean" for name in REWARD_COMPONENTS),
+    "areas_reached_mean", "areas_reached_max", "areas", "explored_locations_mean", "deaths_mean",
+    "enemies_killed_mean", "small_keys_mean", "length_mean",
+    *(f"{name}_reached" for name in MILESTONES),
+    *(f"steps_to_{name}_median" for name in MILESTONES),
+]
+
+
+def checkpoint_steps(path):
+    """Training steps of a checkpoint from its name (zelda_model_<steps>_steps.zip), None for final/interrupted models."""
+    match = re.search(r"_(\d+)_steps", Path(path).stem)
+    return int(match.group(1)) if match else None
+
+
+def find_checkpoints(path, which="all"):
+    """
+    Checkpoints under path (a .zip, a session's models/ dir or a session dir), oldest first:
+    step checkpoints by step count, then final/interrupted models by modification time.
+    which="latest" keeps only the last one.
+    """
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    models_dir = path / "models" if (path / "models").is_dir() else path
+    checkpoints = sorted(
+        models_dir.glob("*.zip"),
+        key=lambda p: (checkpoint_steps(p) is None, checkpoint_steps(p) or 0, os.path.getmtime(p)),
+    )
+    if which == "latest":
+        return checkpoints[-1:]
+    return checkpoints
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EpisodeTracker:
+    """Accumulates one episode of a worker: reward, reward components and the steps at which milestones were reached."""
+    def __init__(self):
+        self.length = 0
+        self.reward = 0.0
+        self.components = {name: 0.0 for name in REWARD_COMPONENTS}
+        self.milestones = {}
+        self.start = None
+        self.last_info = {}
+
+    def update(self, reward, info):
+        if self.start is None:
+            self.start = {
+                "areas": len(info.get("discovered_areas", ())),
+                "enemies_killed": info.get("total_enemies_killed", 0),
+                "small_keys": info.get("total_small_keys", 0),
+            }
+        self.length += 1
+        self.reward += float(reward)
+        for name, value in info.get("reward_components", {}).items():
+            if name in self.components:
+                self.components[name] += float(value)
+        for name, reached in MILESTONES.items():
+            if name not in self.milestones and reached(info, self.start):
+                self.milestones[name] = self.length
+        self.last_info = info
+
+    def finish(self, **fields):
+        info, start = self.last_info, self.start or {}
+        areas = sorted(info.get("discovered_areas", ()))
+        return {
+            **fields,
+            "length": self.length,
+            "reward": self.reward,
+            **{f"reward_{name}": value for name, value in self.components.items()},
+            "areas_reached": len(areas),
+            "areas": ";".join(areas),
+            "explored_locations": info.get("explored_locations", 0),
+            "deaths": info.get("deaths", 0),
+            "enemies_killed": info.get("total_enemies_killed", 0) - start.get("enemies_killed", 0),
+            "small_keys": info.get("total_small_keys", 0) - start.get("small_keys", 0),
+            "rupees": info.get("rupees", 0),
+            **{f"steps_to_{name}": self.milestones.get(name) for name in MILESTONES},
+        }
+
+
+def evaluate_model(model, env, n_episodes, seed=None, deterministic=True, **fields):
+    """
+    Runs n_episodes spread over the VecEnv's workers (worker i runs every num_envs-th episode) and returns one
+    EPISODE_FIELDS row per episode. Workers that finished their share keep stepping until the others are done.
+    With a seed, every call starts the workers from the same seeds, so checkpoints are compared on equal terms.
+    """
+    num_envs = env.num_envs
+    quota = [n_episodes // num_envs + (1 if i < n_episodes % num_envs else 0) for i in range(num_envs)]
+    finished = [0] * num_envs
+    trackers = [EpisodeTracker() for _ in range(num_envs)]
+    episodes = []
+    if seed is not None:
+        env.seed(seed)
+    obs = env.reset()
+    while any(done < wanted for done, wanted in zip(finished, quota)):
+        actions, _ = model.predict(obs, deterministic=deterministic)
+        obs, rewards, dones, infos = env.step(actions)
+        for i in range(num_envs):
+            if finished[i] >= quota[i]:
+                continue
+            trackers[i].update(rewards[i], infos[i])
+            if dones[i]:
+                episodes.append(trackers[i].finish(**fields, rank=i, episode=finished[i]))
+                finished[i] += 1
+                trackers[i] = EpisodeTracker()
+    return episodes
+
+
+def summarize_episodes(episodes, **fields):
+    """One SUMMARY_FIELDS row comparing a checkpoint: means over its episodes, milestone hit rates and median steps."""
+    def mean(name):
+        return float(np.mean([episode[name] for episode in episodes]))
+    summary = {
+        **fields,
+        "episodes": len(episodes),
+        "reward_mean": mean("reward"),
+        "reward_std": float(np.std([episode["reward"] for episode in episodes])),
+        **{f"reward_{name}_mean": mean(f"reward_{name}") for name in REWARD_COMPONENTS},
+        "areas_reached_mean": mean("areas_reached"),
+        "areas_reached_max": max(episode["areas_reached"] for episode in episodes),
+        "areas": ";".join(sorted({area for episode in episodes for area in episode["areas"].split(";") if area})),
+        "explored_locations_mean": mean("explored_locations"),
+        "deaths_mean": mean("deaths"),
+        "enemies_killed_mean": mean("enemies_killed"),
+        "small_keys_mean": mean("small_keys"),
+        "length_mean": mean("length"),
+    }
+    for name in MILESTONES:
+        steps = [episode[f"steps_to_{name}"] for episode in episodes if episode[f"steps_to_{name}"] is not None]
+        summary[f"{name}_reached"] = len(steps) / len(episodes)
+        summary[f"steps_to_{name}_median"] = float(np.median(steps)) if steps else None
+    return summary
@@ -0,0 +1,119 @@
+from pygba.pygba import PyGBA
+from pygba.action_log import ActionLogReader, highlight_windows, replay_episode
+from pathlib import Path
+import multiprocessing as mp
+import numpy as np
+import mediapy as media
+import mgba.log
+import csv
+import os
+
+# Highlight clips: windows of steps around game wrapper events (area discoveries, the sword, deaths, small keys),
+# re-simulated from an action log starting at the nearest keyframe and written as short videos by background processes.
+
+HIGHLIGHT_EVENTS = ["area_discovery", "sword", "death", "small_key"]
+CLIP_FIELDS = ["rank", "episode", "start", "stop", "events", "path", "error"]
+
+# per render worker: the emulator (ROM loaded once), the log reader and the output settings
+_worker = {}
+
+
+def find_clips(reader, events=HIGHLIGHT_EVENTS, before=50, after=25, skip=()):
+    """Highlight windows of the indexed episodes of an ActionLogReader (except (rank, episode) pairs in skip)."""
+    by_episode = {}
+    for row in reader.events:
+        if row["event"] in events:
+            by_episode.setdefault((row["rank"], row["episode"]), []).append((row["step"], row["event"]))
+    clips = []
+    for entry in reader.episodes:
+        key = (entry["rank"], entry["episode"])
+        if key in skip or key not in by_episode:
+            continue
+        for window in highlight_windows(by_episode[key], entry["length"], before, after):
+            clips.append({"rank": entry["rank"], "episode": entry["episode"], **window})
+    return clips
+
+
+def init_render_worker(rom_path, log_path, output_dir, every_frame, nice):
+    mgba.log.silence()
+    # rendering runs next to training: only take CPU time the env workers and the learner leave
+    if nice:
+        os.nice(nice)
+    _worker.update(
+        gba=PyGBA.load(rom_path),
+        reader=ActionLogReader(log_path),
+        output_dir=Path(output_dir),
+        every_frame=every_frame,
+    )
+
+
+def render_clip(clip):
+    """Renders one clip in a render worker; returns a CLIP_FIELDS row (with the error instead of raising)."""
+    rank, episode, start, stop = clip["rank"], clip["episode"], clip["start"], clip["stop"]
+    name = f"rank_{rank:02d}_episode_{episode:06d}_steps_{start}-{stop}_{'+'.join(dict.fromkeys(clip['events']))}"
+    path = _worker["output_dir"] / f"{name}.mp4"
+    row = {"rank": rank, "episode": episode, "start": start, "stop": stop, "events": ";".join(clip["events"]),
+           "path": str(path), "error": None}
+    reader = _worker["reader"]
+    if not any(entry["rank"] == rank and entry["episode"] == episode for entry in reader.episodes):
+        # logged after the worker started
+        reader = _worker["reader"] = ActionLogReader(reader.path)
+    video = None
+    try:
+        log = reader.load(rank, episode)
+        fps = 60 if _worker["every_frame"] else 60 / max(float(np.mean(log["frames"][start:stop])), 1.0)
+        for step in replay_episode(_worker["gba"], log, every_frame=_worker["every_frame"], start=start, stop=stop):
+            if video is None:
+                video = media.VideoWriter(str(path), step["frames"][0].shape[:2], fps=fps)
+                video.__enter__()
+            for frame in step["frames"]:
+                video.add_image(frame)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if video is not None:
+            video.close()
+    return row
+
+
+class HighlightRenderer:
+    """
+    Renders highlight clips of an action log directory in a process pool while the caller goes on;
+    finished clips are listed in output_dir/clips.csv.
+    """
+    def __init__(self, rom_path, log_path, output_dir, workers=1, every_frame=True, nice=10, start_method="forkserver"):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.output_dir / "clips.csv"
+        if not self.index_path.exists():
+            with open(self.index_path, "w", newline="") as f:
+                csv.writer(f).writerow(CLIP_FIELDS)
+        self.pool = mp.get_context(start_method).Pool(
+            workers, initializer=init_render_worker,
+            initargs=(str(rom_path), str(log_path), str(self.output_dir), every_frame, nice),
+        )
+        self.pending = []
+        self.submitted = 0
+
+    def submit(self, clips):
+        self.pending.extend(self.pool.apply_async(render_clip, (clip,)) for clip in clips)
+        self.submitted += len(clips)
+
+    def collect(self):
+        """Rows of the clips finished since the last call (also appended to clips.csv)."""
+        ready = [result.ready() for result in self.pending]
+        rows = [result.get() for result, done in zip(self.pending, ready) if done]
+        self.pending = [result for result, done in zip(self.pending, ready) if not done]
+        if rows:
+            with open(self.index_path, "a", newline="") as f:
+                csv.DictWriter(f, fieldnames=CLIP_FIELDS).writerows(rows)
+        return rows
+
+    def close(self, wait=True):
+        """Stops the pool, after rendering the submitted clips with wait (else they are dropped)."""
+        if wait:
+            self.pool.close()
+        else:
+            self.pool.terminate()
+        self.pool.join()
+        return self.collect() if wait else []
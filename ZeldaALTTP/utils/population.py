@@ -0,0 +1,212 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from pygba.game_wrappers.zelda_alttp import ZeldaALTTP
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import inspect
+import time
+import json
+import csv
+
+# reward weights a member may set: the keyword arguments of the Zelda game wrapper (and their defaults)
+DEFAULT_REWARD_WEIGHTS = {
+    name: parameter.default for name, parameter in inspect.signature(ZeldaALTTP.__init__).parameters.items() if name != "self"
+}
+REWARD_WEIGHTS = tuple(DEFAULT_REWARD_WEIGHTS)
+# PPO settings a member may set; the continuous ones are also perturbed on explore
+PPO_HYPERPARAMS = ("learning_rate", "ent_coef", "gamma", "gae_lambda", "clip_range", "vf_coef", "n_steps", "batch_size", "n_epochs")
+PERTURBED_HYPERPARAMS = ("learning_rate", "ent_coef")
+
+SLICE_FIELDS = ["time", "slice", "member", "num_timesteps", "slice_steps", "slice_s", "steps_per_sec", "wall_s", "fitness", "episodes"]
+EVENT_FIELDS = ["time", "slice", "member", "source", "source_fitness", "member_fitness", "weights", "hyperparams"]
+
+
+def split_member_config(member_config):
+    """
+    Splits a [Population] members entry into (reward weights, PPO hyperparameters); unknown keys raise.
+    The weights are complete (wrapper defaults for the ones not given), since the envs are shared between members.
+    """
+    unknown = set(member_config) - set(REWARD_WEIGHTS) - set(PPO_HYPERPARAMS)
+    if unknown:
+        raise ValueError(f"Unknown population member settings {sorted(unknown)} "
+                         f"(reward weights: {REWARD_WEIGHTS}, PPO: {PPO_HYPERPARAMS})")
+    weights = dict(DEFAULT_REWARD_WEIGHTS, **{name: value for name, value in member_config.items() if name in REWARD_WEIGHTS})
+    hyperparams = {name: value for name, value in member_config.items() if name in PPO_HYPERPARAMS}
+    return weights, hyperparams
+
+
+class FitnessTracker(BaseCallback):
+    """
+    Collects a member's fitness: the final value of info[fitness_key] (its length for collections, e.g. discovered_areas)
+    of every episode that ends while the member is stepping the shared envs. Unlike the reward, this is comparable
+    between members with different reward weights.
+    """
+    def __init__(self, fitness_key="explored_locations", window=20, verbose=0):
+        super().__init__(verbose)
+        self.fitness_key = fitness_key
+        self.values = deque(maxlen=window)
+
+    def _on_step(self):
+        for done, info in zip(self.locals["dones"], self.locals["infos"]):
+            if done and self.fitness_key in info:
+                value = info[self.fitness_key]
+                self.values.append(len(value) if hasattr(value, "__len__") else float(value))
+        return True
+
+    @property
+    def fitness(self):
+        return float(np.mean(self.values)) if self.values else None
+
+
+class Member:
+    """One learner of the population: its model, reward weights, fitness and the envs' savestates of its episodes."""
+    def __init__(self, index, model, weights, hyperparams, fitness_key, fitness_window, member_dir):
+        self.index = index
+        self.model = model
+        self.weights = dict(weights)
+        self.hyperparams = dict(hyperparams)
+        self.tracker = FitnessTracker(fitness_key, fitness_window)
+        self.member_dir = Path(member_dir)
+        self.env_states = None
+        self.wall_time = 0.0
+
+    @property
+    def fitness(self):
+        return self.tracker.fitness
+
+    def describe(self):
+        return dict(member=self.index, num_timesteps=self.model.num_timesteps, fitness=self.fitness,
+                    weights=self.weights, hyperparams=self.hyperparams)
+
+
+class PopulationTrainer:
+    """
+    Trains several PPO members on one shared VecEnv by time slicing:
+    - the scheduler picks the member with the least pool time ("time") or the fewest samples ("steps") so far
+    - a slice restores the member's reward weights and env savestates (so each member continues its own episodes),
+      runs slice_rollouts rollouts + updates, and saves the env states again
+    - every exploit_interval rounds (one round = one slice per member), the bottom exploit_fraction of members by
+      fitness copy policy + optimizer state from a random top member and take its weights and learning rate / entropy
+      coefficient, each multiplied by a random perturb factor (PBT exploit / explore; reward_scale is kept)
+    Slices and exploit events are logged to population_dir/slices.csv and events.csv.
+    """
+    def __init__(self, env, members, population_dir, schedule="time", slice_rollouts=1, exploit_interval=0,
+                 exploit_fraction=0.25, perturb_factors=(0.8, 1.2), seed=None):
+        self.env = env
+        self.members = members
+        self.population_dir = Path(population_dir)
+        self.schedule = schedule
+        self.slice_rollouts = slice_rollouts
+        self.exploit_interval = exploit_interval
+        self.exploit_fraction = exploit_fraction
+        self.perturb_factors = list(perturb_factors)
+        self.rng = np.random.default_rng(seed)
+        self.slices = 0
+        self.start_time = None
+
+    def pick(self):
+        if self.schedule == "steps":
+            return min(self.members, key=lambda member: member.model.num_timesteps)
+        return min(self.members, key=lambda member: member.wall_time)
+
+    def run(self, total_timesteps):
+        """Train until the members' samples add up to total_timesteps."""
+        self.start_time = time.perf_counter()
+        while sum(member.model.num_timesteps for member in self.members) < total_timesteps:
+            member = self.pick()
+            self.run_slice(member)
+            self.slices += 1
+            if self.exploit_interval and self.slices % (self.exploit_interval * len(self.members)) == 0:
+                self.exploit_and_explore()
+
+    def run_slice(self, member):
+        self.env.env_method("configure_wrapper", **member.weights)
+        if member.env_states is not None:
+            for i, state in enumerate(member.env_states):
+                self.env.env_method("set_state", state, indices=[i])
+        # another member has stepped the envs since: learn() has to reset them, which restores this member's states
+        member.model._last_obs = None
+        steps_before = member.model.num_timesteps
+        start = time.perf_counter()
+        member.model.learn(
+            total_timesteps=self.slice_rollouts * member.model.n_steps * self.env.num_envs,
+            callback=member.tracker,
+            reset_num_timesteps=False,
+        )
+        elapsed = time.perf_counter() - start
+        member.wall_time += elapsed
+        member.env_states = self.env.env_method("get_state")
+        slice_steps = member.model.num_timesteps - steps_before
+        self._log("slices.csv", SLICE_FIELDS, {
+            "slice": self.slices,
+            "member": member.index,
+            "num_timesteps": member.model.num_timesteps,
+            "slice_steps": slice_steps,
+            "slice_s": elapsed,
+            "steps_per_sec": slice_steps / elapsed,
+            "wall_s": time.perf_counter() - self.start_time,
+            "fitness": member.fitness,
+            "episodes": len(member.tracker.values),
+        })
+        fitness = f"{member.fitness:.2f}" if member.fitness is not None else "n/a"
+        print(f"[slice {self.slices}] member {member.index}: {member.model.num_timesteps} steps, "
+              f"{slice_steps / elapsed:.0f} steps/s, fitness {fitness}")
+
+    def exploit_and_explore(self):
+        ranked = sorted((member for member in self.members if member.fitness is not None), key=lambda member: member.fitness)
+        count = max(1, int(len(ranked) * self.exploit_fraction))
+        if len(ranked) < 2 * count:
+            return
+        bottom, top = ranked[:count], ranked[-count:]
+        for member in bottom:
+            source = top[self.rng.integers(len(top))]
+            member.model.policy.load_state_dict(source.model.policy.state_dict())
+            member.model.policy.optimizer.load_state_dict(source.model.policy.optimizer.state_dict())
+            member.weights = {
+                name: value if name == "reward_scale" else float(value * self.rng.choice(self.perturb_factors))
+                for name, value in source.weights.items()
+            }
+            for name in PERTURBED_HYPERPARAMS:
+                value = source.hyperparams.get(name, getattr(source.model, name))
+                if isinstance(value, float):
+                    member.hyperparams[name] = float(value * self.rng.choice(self.perturb_factors))
+            self.apply_hyperparams(member)
+            self._log("events.csv", EVENT_FIELDS, {
+                "slice": self.slices,
+                "member": member.index,
+                "source": source.index,
+                "source_fitness": source.fitness,
+                "member_fitness": member.fitness,
+                "weights": json.dumps(member.weights),
+                "hyperparams": json.dumps(member.hyperparams),
+            })
+            print(f"Exploit: member {member.index} (fitness {member.fitness:.2f}) <- member {source.index} "
+                  f"(fitness {source.fitness:.2f}), perturbed hyperparams {member.hyperparams}")
+            # fitness so far belongs to the replaced policy
+            member.tracker.values.clear()
+
+    @staticmethod
+    def apply_hyperparams(member):
+        model = member.model
+        if "learning_rate" in member.hyperparams:
+            model.learning_rate = member.hyperparams["learning_rate"]
+            model._setup_lr_schedule()
+        if "ent_coef" in member.hyperparams:
+            model.ent_coef = member.hyperparams["ent_coef"]
+
+    def save(self, suffix="final"):
+        for member in self.members:
+            path = member.member_dir / "models" / f"member_model_{suffix}.zip"
+            member.model.save(path)
+        with open(self.population_dir / "population.json", "w") as f:
+            json.dump([member.describe() for member in self.members], f, indent=2)
+
+    def _log(self, name, fields, row):
+        path = self.population_dir / name
+        new_file = not path.exists()
+        with open(path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(dict(row, time=datetime.now().isoformat(timespec="seconds")))
@@ -0,0 +1,30 @@
+from stable_baselines3.common.vec_env import VecEnvWrapper
+from pygba.profiling import PhaseProfiler
+
+
+class ProfiledVecEnv(VecEnvWrapper):
+    """
+    Times the VecEnv calls made by the learner (step = dispatch + slowest worker + IPC, reset).
+    Together with the per-worker env phases this separates worker compute from IPC and learner-side overhead.
+    """
+    def __init__(self, venv):
+        super().__init__(venv)
+        self.profiler = PhaseProfiler()
+
+    def reset(self):
+        with self.profiler.phase("vec_reset"):
+            return self.venv.reset()
+
+    def step_async(self, actions):
+        self._step_timer = self.profiler.phase("vec_step")
+        self._step_timer.__enter__()
+        self.venv.step_async(actions)
+
+    def step_wait(self):
+        result = self.venv.step_wait()
+        self._step_timer.__exit__()
+        return result
+
+    def worker_profiles(self):
+        """Phase summaries of every worker env since the last call."""
+        return self.venv.env_method("pop_profile")
@@ -0,0 +1,161 @@
+from stable_baselines3.common.callbacks import BaseCallback
+from ZeldaALTTP.utils.checkpointing import snapshot_model, write_model_zip, between_updates
+from pathlib import Path
+import time
+import torch as th
+import numpy as np
+import pickle
+import random
+import copy
+import io
+import os
+
+RESUME_DIR = "resume"
+RESUME_FILE = "resume.pkl"
+# written next to the bundle once training ran to the end, so the next launch starts a new session instead
+COMPLETED_FILE = "completed"
+BUNDLE_VERSION = 1
+
+
+def resume_callbacks(callbacks):
+    """Callbacks whose state goes into the bundle, keyed by class name."""
+    return {type(callback).__name__: callback for callback in callbacks if hasattr(callback, "state_dict")}
+
+
+def snapshot_resume_bundle(model, env, callbacks=(), include_model=True):
+    """
+    In-memory snapshot of everything needed to continue a run where it stopped: the model (policy + optimizer,
+    see snapshot_model), every env's get_state (raw savestate, episode progress, wrapper tables, env RNG),
+    callback state_dicts and the learner's Python / NumPy / torch RNG states. write_resume_bundle stores it.
+    Without include_model, "model" is left for the caller to fill in with snapshot_model.
+    """
+    return {
+        "version": BUNDLE_VERSION,
+        "num_timesteps": model.num_timesteps,
+        "num_envs": env.num_envs,
+        "model": snapshot_model(model) if include_model else None,
+        "envs": env.env_method("get_state"),
+        # copied, the live callbacks keep changing while a background thread writes the bundle
+        "callbacks": {name: copy.deepcopy(callback.state_dict()) for name, callback in resume_callbacks(callbacks).items()},
+        "rng": {
+            "python": random.getstate(),
+            "numpy": np.random.get_state(),
+            "torch": th.get_rng_state(),
+            "cuda": th.cuda.get_rng_state_all() if th.cuda.is_available() else None,
+        },
+    }
+
+
+def write_resume_bundle(path, bundle):
+    """Serialize a snapshot_resume_bundle result into one pickle (atomically), the model as SB3 zip bytes."""
+    model_file = io.BytesIO()
+    write_model_zip(model_file, *bundle["model"])
+    bundle = dict(bundle, model=model_file.getvalue())
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def save_resume_bundle(path, model, env, callbacks=()):
+    """Snapshot and write a resume bundle right away."""
+    return write_resume_bundle(path, snapshot_resume_bundle(model, env, callbacks))
+
+
+def mark_completed(session_dir):
+    """Flags the session's resume bundle as belonging to a run that finished (see get_latest_resume_bundle)."""
+    resume_dir = Path(session_dir) / RESUME_DIR
+    if resume_dir.is_dir():
+        (resume_dir / COMPLETED_FILE).touch()
+
+
+def load_resume_bundle(path):
+    with open(path, "rb") as f:
+        bundle = pickle.load(f)
+    if bundle.get("version") != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported resume bundle version {bundle.get('version')} in {path}")
+    return bundle
+
+
+def bundle_model_file(bundle):
+    """File-like model zip for PPO.load."""
+    return io.BytesIO(bundle["model"])
+
+
+def apply_resume_bundle(bundle, model, callbacks=()):
+    """
+    Queue the env states (restored on the next reset, i.e. when learn() starts) and load callback and RNG state.
+    Env and callback state are skipped if the number of envs changed; returns whether they were applied.
+    """
+    env = model.get_env()
+    # with AsyncPPO the model snapshot is taken a little after the env states (see ResumeBundleCallback)
+    model.num_timesteps = bundle["num_timesteps"]
+    # the saved _last_obs would let learn(reset_num_timesteps=False) skip the reset that restores the env states
+    model._last_obs = None
+    rng = bundle["rng"]
+    random.setstate(rng["python"])
+    np.random.set_state(rng["numpy"])
+    th.set_rng_state(rng["torch"])
+    if rng["cuda"] is not None and th.cuda.is_available() and len(rng["cuda"]) == th.cuda.device_count():
+        th.cuda.set_rng_state_all(rng["cuda"])
+
+    if bundle["num_envs"] != env.num_envs:
+        print(f"Resume bundle has {bundle['num_envs']} envs but {env.num_envs} are running: "
+              f"only the model and RNG state are restored")
+        return False
+    for i, state in enumerate(bundle["envs"]):
+        env.env_method("set_state", state, indices=[i])
+    for name, callback in resume_callbacks(callbacks).items():
+        if name in bundle["callbacks"]:
+            callback.load_state_dict(bundle["callbacks"][name])
+    return True
+
+
+class ResumeBundleCallback(BaseCallback):
+    """
+    Saves a resume bundle to session_dir/resume/resume.pkl every save_freq rollouts, at the start of a rollout
+    (right after an update, so weights, optimizer and env states belong together). With a BackgroundCheckpointer,
+    training only waits for the in-memory snapshot; pickling and writing happen on its thread. With AsyncPPO the
+    actor only snapshots envs and callbacks; the learner adds the model before its next update (between_updates).
+    """
+    def __init__(self, session_dir, callbacks=(), save_freq=1, checkpointer=None, verbose=0):
+        super().__init__(verbose)
+        self.path = Path(session_dir) / RESUME_DIR / RESUME_FILE
+        self.callbacks = list(callbacks)
+        self.save_freq = save_freq
+        self.checkpointer = checkpointer
+        self.rollouts = 0
+        self.stall = None
+
+    def _on_rollout_start(self):
+        if self.rollouts > 0 and self.rollouts % self.save_freq == 0:
+            start = time.perf_counter()
+            bundle = snapshot_resume_bundle(self.model, self.training_env, self.callbacks, include_model=False)
+            stall = time.perf_counter() - start
+            between_updates(self.model, lambda: self._save(bundle, stall))
+        self.rollouts += 1
+
+    def _save(self, bundle, stall):
+        start = time.perf_counter()
+        bundle["model"] = snapshot_model(self.model)
+        if self.checkpointer is not None:
+            stall += self.checkpointer.submit(self.path, write_resume_bundle, (bundle,), bundle["num_timesteps"], start)
+        else:
+            write_resume_bundle(self.path, bundle)
+            stall += time.perf_counter() - start
+        self.stall = stall
+        if self.verbose >= 1:
+            print(f"Resume bundle saved to: {self.path} ({bundle['num_timesteps']} steps)")
+
+    def _on_rollout_end(self):
+        if self.stall is not None:
+            self.logger.record("checkpoint/resume_stall_ms", 1000 * self.stall)
+            self.stall = None
+
+    def _on_step(self):
+        return True
@@ -0,0 +1,113 @@
+from stable_baselines3.common.buffers import BaseBuffer, RolloutBuffer, DictRolloutBuffer
+from stable_baselines3.common.type_aliases import RolloutBufferSamples, DictRolloutBufferSamples
+from gymnasium import spaces
+import numpy as np
+
+# Per-step arrays that are small enough to be flattened the usual way
+_SMALL_TENSOR_NAMES = ["actions", "values", "log_probs", "advantages", "returns"]
+
+
+def _reset_small_arrays(buffer):
+    buffer.actions = np.zeros((buffer.buffer_size, buffer.n_envs, buffer.action_dim), dtype=buffer.action_space.dtype)
+    for name in ["rewards", "returns", "episode_starts", "values", "log_probs", "advantages"]:
+        setattr(buffer, name, np.zeros((buffer.buffer_size, buffer.n_envs), dtype=np.float32))
+    buffer.generator_ready = False
+    BaseBuffer.reset(buffer)
+
+
+def _iter_minibatches(buffer, batch_size):
+    assert buffer.full, ""
+    total = buffer.buffer_size * buffer.n_envs
+    indices = np.random.permutation(total)
+    if not buffer.generator_ready:
+        for name in _SMALL_TENSOR_NAMES:
+            buffer.__dict__[name] = buffer.swap_and_flatten(buffer.__dict__[name])
+        buffer.generator_ready = True
+
+    # Return everything, don't create minibatches
+    if batch_size is None:
+        batch_size = total
+
+    start_idx = 0
+    while start_idx < total:
+        yield buffer._get_samples(indices[start_idx : start_idx + batch_size])
+        start_idx += batch_size
+
+
+def _unflatten(buffer, batch_inds):
+    # flat index i is env i // buffer_size at step i % buffer_size (same order as swap_and_flatten)
+    env_inds, step_inds = np.divmod(batch_inds, buffer.buffer_size)
+    return step_inds, env_inds
+
+
+class CompactRolloutBuffer(RolloutBuffer):
+    """
+    RolloutBuffer that stores observations in the observation space dtype (uint8 for frames) instead of float32.
+    - The observation storage is allocated once and reused across rollouts.
+    - Observations are never swapped/flattened as a whole; each minibatch is gathered by (step, env) index,
+      so the update doesn't hold a second copy of the rollout.
+    Minibatches stay uint8 and are normalized on the fly by the policy's preprocessing (obs / 255 for images).
+    """
+    def reset(self) -> None:
+        shape = (self.buffer_size, self.n_envs, *self.obs_shape)
+        # reuse the observation storage, every slot is overwritten before it is read
+        if getattr(self, "observations", None) is None or self.observations.shape != shape:
+            self.observations = np.zeros(shape, dtype=self.observation_space.dtype)
+        _reset_small_arrays(self)
+
+    def get(self, batch_size=None):
+        yield from _iter_minibatches(self, batch_size)
+
+    def _get_samples(self, batch_inds, env=None):
+        step_inds, env_inds = _unflatten(self, batch_inds)
+        data = (
+            self.observations[step_inds, env_inds],
+            self.actions[batch_inds].astype(np.float32, copy=False),
+            self.values[batch_inds].flatten(),
+            self.log_probs[batch_inds].flatten(),
+            self.advantages[batch_inds].flatten(),
+            self.returns[batch_inds].flatten(),
+        )
+        return RolloutBufferSamples(*tuple(map(self.to_torch, data)))
+
+
+class CompactDictRolloutBuffer(DictRolloutBuffer):
+    """DictRolloutBuffer counterpart of CompactRolloutBuffer (e.g. for screen + RAM observations)."""
+    def reset(self) -> None:
+        observations = getattr(self, "observations", None) or {}
+        self.observations = {}
+        for key, obs_input_shape in self.obs_shape.items():
+            shape = (self.buffer_size, self.n_envs, *obs_input_shape)
+            obs = observations.get(key)
+            if obs is None or obs.shape != shape:
+                obs = np.zeros(shape, dtype=self.observation_space[key].dtype)
+            self.observations[key] = obs
+        _reset_small_arrays(self)
+
+    def get(self, batch_size=None):
+        yield from _iter_minibatches(self, batch_size)
+
+    def _get_samples(self, batch_inds, env=None):
+        step_inds, env_inds = _unflatten(self, batch_inds)
+        return DictRolloutBufferSamples(
+            observations={key: self.to_torch(obs[step_inds, env_inds]) for (key, obs) in self.observations.items()},
+            actions=self.to_torch(self.actions[batch_inds].astype(np.float32, copy=False)),
+            old_values=self.to_torch(self.values[batch_inds].flatten()),
+            old_log_prob=self.to_torch(self.log_probs[batch_inds].flatten()),
+            advantages=self.to_torch(self.advantages[batch_inds].flatten()),
+            returns=self.to_torch(self.returns[batch_inds].flatten()),
+        )
+
+
+def compact_rollout_buffer_class(observation_space):
+    """Pick the compact rollout buffer matching the observation space (pass as PPO(rollout_buffer_class=...))."""
+    if isinstance(observation_space, spaces.Dict):
+        return CompactDictRolloutBuffer
+    return CompactRolloutBuffer
+
+
+def rollout_buffer_nbytes(buffer):
+    """Size of the observation storage of a rollout buffer in bytes."""
+    if isinstance(buffer.observations, dict):
+        return sum(obs.nbytes for obs in buffer.observations.values())
+    return buffer.observations.nbytes
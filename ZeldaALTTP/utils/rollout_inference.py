@@ -0,0 +1,143 @@
+from stable_baselines3 import PPO
+from gymnasium import spaces
+import torch as th
+import contextlib
+import warnings
+import copy
+import time
+
+INFERENCE_BACKENDS = ["eager", "torchscript", "compile"]
+
+
+class _PolicyHead(th.nn.Module):
+    """Action logits and values of an ActorCriticPolicy as a single traceable forward."""
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+
+    def forward(self, obs):
+        features = self.policy.extract_features(obs)
+        if self.policy.share_features_extractor:
+            latent_pi, latent_vf = self.policy.mlp_extractor(features)
+        else:
+            pi_features, vf_features = features
+            latent_pi = self.policy.mlp_extractor.forward_actor(pi_features)
+            latent_vf = self.policy.mlp_extractor.forward_critic(vf_features)
+        return self.policy.action_net(latent_pi), self.policy.value_net(latent_vf)
+
+
+class RolloutInference:
+    """
+    Optimized CPU copy of a policy used to pick actions while collecting rollouts.
+    - backend "torchscript": traced, frozen and optimize_for_inference'd; re-exported lazily after each sync.
+    - backend "compile": torch.compile of the copy; syncs copy weights in place.
+    - backend "eager": plain PyTorch copy (baseline).
+    Calling it has the same contract as ActorCriticPolicy.forward: (actions, values, log_probs).
+    Only discrete action spaces are supported. Per-step latency is kept for reporting.
+    """
+    def __init__(self, policy, backend="torchscript", device="cpu"):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"backend must be one of {INFERENCE_BACKENDS} (got {backend})")
+        if not isinstance(policy.action_space, spaces.Discrete):
+            raise ValueError("RolloutInference only supports Discrete action spaces")
+        self.backend = backend
+        self.device = th.device(device)
+        self.policy = copy.deepcopy(policy).to(self.device)
+        self.policy.set_training_mode(False)
+        self._head = _PolicyHead(self.policy).eval()
+        self._module = self._head
+        if backend == "compile":
+            self._module = th.compile(self._head)
+        self._needs_export = backend == "torchscript"
+        self.export_time = 0.0
+        self._latencies = []
+
+    def sync(self, policy):
+        """Copy the latest weights from the learner's policy."""
+        with th.no_grad():
+            self.policy.load_state_dict(policy.state_dict())
+        # frozen TorchScript modules have the weights baked in, so they are re-exported on the next call
+        self._needs_export = self.backend == "torchscript"
+
+    def _export(self, obs):
+        start = time.perf_counter()
+        try:
+            # newer torch marks the TorchScript API deprecated; don't repeat that on every re-export
+            with th.no_grad(), warnings.catch_warnings():
+                warnings.simplefilter("ignore", FutureWarning)
+                traced = th.jit.trace(self._head, (obs,), strict=False)
+                self._module = th.jit.optimize_for_inference(th.jit.freeze(traced.eval()))
+        except Exception as e:
+            warnings.warn(f"TorchScript export of the policy failed, falling back to eager inference: {e}")
+            self.backend = "eager"
+            self._module = self._head
+        self._needs_export = False
+        self.export_time = time.perf_counter() - start
+
+    def __call__(self, obs):
+        start = time.perf_counter()
+        if isinstance(obs, dict):
+            obs = {key: o.to(self.device) for key, o in obs.items()}
+        else:
+            obs = obs.to(self.device)
+        with th.no_grad():
+            if self._needs_export:
+                self._export(obs)
+            logits, values = self._module(obs)
+            distribution = th.distributions.Categorical(logits=logits)
+            actions = distribution.sample()
+            log_probs = distribution.log_prob(actions)
+        self._latencies.append(time.perf_counter() - start)
+        return actions, values, log_probs
+
+    @contextlib.contextmanager
+    def patch(self, policy):
+        """Route policy(obs) through this copy (PPO.collect_rollouts calls the policy's forward for actions)."""
+        policy.forward = self
+        try:
+            yield
+        finally:
+            del policy.forward
+
+    def pop_latency_ms(self):
+        """Mean per-step inference latency in ms since the last call (None if there were no steps)."""
+        latencies, self._latencies = self._latencies, []
+        if not latencies:
+            return None
+        return 1000 * sum(latencies) / len(latencies)
+
+    def record(self, logger):
+        latency = self.pop_latency_ms()
+        if latency is not None:
+            logger.record("inference/step_latency_ms", latency)
+            logger.record("inference/export_ms", 1000 * self.export_time)
+        return latency
+
+
+class InferencePPO(PPO):
+    """PPO that collects rollouts with a RolloutInference copy of the policy, synced after every update."""
+    def __init__(self, *args, inference_backend="torchscript", **kwargs):
+        self.inference_backend = inference_backend
+        self.rollout_inference = None
+        super().__init__(*args, **kwargs)
+
+    def _excluded_save_params(self):
+        return super()._excluded_save_params() + ["rollout_inference"]
+
+    def _setup_model(self):
+        super()._setup_model()
+        self.rollout_inference = RolloutInference(self.policy, self.inference_backend)
+
+    def _setup_learn(self, *args, **kwargs):
+        # the copy is made in _setup_model, before PPO.load / set_parameters / resumes load the real weights
+        self.rollout_inference.sync(self.policy)
+        return super()._setup_learn(*args, **kwargs)
+
+    def collect_rollouts(self, env, callback, rollout_buffer, n_rollout_steps):
+        with self.rollout_inference.patch(self.policy):
+            return super().collect_rollouts(env, callback, rollout_buffer, n_rollout_steps)
+
+    def train(self):
+        self.rollout_inference.record(self.logger)
+        super().train()
+        self.rollout_inference.sync(self.policy)
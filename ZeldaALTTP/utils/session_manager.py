@@ -37,6 +37,31 @@ def get_latest_model_file(models_dir):
     candidates.sort(key=os.path.getctime, reverse=True)
     return candidates[0]
 
+def get_latest_resume_bundle(model_dir, model_path=None):
+    """
+    Newest session's resume/resume.pkl in model_dir (None if there is none).
+    Bundles of sessions older than the one model_path was saved in are ignored, as that model is further along.
+    A session that finished (final_model.zip or a completed marker) has nothing to resume: the next run starts
+    a new session from its model, so neither its bundle nor older ones are returned.
+    """
+    session_dirs = [d for d in model_dir.iterdir() if d.is_dir() and d.name.startswith('session_')]
+    def session_sort_key(d):
+        try:
+            return float(d.name.split('_')[-1])
+        except Exception:
+            return 0
+    session_dirs.sort(key=session_sort_key, reverse=True)
+    model_session = Path(model_path).resolve().parent.parent if model_path is not None else None
+    for session_dir in session_dirs:
+        if (session_dir / 'models' / 'final_model.zip').exists() or (session_dir / 'resume' / 'completed').exists():
+            return None
+        bundle = session_dir / 'resume' / 'resume.pkl'
+        if bundle.exists():
+            return bundle
+        if model_session is not None and session_dir.resolve() == model_session:
+            return None
+    return None
+
 def get_latest_session_and_model(base_sessions_dir):
     model_dir = get_latest_model_dir(base_sessions_dir)
     if not model_dir:
@@ -103,6 +128,8 @@ def prepare_new_session_from_latest_model(base_sessions_dir, model_config, gener
             raise FileNotFoundError('No session directories found in latest model dir.')
         models_dir = latest_session_dir / 'models'
         model_path = get_latest_model_file(models_dir)
+    # Full-state resume bundle of an earlier session, unless the model file comes from a later session
+    resume_path = get_latest_resume_bundle(model_dir, model_path)
     # Create a new session directory in the same model dir
     session_num = get_next_session_number(model_dir)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -151,6 +178,7 @@ def prepare_new_session_from_latest_model(base_sessions_dir, model_config, gener
     return {
         'session_dir': session_dir,
         'model_path': model_path,
+        'resume_path': resume_path,
         'override_model': override_model
     }
 
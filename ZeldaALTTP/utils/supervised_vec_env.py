@@ -0,0 +1,280 @@
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+from stable_baselines3.common.vec_env.subproc_vec_env import _worker, _stack_obs
+from multiprocessing.connection import wait
+from datetime import datetime
+from pathlib import Path
+import multiprocessing as mp
+import numpy as np
+import time
+
+
+# env_method calls that configure a worker, replayed to it after a respawn; keyed by the setting they change, so a
+# later call replaces an earlier one of the same setting and a stop_* call drops its start_*
+REPLAYED_METHODS = {
+    "start_action_log": "action_log",
+    "start_recording": "recording",
+    "start_sampling": "sampling",
+}
+CANCELLING_METHODS = {
+    "stop_action_log": "action_log",
+    "stop_recording": "recording",
+}
+
+
+class WorkerFailure(Exception):
+    """A worker did not answer in time, or its process / pipe is gone."""
+
+
+class SupervisedSubprocVecEnv(SubprocVecEnv):
+    """
+    SubprocVecEnv that survives single-worker faults:
+    - every step / reset waits at most step_timeout / reset_timeout seconds per worker
+    - a worker that crashed (closed pipe), hung (timeout) or raised is killed and respawned from its env_fn
+      (the same thunk, so ROM, initial state and CPU pinning are set up again) and reset
+    - the lost episode ends with a substitute transition: reward 0, done, truncated (so PPO bootstraps from the value
+      of the last observation the worker delivered), info["worker_restarted"] = True
+    - restarts are counted per worker in restart_counts and queued in restart_events (see WatchdogCallback);
+      more than max_restarts restarts of one worker (0 = unlimited) raise, so a deterministic crash can't loop forever
+    - env_method / set_attr / get_attr are supervised the same way (a failed worker answers None); successful calls
+      that configure a worker (configure_wrapper, set_attr, REPLAYED_METHODS, a set_state not yet consumed by a reset)
+      are replayed to it after a respawn, so it continues with the settings it had
+    """
+    def __init__(self, env_fns, start_method=None, step_timeout=60.0, reset_timeout=300.0, max_restarts=10):
+        self.env_fns = list(env_fns)
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        self.ctx = mp.get_context(start_method)
+        self.step_timeout = step_timeout
+        self.reset_timeout = reset_timeout
+        self.max_restarts = max_restarts
+        self.restart_counts = [0] * len(self.env_fns)
+        self.restart_events = []
+        super().__init__(self.env_fns, start_method=start_method)
+        self.remotes = list(self.remotes)
+        self._last_obs = [None] * self.num_envs
+        self._failed = set()
+        # per worker: setting -> (command, data) to replay after a respawn, and the set_state its next reset restores
+        self._settings = [{} for _ in range(self.num_envs)]
+        self._pending_states = [None] * self.num_envs
+
+    def step_async(self, actions):
+        self._failed = set()
+        for i, (remote, action) in enumerate(zip(self.remotes, actions)):
+            try:
+                remote.send(("step", action))
+            except (BrokenPipeError, EOFError, OSError):
+                self._failed.add(i)
+        self.waiting = True
+
+    def step_wait(self):
+        results = self._gather(range(self.num_envs), self.step_timeout, self._failed)
+        self.waiting = False
+        self.reset_infos = [None] * self.num_envs
+        obs, rews, dones, infos = [], [], [], []
+        for i, result in enumerate(results):
+            if isinstance(result, WorkerFailure):
+                observation, reset_info = self._restart(i, "step", result)
+                info = {
+                    "terminal_observation": self._last_obs[i] if self._last_obs[i] is not None else observation,
+                    "TimeLimit.truncated": True,
+                    "worker_restarted": True,
+                }
+                result = (observation, 0.0, True, info, reset_info)
+            observation, reward, done, info, self.reset_infos[i] = result
+            if done:
+                # the worker reset itself, which consumed a pending set_state
+                self._pending_states[i] = None
+            self._last_obs[i] = observation
+            obs.append(observation)
+            rews.append(reward)
+            dones.append(done)
+            infos.append(info)
+        return _stack_obs(obs, self.observation_space), np.stack(rews), np.stack(dones), infos
+
+    def reset(self):
+        failed = set()
+        for i, remote in enumerate(self.remotes):
+            try:
+                remote.send(("reset", (self._seeds[i], self._options[i])))
+            except (BrokenPipeError, EOFError, OSError):
+                failed.add(i)
+        results = self._gather(range(self.num_envs), self.reset_timeout, failed)
+        for i, result in enumerate(results):
+            if isinstance(result, WorkerFailure):
+                results[i] = self._restart(i, "reset", result)
+        obs, self.reset_infos = zip(*results)
+        self._last_obs = list(obs)
+        self._pending_states = [None] * self.num_envs
+        self._reset_seeds()
+        self._reset_options()
+        return _stack_obs(obs, self.observation_space)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        """Like SubprocVecEnv.env_method; a worker that fails the call is respawned and returns None."""
+        indices = list(self._get_indices(indices))
+        results, failed = self._call(
+            indices, "env_method", (method_name, method_args, method_kwargs), f"env_method {method_name}"
+        )
+        for i in indices:
+            if i not in failed:
+                self._record(i, method_name, method_args, method_kwargs)
+        return results
+
+    def get_attr(self, attr_name, indices=None):
+        """Like SubprocVecEnv.get_attr; a worker that fails the call is respawned and returns None."""
+        return self._call(self._get_indices(indices), "get_attr", attr_name, f"get_attr {attr_name}")[0]
+
+    def set_attr(self, attr_name, value, indices=None):
+        """Like SubprocVecEnv.set_attr; the value is set again on workers that are respawned later."""
+        indices = list(self._get_indices(indices))
+        _, failed = self._call(indices, "set_attr", (attr_name, value), f"set_attr {attr_name}")
+        for i in indices:
+            if i not in failed:
+                self._settings[i][f"set_attr {attr_name}"] = ("set_attr", (attr_name, value))
+
+    def _record(self, index, method_name, method_args, method_kwargs):
+        """Remember a successful env_method call that configures worker index, to replay it after a respawn."""
+        settings = self._settings[index]
+        if method_name == "configure_wrapper":
+            # one setting per attribute: a later call only replaces the attributes it changes
+            for name, value in method_kwargs.items():
+                settings[f"configure_wrapper {name}"] = ("env_method", (method_name, (), {name: value}))
+        elif method_name == "set_state":
+            self._pending_states[index] = method_args[0] if method_args else method_kwargs["state"]
+        elif method_name in REPLAYED_METHODS:
+            settings[REPLAYED_METHODS[method_name]] = ("env_method", (method_name, method_args, method_kwargs))
+        elif method_name in CANCELLING_METHODS:
+            settings.pop(CANCELLING_METHODS[method_name], None)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self._gather(range(self.num_envs), self.step_timeout)
+        for remote in self.remotes:
+            try:
+                remote.send(("close", None))
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+        self.closed = True
+
+    def _gather(self, indices, timeout, failed=()):
+        """Receive one answer from each worker in indices, a WorkerFailure for those that don't deliver in time."""
+        indices = list(indices)
+        results = {i: WorkerFailure("pipe closed on send") for i in failed}
+        pending = {self.remotes[i]: i for i in indices if i not in results}
+        deadline = time.monotonic() + timeout
+        while pending:
+            ready = wait(list(pending), timeout=max(deadline - time.monotonic(), 0))
+            if not ready:
+                for i in pending.values():
+                    results[i] = WorkerFailure(f"no answer within {timeout:.0f}s")
+                break
+            for remote in ready:
+                i = pending.pop(remote)
+                try:
+                    results[i] = remote.recv()
+                except (EOFError, OSError) as e:
+                    # the worker died: SB3's _worker lets env exceptions end the process
+                    self.processes[i].join(timeout=1)
+                    results[i] = WorkerFailure(f"worker exited (exitcode {self.processes[i].exitcode}): {e!r}")
+        return [results[i] for i in indices]
+
+    def _call(self, indices, command, data, during):
+        """
+        Send command to the workers in indices and gather their answers. Workers that fail are respawned and answer
+        None; returns (answers, indices of the failed workers).
+        """
+        indices = list(indices)
+        failed = set()
+        for i in indices:
+            try:
+                self.remotes[i].send((command, data))
+            except (BrokenPipeError, EOFError, OSError):
+                failed.add(i)
+        results = self._gather(indices, self.reset_timeout, failed)
+        failed = set()
+        for n, (i, result) in enumerate(zip(indices, results)):
+            if isinstance(result, WorkerFailure):
+                # the respawned worker starts a fresh episode with its next step
+                self._last_obs[i], _ = self._restart(i, during, result)
+                results[n] = None
+                failed.add(i)
+        return results, failed
+
+    def _request(self, index, command, data):
+        """Send one command to worker index; returns its answer or a WorkerFailure."""
+        try:
+            self.remotes[index].send((command, data))
+        except (BrokenPipeError, EOFError, OSError):
+            return WorkerFailure("pipe closed on send")
+        return self._gather([index], self.reset_timeout)[0]
+
+    def _restart(self, index, during, error):
+        """Respawn worker index, reset it and replay its settings; returns its (observation, reset_info)."""
+        while True:
+            self._respawn(index, during, error)
+            result = self._reconfigure(index)
+            if not isinstance(result, WorkerFailure):
+                return result
+            during, error = "restart", result
+
+    def _reconfigure(self, index):
+        """Reset a respawned worker and replay its settings; returns (observation, reset_info) or a WorkerFailure."""
+        if self._pending_states[index] is not None:
+            # restored by the reset below, as it would have been by the lost worker's next reset
+            result = self._request(index, "env_method", ("set_state", (self._pending_states[index],), {}))
+            if isinstance(result, WorkerFailure):
+                return result
+        reset_result = self._request(index, "reset", (None, None))
+        if isinstance(reset_result, WorkerFailure):
+            return reset_result
+        self._pending_states[index] = None
+        # after the reset, so loggers and recorders begin their episode with the worker's current state
+        for setting, (command, data) in list(self._settings[index].items()):
+            if setting == "sampling":
+                method_name, method_args, method_kwargs = data
+                output_path = method_kwargs.get("output_path", method_args[0] if method_args else None)
+                if output_path is not None and Path(output_path).exists():
+                    # the window was over and written before the worker failed
+                    del self._settings[index][setting]
+                    continue
+            result = self._request(index, command, data)
+            if isinstance(result, WorkerFailure):
+                return result
+        return reset_result
+
+    def _respawn(self, index, during, error):
+        self.restart_counts[index] += 1
+        count = self.restart_counts[index]
+        print(f"\nEnv worker {index} failed during {during} ({error}), restart #{count}")
+        self.restart_events.append({
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "rank": index,
+            "during": during,
+            "error": str(error),
+            "restart": count,
+        })
+        if self.max_restarts and count > self.max_restarts:
+            raise RuntimeError(f"Env worker {index} failed {count} times (max_restarts={self.max_restarts}), giving up")
+
+        process = self.processes[index]
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.remotes[index].close()
+
+        remote, work_remote = self.ctx.Pipe()
+        process = self.ctx.Process(target=_worker, args=(work_remote, remote, CloudpickleWrapper(self.env_fns[index])), daemon=True)
+        process.start()
+        work_remote.close()
+        self.remotes[index] = remote
+        self.processes[index] = process
@@ -0,0 +1,127 @@
+from ZeldaALTTP.utils.population import DEFAULT_REWARD_WEIGHTS, REWARD_WEIGHTS, PPO_HYPERPARAMS
+from ZeldaALTTP.utils.env_factory import default_ppo_kwargs
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import itertools
+import hashlib
+import sqlite3
+import json
+
+# metrics of a finished trial, one column each in the results database
+METRIC_FIELDS = [
+    "samples_per_sec", "rollout_steps_per_sec", "learner_samples_per_sec", "wall_s",
+    "episodes", "reward_mean", "fitness_mean",
+    "entropy_loss", "approx_kl", "clip_fraction", "value_loss", "explained_variance",
+]
+
+
+def expand_spec(parameters, mode="grid", samples=8, seed=0):
+    """
+    Trial parameter dicts from the [Sweep] parameters specs: {name, values} or {name, min, max, log}.
+    grid: every combination of the values lists. random: `samples` draws, values picked uniformly,
+    ranges sampled uniformly (log-uniformly with log = true; integers if min and max are integers).
+    Draws are seeded, so rerunning a random sweep yields the same trials (and hits the results database).
+    """
+    names = [spec["name"] for spec in parameters]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Sweep parameters listed more than once: {names}")
+    if mode == "grid":
+        ranged = [spec["name"] for spec in parameters if "values" not in spec]
+        if ranged:
+            raise ValueError(f"Grid sweeps need a values list for every parameter (missing for {ranged})")
+        return [dict(zip(names, values)) for values in itertools.product(*(spec["values"] for spec in parameters))]
+
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(samples):
+        trial = {}
+        for spec in parameters:
+            if "values" in spec:
+                value = spec["values"][rng.integers(len(spec["values"]))]
+            elif isinstance(spec["min"], int) and isinstance(spec["max"], int):
+                value = int(rng.integers(spec["min"], spec["max"] + 1))
+            elif spec.get("log", False):
+                value = float(np.exp(rng.uniform(np.log(spec["min"]), np.log(spec["max"]))))
+            else:
+                value = float(rng.uniform(spec["min"], spec["max"]))
+            trial[spec["name"]] = value
+        trials.append(trial)
+    return trials
+
+
+def split_trial_params(params, model_config):
+    """
+    Splits trial parameters into ([TrainModel] section, PPO keyword arguments, reward weights) for the trial.
+    [TrainModel] keys (num_envs, update_freq, batch_size, ent_coef, ...) come first, then PPO settings (gamma,
+    learning_rate, ...) and ZeldaALTTP reward weights; unknown names raise.
+    """
+    unknown = [name for name in params if name not in model_config and name not in PPO_HYPERPARAMS and name not in REWARD_WEIGHTS]
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {unknown} ([TrainModel] keys, PPO: {PPO_HYPERPARAMS}, "
+                         f"reward weights: {REWARD_WEIGHTS})")
+    train_config = dict(model_config, **{name: value for name, value in params.items() if name in model_config})
+    ppo_kwargs = default_ppo_kwargs(train_config)
+    ppo_kwargs.update({name: value for name, value in params.items() if name in PPO_HYPERPARAMS and name not in model_config})
+    weights = dict(DEFAULT_REWARD_WEIGHTS, **{name: value for name, value in params.items() if name in REWARD_WEIGHTS})
+    return train_config, ppo_kwargs, weights
+
+
+def trial_key(*settings):
+    """Identifies a trial by everything it was run with (json-serializable settings, order independent)."""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class ResultsDB:
+    """
+    SQLite store of sweep trials, keyed by trial_key. A trial is "done" or "failed" (with its error);
+    done trials are skipped by later sweeps, failed ones are run again.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS trials (
+                key TEXT PRIMARY KEY,
+                sweep TEXT,
+                status TEXT,
+                params TEXT,
+                settings TEXT,
+                started TEXT,
+                finished TEXT,
+                {", ".join(f"{name} REAL" for name in METRIC_FIELDS)},
+                error TEXT
+            )
+        """)
+        self.connection.commit()
+
+    def is_done(self, key):
+        row = self.connection.execute("SELECT status FROM trials WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] == "done"
+
+    def record(self, key, sweep, params, settings, started, result):
+        columns = ["key", "sweep", "status", "params", "settings", "started", "finished", *METRIC_FIELDS, "error"]
+        values = [
+            key, sweep, "failed" if result.get("error") else "done", json.dumps(params), json.dumps(settings, default=str),
+            started, datetime.now().isoformat(timespec="seconds"), *(result.get(name) for name in METRIC_FIELDS),
+            result.get("error"),
+        ]
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO trials ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values
+        )
+        self.connection.commit()
+
+    def ranked(self, keys, objective):
+        """Trials with the given keys as dicts (params decoded), done ones by objective (highest first), failed ones last."""
+        if objective not in METRIC_FIELDS:
+            raise ValueError(f"Unknown sweep objective '{objective}' (one of {METRIC_FIELDS})")
+        cursor = self.connection.execute(f"SELECT * FROM trials WHERE key IN ({', '.join('?' * len(keys))})", list(keys))
+        names = [column[0] for column in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        for row in rows:
+            row["params"] = json.loads(row["params"])
+        return sorted(rows, key=lambda row: (row["status"] != "done" or row[objective] is None, -(row[objective] or 0)))
+
+    def close(self):
+        self.connection.close()
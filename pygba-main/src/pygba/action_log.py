@@ -0,0 +1,297 @@
+import csv
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Any, Iterator
+
+import gymnasium as gym
+import mgba.image
+import numpy as np
+from mgba._pylib import ffi
+
+from .pygba import PyGBA
+
+# Episode action logs: everything needed to re-simulate an episode exactly. Per step 5 bytes before compression
+# (about 100 KB for a 20000-step episode); each keyframe adds a compressed ~400 KB savestate (roughly 100 KB)
+#   states/<hash>.state          emulator savestates episodes start from, stored once per content hash
+#   rank_<R>/episodes.csv        index: episode, start_state, length, return, terminated, truncated
+#   rank_<R>/events.csv          game wrapper events (GameWrapper.events) of logged episodes: episode, step, event
+#   rank_<R>/episode_<n>.npz     per step: action id, keys held down (after sticky actions) and frames emulated
+#                                (frameskip draw + 1); plus the game wrapper state and config (reward weights, see
+#                                GameWrapper.config_attrs) at the start of the episode and,
+#                                if keyframe_interval is set, keyframes every keyframe_interval steps: zlib-compressed
+#                                emulator + wrapper state before step keyframe_steps[i], concatenated in keyframe_data
+#                                at keyframe_offsets[i]
+# Replaying loads the start state, sets the logged keys and runs the logged frames, so no RNG has to be reproduced.
+# Seeking restores the nearest keyframe at or before the wanted step (or the start state, without keyframes) and
+# simulates only the steps after it.
+
+EPISODE_FIELDS = ["episode", "start_state", "length", "return", "terminated", "truncated"]
+EVENT_FIELDS = ["episode", "step", "event"]
+
+
+def save_state(states_dir: Path, state: bytes) -> str:
+    """Stores a savestate under its content hash (once) and returns the hash."""
+    state_hash = hashlib.sha256(state).hexdigest()[:16]
+    path = states_dir / f"{state_hash}.state"
+    if not path.exists():
+        states_dir.mkdir(parents=True, exist_ok=True)
+        # workers may store the same start state at the same time: write a temp file and rename it into place
+        fd, tmp_path = tempfile.mkstemp(dir=states_dir, prefix=".state_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(state)
+        os.replace(tmp_path, path)
+    return state_hash
+
+
+class ActionLogger(gym.Wrapper):
+    """
+    Logs every episode of a PyGBAEnv as start state + keys + frames per step (see the format above).
+    Logging starts with start_action_log(directory) (e.g. via VecEnv.env_method once the session directory exists),
+    writes to directory/rank_<rank> and keeps the savestates in directory/states. Episodes are written when they end.
+    """
+
+    def __init__(self, env: gym.Env, rank: int = 0, keyframe_interval: int = 0):
+        super().__init__(env)
+        self.rank = rank
+        self.keyframe_interval = keyframe_interval
+        self.log_dir = None
+        self.states_dir = None
+        self._next_episode = 0
+        self._episode = None
+
+    @property
+    def action_logging(self) -> bool:
+        return self.log_dir is not None
+
+    def start_action_log(self, directory: str | os.PathLike) -> str:
+        self.stop_action_log()
+        self.states_dir = Path(directory) / "states"
+        self.log_dir = Path(directory) / f"rank_{self.rank:02d}"
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        index_path = self.log_dir / "episodes.csv"
+        if index_path.exists():
+            with open(index_path) as f:
+                self._next_episode = sum(1 for _ in f) - 1
+        else:
+            with open(index_path, "w", newline="") as f:
+                csv.writer(f).writerow(EPISODE_FIELDS)
+            self._next_episode = 0
+        if not (self.log_dir / "events.csv").exists():
+            with open(self.log_dir / "events.csv", "w", newline="") as f:
+                csv.writer(f).writerow(EVENT_FIELDS)
+        # usually called right after the envs were reset: the episode is logged from the current state on
+        self._begin_episode()
+        return str(self.log_dir)
+
+    def stop_action_log(self):
+        if self.log_dir is not None:
+            self._end_episode(terminated=False, truncated=False)
+            self.log_dir = None
+
+    def _begin_episode(self):
+        gba_env = self.env.unwrapped
+        state = bytes(ffi.buffer(gba_env.gba.core.save_raw_state()))
+        wrapper_state = gba_env.game_wrapper.get_state() if gba_env.game_wrapper is not None else None
+        wrapper_config = gba_env.game_wrapper.get_config() if gba_env.game_wrapper is not None else {}
+        self._episode = {
+            "start_state": save_state(self.states_dir, state),
+            "wrapper_state": pickle.dumps(wrapper_state),
+            "wrapper_config": pickle.dumps(wrapper_config),
+            "actions": [],
+            "keys": [],
+            "frames": [],
+            "keyframe_steps": [],
+            "keyframes": [],
+            "events": [],
+            "return": 0.0,
+        }
+
+    def _add_keyframe(self):
+        gba_env = self.env.unwrapped
+        keyframe = {
+            "core": bytes(ffi.buffer(gba_env.gba.core.save_raw_state())),
+            "wrapper": gba_env.game_wrapper.get_state() if gba_env.game_wrapper is not None else None,
+        }
+        self._episode["keyframe_steps"].append(len(self._episode["actions"]))
+        self._episode["keyframes"].append(zlib.compress(pickle.dumps(keyframe), 6))
+
+    def _end_episode(self, terminated: bool, truncated: bool):
+        episode, self._episode = self._episode, None
+        if episode is None or not episode["actions"]:
+            return
+        np.savez_compressed(
+            self.log_dir / f"episode_{self._next_episode:06d}.npz",
+            actions=np.array(episode["actions"], dtype=np.uint16),
+            keys=np.array(episode["keys"], dtype=np.uint16),
+            frames=np.array(episode["frames"], dtype=np.uint8),
+            wrapper_state=np.frombuffer(episode["wrapper_state"], dtype=np.uint8),
+            wrapper_config=np.frombuffer(episode["wrapper_config"], dtype=np.uint8),
+            keyframe_steps=np.array(episode["keyframe_steps"], dtype=np.int64),
+            keyframe_offsets=np.cumsum([0] + [len(keyframe) for keyframe in episode["keyframes"]], dtype=np.int64),
+            keyframe_data=np.frombuffer(b"".join(episode["keyframes"]), dtype=np.uint8),
+        )
+        # events first: once an episode is indexed, its events are complete
+        with open(self.log_dir / "events.csv", "a", newline="") as f:
+            csv.writer(f).writerows([self._next_episode, step, event] for step, event in episode["events"])
+        with open(self.log_dir / "episodes.csv", "a", newline="") as f:
+            csv.writer(f).writerow([
+                self._next_episode, episode["start_state"], len(episode["actions"]), episode["return"],
+                int(terminated), int(truncated),
+            ])
+        self._next_episode += 1
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        if self.log_dir is not None:
+            # an episode cut short by a reset (e.g. restoring a savestate) is logged with neither flag set
+            self._end_episode(terminated=False, truncated=False)
+            self._begin_episode()
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        if self._episode is not None and self.log_dir is not None:
+            gba_env = self.env.unwrapped
+            self._episode["actions"].append(int(action))
+            self._episode["keys"].append(gba_env.held_keys)
+            self._episode["frames"].append(gba_env.last_step_frames)
+            self._episode["return"] += float(reward)
+            if gba_env.game_wrapper is not None:
+                step = len(self._episode["actions"]) - 1
+                self._episode["events"].extend((step, event) for event in gba_env.game_wrapper.events())
+            if terminated or truncated:
+                self._end_episode(terminated, truncated)
+            elif self.keyframe_interval and len(self._episode["actions"]) % self.keyframe_interval == 0:
+                self._add_keyframe()
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        self.stop_action_log()
+        return self.env.close()
+
+
+class ActionLogReader:
+    """Index and episodes of an action log directory (the one passed to start_action_log)."""
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self.episodes = []
+        self.events = []
+        for index_path in sorted(self.path.glob("rank_*/episodes.csv")):
+            rank = int(index_path.parent.name.split("_")[1])
+            with open(index_path) as f:
+                for row in csv.DictReader(f):
+                    self.episodes.append({
+                        "rank": rank,
+                        "episode": int(row["episode"]),
+                        "start_state": row["start_state"],
+                        "length": int(row["length"]),
+                        "return": float(row["return"]),
+                        "terminated": bool(int(row["terminated"])),
+                        "truncated": bool(int(row["truncated"])),
+                    })
+            if (index_path.parent / "events.csv").exists():
+                with open(index_path.parent / "events.csv") as f:
+                    self.events.extend(
+                        {"rank": rank, "episode": int(row["episode"]), "step": int(row["step"]), "event": row["event"]}
+                        for row in csv.DictReader(f)
+                    )
+
+    def load(self, rank: int, episode: int) -> dict[str, Any]:
+        """Per-step arrays, the wrapper state and config at the start and the start savestate of one episode."""
+        with np.load(self.path / f"rank_{rank:02d}" / f"episode_{episode:06d}.npz") as data:
+            log = {name: data[name] for name in ("actions", "keys", "frames")}
+            log["wrapper_state"] = pickle.loads(data["wrapper_state"].tobytes())
+            # logs written before the config was stored replay with the wrapper's own settings
+            log["wrapper_config"] = pickle.loads(data["wrapper_config"].tobytes()) if "wrapper_config" in data else {}
+            if "keyframe_steps" in data:
+                log["keyframe_steps"] = data["keyframe_steps"]
+                log["keyframe_offsets"] = data["keyframe_offsets"]
+                log["keyframe_data"] = data["keyframe_data"]
+        entry = next(e for e in self.episodes if e["rank"] == rank and e["episode"] == episode)
+        log["state"] = (self.path / "states" / f"{entry['start_state']}.state").read_bytes()
+        return log
+
+
+def highlight_windows(events: list[tuple[int, str]], length: int, before: int, after: int) -> list[dict[str, Any]]:
+    """
+    Step ranges around an episode's (step, event) pairs: [step - before, step + after] clipped to the episode,
+    overlapping or touching ranges merged. Returns dicts with start, stop (exclusive) and the events inside.
+    """
+    windows = []
+    for step, event in sorted(events):
+        start, stop = max(step - before, 0), min(step + after + 1, length)
+        if windows and start <= windows[-1]["stop"]:
+            windows[-1]["stop"] = max(windows[-1]["stop"], stop)
+            windows[-1]["events"].append(event)
+        else:
+            windows.append({"start": start, "stop": stop, "events": [event]})
+    return windows
+
+
+def keyframe(log: dict[str, Any], index: int) -> dict[str, Any]:
+    """Emulator state ("core") and game wrapper state ("wrapper") of a logged episode's keyframe."""
+    start, end = log["keyframe_offsets"][index], log["keyframe_offsets"][index + 1]
+    return pickle.loads(zlib.decompress(log["keyframe_data"][start:end].tobytes()))
+
+
+def seek(gba: PyGBA, log: dict[str, Any], step: int, game_wrapper=None) -> int:
+    """
+    Puts `gba` (and the game wrapper, with the logged config) into the state before `step` of a logged episode:
+    restores the nearest keyframe at or before it (or the start state) and simulates the steps in between without
+    rendering. Returns the number of steps that had to be simulated.
+    """
+    steps = log.get("keyframe_steps", np.zeros(0, dtype=np.int64))
+    index = int(np.searchsorted(steps, step, side="right")) - 1
+    if index >= 0:
+        state = keyframe(log, index)
+        core_state, wrapper_state, start = state["core"], state["wrapper"], int(steps[index])
+    else:
+        core_state, wrapper_state, start = log["state"], log["wrapper_state"], 0
+    gba.core.reset()
+    gba.core.load_raw_state(ffi.new("uint8_t[]", core_state))
+    if game_wrapper is not None:
+        game_wrapper.set_config(log.get("wrapper_config", {}))
+        if wrapper_state is not None:
+            game_wrapper.set_state(wrapper_state)
+    for keys, frames in zip(log["keys"][start:step], log["frames"][start:step]):
+        gba.core.set_keys(raw=int(keys))
+        for _ in range(frames):
+            gba.core.run_frame()
+        # the wrapper tracks progress (visited tiles, kills) in reward(), so it has to see the skipped steps too
+        if game_wrapper is not None:
+            game_wrapper.reward(gba, None)
+    return step - start
+
+
+def replay_episode(gba: PyGBA, log: dict[str, Any], game_wrapper=None, every_frame: bool = False,
+                   start: int = 0, stop: int | None = None) -> Iterator[dict[str, Any]]:
+    """
+    Re-simulates steps [start, stop) of a logged episode headless on `gba` (a PyGBA of the same ROM), seeking to
+    start via the keyframes. Yields one dict per step with the step's frames as RGB arrays (every emulated frame with
+    every_frame, else only the last one) and, if a game wrapper is given (restored to its logged state and config),
+    the step's reward, info and RAM features.
+    """
+    framebuffer = mgba.image.Image(*gba.core.desired_video_dimensions())
+    gba.core.set_video_buffer(framebuffer)
+    seek(gba, log, start, game_wrapper)
+    stop = len(log["actions"]) if stop is None else min(stop, len(log["actions"]))
+    for step in range(start, stop):
+        action, keys, frames = log["actions"][step], log["keys"][step], log["frames"][step]
+        gba.core.set_keys(raw=int(keys))
+        images = []
+        for frame in range(frames):
+            gba.core.run_frame()
+            if every_frame or frame == frames - 1:
+                images.append(np.asarray(framebuffer.to_pil().convert("RGB")))
+        result = {"step": step, "action": int(action), "frames": images}
+        if game_wrapper is not None:
+            # same order as PyGBAEnv.step: reward, info, observation (RAM features, after reward updated the tables)
+            result["reward"] = game_wrapper.reward(gba, None)
+            result["info"] = game_wrapper.info(gba, None)
+            result["ram"] = game_wrapper.ram_features(gba)
+        yield result
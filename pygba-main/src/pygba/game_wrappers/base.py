@@ -1,3 +1,4 @@
+import copy
 from abc import ABC, abstractmethod
 from typing import Any
 
@@ -6,6 +7,13 @@ import numpy as np
 from pygba.pygba import PyGBA
 
 class GameWrapper(ABC):
+    # names of the entries returned by ram_features, in order
+    ram_feature_names: tuple[str, ...] = ()
+    # attributes holding per-run progress (novelty tables, counters), saved with get_state to resume a session
+    state_attrs: tuple[str, ...] = ()
+    # attributes holding settings (e.g. reward weights), logged with get_config so a replay computes the same rewards
+    config_attrs: tuple[str, ...] = ()
+
     @abstractmethod
     def reward(self, gba: PyGBA, observation: np.ndarray) -> float:
         raise NotImplementedError
@@ -18,3 +26,26 @@ class GameWrapper(ABC):
     
     def info(self, gba: PyGBA, observation: np.ndarray) -> dict[str, Any]:
         return {}
+
+    def events(self) -> list[str]:
+        """Names of notable events (e.g. an item found) that happened in the last reward() call, for highlights."""
+        return []
+
+    def ram_features(self, gba: PyGBA) -> np.ndarray:
+        return np.zeros(len(self.ram_feature_names), dtype=np.float32)
+
+    def get_state(self) -> dict[str, Any]:
+        return {name: copy.deepcopy(getattr(self, name)) for name in self.state_attrs}
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        for name in self.state_attrs:
+            if name in state:
+                setattr(self, name, copy.deepcopy(state[name]))
+
+    def get_config(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self.config_attrs}
+
+    def set_config(self, config: dict[str, Any]) -> None:
+        for name in self.config_attrs:
+            if name in config:
+                setattr(self, name, config[name])
@@ -157,6 +157,13 @@ def get_area_by_coords(x: int, y: int) -> Optional[Area]:
             return area
     return None
 
+def get_area_index(x: int, y: int) -> int:
+    """Get the 1-based position of the area in AREAS for the given coordinates (0 if unknown)"""
+    for i, area in enumerate(AREAS.values(), start=1):
+        if area.contains(x, y):
+            return i
+    return 0
+
 def get_area_name(x: int, y: int) -> str:
     """Get a human-readable name for the area at the given coordinates"""
     area = get_area_by_coords(x, y)
@@ -1,7 +1,7 @@
 # Zelda: A Link to the Past (GBA) utility functions
 
 
-from .area_mapping import get_area_name, is_area_rewardable
+from .area_mapping import AREAS, get_area_index, get_area_name, is_area_rewardable
 
 TILE_SIZE = 8
 
@@ -93,6 +93,11 @@ def get_area_description(gba):
     x, y = read_player_xy(gba)
     return get_area_name(x, y)
 
+def read_area_index(gba):
+    """Get the index of the current area in AREAS (0 if unknown)"""
+    x, y = read_player_xy(gba)
+    return get_area_index(x, y)
+
 def get_area_rewardable(x, y):
     return is_area_rewardable(x, y)
 
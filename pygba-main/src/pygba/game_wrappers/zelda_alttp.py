@@ -3,9 +3,37 @@ from .utils.zelda_utils import *
 from .utils.zelda_utils import TILE_SIZE
 from datetime import timedelta
 import time
+import numpy as np
+
+# rough maxima used to scale RAM features into ~[0, 1] for MLP policies
+HEALTH_SCALE = 160.0  # 20 hearts * 8
+RUPEE_SCALE = 999.0
+SWORD_SCALE = 4.0
+SMALL_KEY_SCALE = 10.0
+ENEMIES_KILLED_SCALE = 255.0
+COORD_SCALE = 8192.0
+EXPLORED_SCALE = 1000.0
+VISIT_SCALE = 10.0
 
 class ZeldaALTTP(GameWrapper):
 
+    ram_feature_names = (
+        "health", "rupees", "sword", "small_keys", "enemies_killed", "x", "y",
+        "explored_locations", "tile_visits", "discovered_areas", "sword_obtained",
+        "area_unknown", *(f"area_{key}" for key in AREAS),
+    )
+    # reward weights are left out on purpose, so a resumed session picks up edited weights
+    state_attrs = (
+        "_prev_state", "_prev_reward", "last_reward_components", "died_count", "total_deaths",
+        "seen_coords", "discovered_areas", "area_discovery_timestamps",
+        "_prev_sword", "_sword_obtained", "sword_discovery_timestamp",
+        "total_enemies_killed", "total_small_keys",
+    )
+    config_attrs = (
+        "reward_scale", "explore_weight", "revisit_weight", "area_discovery_weight", "rupee_weight", "health_weight",
+        "sword_weight", "enemies_killed_weight", "small_key_weight",
+    )
+
     def __init__(self, 
                 reward_scale = 1.0,
                 explore_weight = 2.0,          
@@ -23,6 +51,7 @@ class ZeldaALTTP(GameWrapper):
         self._prev_state = None
         self._prev_reward = 0.0
         self.last_reward_components = {}
+        self.last_events = []
 
         #rupee weight   
         self.rupee_weight = rupee_weight
@@ -66,6 +95,28 @@ class ZeldaALTTP(GameWrapper):
             "small_keys": read_small_keys(gba),
         }
 
+    def ram_features(self, gba):
+        """Fixed-order feature vector (see ram_feature_names) for RAM and Dict observations"""
+        x, y = read_player_xy(gba)
+        tile_x, tile_y = x // TILE_SIZE, y // TILE_SIZE
+        coord_string = f"x:{tile_x} y:{tile_y} area:{get_area_name(x, y)}"
+        features = np.zeros(len(self.ram_feature_names), dtype=np.float32)
+        features[:11] = (
+            read_player_health(gba) / HEALTH_SCALE,
+            read_rupees(gba) / RUPEE_SCALE,
+            read_sword(gba) / SWORD_SCALE,
+            read_small_keys(gba) / SMALL_KEY_SCALE,
+            read_enemies_killed(gba) / ENEMIES_KILLED_SCALE,
+            x / COORD_SCALE,
+            y / COORD_SCALE,
+            len(self.seen_coords) / EXPLORED_SCALE,
+            min(self.seen_coords.get(coord_string, 0), VISIT_SCALE) / VISIT_SCALE,
+            len(self.discovered_areas) / len(AREAS),
+            float(self._sword_obtained),
+        )
+        features[11 + get_area_index(x, y)] = 1.0
+        return features
+
     def persist_state_data(self, state):
         self._prev_sword = state["sword"]
         self._sword_obtained = self._prev_sword > 0
@@ -188,6 +239,7 @@ class ZeldaALTTP(GameWrapper):
 
     def reward(self, gba, observation):
         state = self.game_state(gba)
+        self.last_events = []
         # check if first interation
         if self._prev_state is None:
             self._prev_state = state
@@ -203,12 +255,21 @@ class ZeldaALTTP(GameWrapper):
         if state["health"] == 0 and self._prev_state.get("health", 1) > 0:
             self.died_count += 1
             self.total_deaths += 1
+            self.last_events.append("death")
 
         # Update seen coordinates before calculating rewards
         self.update_seen_coords(state)
         
         # Calculate rewards
+        progress = (len(self.discovered_areas), self._sword_obtained, self.total_small_keys)
         rewards = self.get_game_state_reward(state)
+        # highlight events, taken from the progress counters so they don't depend on the reward weights
+        if len(self.discovered_areas) > progress[0]:
+            self.last_events.append("area_discovery")
+        if self._sword_obtained and not progress[1]:
+            self.last_events.append("sword")
+        if self.total_small_keys > progress[2]:
+            self.last_events.append("small_key")
         total_reward = sum(rewards.values())
 
         # update last reward components
@@ -238,9 +299,23 @@ class ZeldaALTTP(GameWrapper):
         self.seen_coords = {}
         self.discovered_areas = set()
         self.died_count = 0
+        self.last_events = []
         # persist state data
         self.persist_state_data(self._prev_state)
 
+    def events(self):
+        return list(self.last_events)
+
+    def get_state(self):
+        state = super().get_state()
+        # discovery timestamps are relative to the env start, keep the elapsed time instead of the wall clock
+        state["elapsed_time"] = time.time() - self._env_start_time
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self._env_start_time = time.time() - state.get("elapsed_time", 0.0)
+
     def info(self, gba, observation):
         state = self.game_state(gba)
         state.update({
@@ -5,10 +5,12 @@ import gymnasium as gym
 import mgba.core
 import mgba.image
 import numpy as np
+from mgba._pylib import ffi
 
 from .game_wrappers.base import GameWrapper
+from .profiling import NullProfiler, PhaseProfiler, StackSampler
 from .pygba import PyGBA
-from .utils import KEY_MAP
+from .utils import build_palette_lut, keys_to_mask, rgb_to_rgb555
 
 try:
     import pygame
@@ -30,13 +32,20 @@ class PyGBAEnv(gym.Env):
         self,
         gba: PyGBA,
         game_wrapper: GameWrapper | None = None,
-        obs_type: Literal["rgb", "grayscale"] = "rgb",
+        obs_type: Literal["rgb", "grayscale", "palette"] = "rgb",
         frameskip: int | tuple[int, int] | tuple[int, int, int] = 0,
         repeat_action_probability: float = 0.0,
         render_mode: Literal["human", "rgb_array"] | None = None,
         reset_to_initial_state: bool = True,
         max_episode_steps: int | None = None,
         scale_factor: float = 3.0,
+        actions: list[tuple[str | None, ...]] | None = None,
+        deterministic: bool = False,
+        downscale: int = 1,
+        frame_stack: int = 1,
+        palette: np.ndarray | None = None,
+        observation_mode: Literal["screen", "ram", "dict"] = "screen",
+        profile: bool = False,
         **kwargs,
     ):
         self.gba = gba
@@ -46,6 +55,10 @@ class PyGBAEnv(gym.Env):
         self.game_wrapper = game_wrapper
         if game_wrapper is not None and not isinstance(game_wrapper, GameWrapper):
             raise TypeError(f"game_wrapper must be a GameWrapper object (got {type(game_wrapper)})")
+        if observation_mode not in ("screen", "ram", "dict"):
+            raise ValueError(f"observation_mode must be 'screen', 'ram' or 'dict' (got {observation_mode})")
+        if observation_mode != "screen" and game_wrapper is None:
+            raise ValueError(f"observation_mode '{observation_mode}' needs a GameWrapper to provide RAM features")
         if game_wrapper is None:
             gym.logger.warn(
                 "You didn't pass a GameWrapper to the base GBA environment, "
@@ -53,26 +66,72 @@ class PyGBAEnv(gym.Env):
             )
         
         self.obs_type = obs_type
+        self.observation_mode = observation_mode
         self.frameskip = frameskip
         self.repeat_action_probability = repeat_action_probability
         self.render_mode = render_mode
         self.max_episode_steps = max_episode_steps
         self.scale_factor = scale_factor
+        # deterministic mode fixes the frameskip and disables sticky actions, so that every step does the
+        # same amount of emulation work and trajectories only depend on the actions taken
+        self.deterministic = deterministic
+        if downscale < 1:
+            raise ValueError(f"downscale must be >= 1 (got {downscale})")
+        if frame_stack < 1:
+            raise ValueError(f"frame_stack must be >= 1 (got {frame_stack})")
+        self.downscale = downscale
+        self.frame_stack = frame_stack
+        # "palette" observations hold one uint8 palette index per pixel, looked up from the 15-bit GBA colour
+        self._palette_lut = build_palette_lut(palette) if obs_type == "palette" else None
+        # per-phase wall-time histograms of step/reset; the null profiler keeps the disabled cost to a no-op context
+        self.profiler = PhaseProfiler() if profile else NullProfiler()
+        self._stack_sampler = None
+        # state passed to set_state, restored on the next reset instead of the initial state
+        self._pending_state = None
+        # keys held down and frames emulated by the last step (sticky actions keep the previous keys), for action logs
+        self.held_keys = 0
+        self.last_step_frames = 0
 
         self.arrow_keys = [None, "up", "down", "right", "left"]
         self.buttons = [None, "A", "B", "L", "R"]
         # self.buttons = [None, "A", "B", "select", "start", "L", "R"]
 
-        # cartesian product of arrows and buttons, i.e. can press 1 arrow and 1 button at the same time
-        self.actions = [(a, b) for a in self.arrow_keys for b in self.buttons]
+        if actions:
+            self.actions = [tuple(action) for action in actions]
+        else:
+            # cartesian product of arrows and buttons, i.e. can press 1 arrow and 1 button at the same time
+            self.actions = [(a, b) for a in self.arrow_keys for b in self.buttons]
+
+        # compile the action space into key bitmasks once, so stepping is a single array lookup
+        self._action_keymasks = np.array([keys_to_mask(action) for action in self.actions], dtype=np.uint32)
+        self._action_ids = {action: i for i, action in enumerate(self.actions)}
         
         self.action_space = gym.spaces.Discrete(len(self.actions))
 
         # Building the observation_space
-        screen_size = self.gba.core.desired_video_dimensions()
-        if obs_type == "rgb":
-            screen_size += (3,)
-        self.observation_space = gym.spaces.Box(low=0, high=255, shape=screen_size, dtype=np.uint8)
+        # frames are (width, height, channels); downscaling rounds up like PIL's Image.reduce
+        width, height = self.gba.core.desired_video_dimensions()
+        width, height = -(-width // downscale), -(-height // downscale)
+        channels = 3 if obs_type == "rgb" else 1
+        self._frame_shape = (width, height, channels)
+        screen_size = (width, height, channels * frame_stack)
+        self.screen_space = gym.spaces.Box(low=0, high=255, shape=screen_size, dtype=np.uint8)
+        if observation_mode != "screen":
+            num_features = len(self.game_wrapper.ram_feature_names)
+            self.ram_space = gym.spaces.Box(low=-np.inf, high=np.inf, shape=(num_features,), dtype=np.float32)
+        if observation_mode == "ram":
+            self.observation_space = self.ram_space
+        elif observation_mode == "dict":
+            self.observation_space = gym.spaces.Dict({"screen": self.screen_space, "ram": self.ram_space})
+        else:
+            self.observation_space = self.screen_space
+
+        # ring buffer for frame stacking: every frame is written twice (at i and i + frame_stack), so the
+        # last frame_stack frames are always a contiguous slice and the stacked view needs no concatenation
+        self._stack_buffer = None
+        self._stack_index = 0
+        if frame_stack > 1 and observation_mode != "ram":
+            self._stack_buffer = np.zeros((width, height, 2 * frame_stack, channels), dtype=np.uint8)
 
         self._framebuffer = mgba.image.Image(*self.gba.core.desired_video_dimensions())
         self.gba.core.set_video_buffer(self._framebuffer)  # need to reset after this
@@ -92,39 +151,94 @@ class PyGBAEnv(gym.Env):
 
         self.reset()
 
-    def get_action_by_id(self, action_id: int) -> tuple[Any, Any]:
-        if action_id < 0 or action_id > len(self.actions):
+    def get_action_by_id(self, action_id: int) -> tuple[Any, ...]:
+        if action_id < 0 or action_id >= len(self.actions):
             raise ValueError(f"action_id {action_id} is invalid")
         return self.actions[action_id]
 
-    def get_action_id(self, arrow: str, button: str) -> int:
-        action = (arrow, button)
-        if action not in self.actions:
-            raise ValueError(f"Invalid action: Must be a tuple of (arrow, button)")
-        return self.actions.index(action)
-
-    def _get_observation(self):
+    def get_action_id(self, *keys: str | None) -> int:
+        action = tuple(keys)
+        if action not in self._action_ids:
+            raise ValueError(f"Invalid action: {action} is not part of the action set")
+        return self._action_ids[action]
+
+    def get_keymask(self, action_ids) -> int | np.ndarray:
+        """Look up the GBA key bitmask for one action id or a batch of action ids (e.g. from a vector env)"""
+        action_ids = np.asarray(action_ids)
+        if action_ids.size and (action_ids.min() < 0 or action_ids.max() >= len(self.actions)):
+            raise ValueError(f"action_id {action_ids} is invalid")
+        keymasks = self._action_keymasks[action_ids]
+        return int(keymasks) if keymasks.ndim == 0 else keymasks
+
+    def _get_frame(self):
         img = self._framebuffer.to_pil().convert("RGB")
+        if self.downscale > 1:
+            img = img.reduce(self.downscale)
         if self.obs_type == "grayscale":
             img = img.convert("L")
-        return np.array(img).transpose(1, 0, 2)
+        frame = np.array(img)
+        if self._palette_lut is not None:
+            frame = self._palette_lut[rgb_to_rgb555(frame)]
+        if frame.ndim == 2:
+            frame = frame[..., None]
+        return frame.transpose(1, 0, 2)
+
+    def _get_observation(self, reset: bool = False):
+        screen = self._get_screen(reset) if self.observation_mode != "ram" else None
+        return self._make_observation(screen)
+
+    def _make_observation(self, screen):
+        """Observation from the current screen (None in "ram" mode) and the game wrapper's current RAM features"""
+        if self.observation_mode == "ram":
+            return self.game_wrapper.ram_features(self.gba)
+        if self.observation_mode == "dict":
+            return {"screen": screen, "ram": self.game_wrapper.ram_features(self.gba)}
+        return screen
+
+    def _get_screen(self, reset: bool = False):
+        frame = self._get_frame()
+        if self._stack_buffer is None:
+            return frame
+
+        k = self.frame_stack
+        if reset:
+            self._stack_buffer[:] = frame[:, :, None]
+            self._stack_index = 0
+        else:
+            i = self._stack_index
+            self._stack_buffer[:, :, i] = frame
+            self._stack_buffer[:, :, i + k] = frame
+            self._stack_index = (i + 1) % k
+        # oldest frame first; this is a view into the ring buffer that is only valid until the next step
+        i = self._stack_index
+        return self._stack_buffer[:, :, i:i + k].reshape(self.screen_space.shape)
 
     def step(self, action_id):
         info = {}
+        profiler = self.profiler
+
+        with profiler.phase("emulate"):
+            # same check as get_keymask: a negative id would silently index another action
+            if not 0 <= action_id < len(self._action_keymasks):
+                raise ValueError(f"action_id {action_id} is invalid")
+            keymask = int(self._action_keymasks[action_id])
+            if self.deterministic or self.np_random.random() > self.repeat_action_probability:
+                self.gba.core.set_keys(raw=keymask)
+                self.held_keys = keymask
+
+            if isinstance(self.frameskip, tuple):
+                if self.deterministic:
+                    frameskip = (self.frameskip[0] + self.frameskip[1]) // 2
+                else:
+                    frameskip = int(self.np_random.integers(*self.frameskip))
+            else:
+                frameskip = self.frameskip
 
-        actions = self.get_action_by_id(action_id)
-        actions = [KEY_MAP[a] for a in actions if a is not None]
-        if np.random.random() > self.repeat_action_probability:
-            self.gba.core.set_keys(*actions)
-
-        if isinstance(self.frameskip, tuple):
-            frameskip = np.random.randint(*self.frameskip)
-        else:
-            frameskip = self.frameskip
-
-        for _ in range(frameskip + 1):
-            self.gba.core.run_frame()
-        observation = self._get_observation()
+            for _ in range(frameskip + 1):
+                self.gba.core.run_frame()
+            self.last_step_frames = frameskip + 1
+        with profiler.phase("observe"):
+            screen = self._get_screen() if self.observation_mode != "ram" else None
 
         reward = 0
         done = False
@@ -133,23 +247,60 @@ class PyGBAEnv(gym.Env):
         if self.max_episode_steps is not None:
             truncated = self._step >= self.max_episode_steps
         if self.game_wrapper is not None:
-            reward = self.game_wrapper.reward(self.gba, observation)
-            done = done or self.game_wrapper.game_over(self.gba, observation)
-            info.update(self.game_wrapper.info(self.gba, observation))
+            # the wrapper sees the screen (None in "ram" mode): the RAM features are only built after reward(), which
+            # updates the exploration tables (visited tiles, discovered areas) they include
+            with profiler.phase("reward"):
+                reward = self.game_wrapper.reward(self.gba, screen)
+                done = done or self.game_wrapper.game_over(self.gba, screen)
+            with profiler.phase("info"):
+                info.update(self.game_wrapper.info(self.gba, screen))
+        with profiler.phase("ram_features"):
+            observation = self._make_observation(screen)
 
         self._total_reward += reward
+        if (done or truncated) and self._stack_buffer is not None:
+            # the stacked screen is a view into the ring buffer, and the final observation of an episode outlives the
+            # reset that follows (SubprocVecEnv keeps it as info["terminal_observation"] to bootstrap from)
+            if self.observation_mode == "dict":
+                observation = dict(observation, screen=observation["screen"].copy())
+            else:
+                observation = observation.copy()
         # self._step += 1
         # print(f"\r step={self._step} | {reward=} | {done=} | {truncated=}", end="", flush=True)
 
         return observation, reward, done, truncated, info
     
+    def pop_profile(self) -> dict[str, dict]:
+        """Phase timing summary since the last call (empty unless the env was created with profile=True)"""
+        return self.profiler.summary(reset=True)
+
+    def start_sampling(self, output_path: str, duration: float = 10.0, interval: float = 0.005) -> bool:
+        """
+        Sample the Python stacks of the thread calling this (the one stepping the env, e.g. a SubprocVecEnv worker)
+        for `duration` seconds in the background, then write collapsed stacks to output_path.
+        Returns False if a sampling window is still running.
+        """
+        if self._stack_sampler is not None and self._stack_sampler.running:
+            return False
+        self._stack_sampler = StackSampler(interval=interval)
+        self._stack_sampler.start(duration=duration, output_path=output_path)
+        return True
+
     def check_if_done(self):
-        observation = self._get_observation()
+        observation = self._get_frame()
         done = self.game_wrapper.game_over(self.gba, observation)
 
         return done
 
-    def reset(self, seed=None):
+    def reset(self, seed=None, options=None):
+        with self.profiler.phase("reset"):
+            return self._reset(seed=seed, options=options)
+
+    def _reset(self, seed=None, options=None):
+        # seeds self.np_random, which drives the sticky action and frameskip draws of this env
+        super().reset(seed=seed)
+        if self._pending_state is not None:
+            return self._restore_state()
         info = {}
         self._total_reward = 0
         self._step = 0
@@ -162,10 +313,59 @@ class PyGBAEnv(gym.Env):
             # 2. run_frame after resetting the state, offsetting the savestate by one frame
             self.gba.core.run_frame()
         
-        observation = self._get_observation()
-        
+        # reset the wrapper first, RAM features depend on its per-episode state
         if self.game_wrapper is not None:
             self.game_wrapper.reset(self.gba)
+        observation = self._get_observation(reset=True)
+        
+        if self.game_wrapper is not None:
+            info.update(self.game_wrapper.info(self.gba, observation))
+        return observation, info
+
+    def get_state(self) -> dict[str, Any]:
+        """Snapshot of the emulator, episode progress, frame stack, wrapper tables and RNG (see set_state)"""
+        return {
+            "core": bytes(ffi.buffer(self.gba.core.save_raw_state())),
+            "step": self._step,
+            "total_reward": self._total_reward,
+            "np_random": self.np_random.bit_generator.state,
+            "stack_buffer": self._stack_buffer.copy() if self._stack_buffer is not None else None,
+            "stack_index": self._stack_index,
+            "wrapper": self.game_wrapper.get_state() if self.game_wrapper is not None else None,
+        }
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        """Continue from a get_state snapshot; it replaces the initial state on the next reset only"""
+        self._pending_state = state
+
+    def configure_wrapper(self, **attrs) -> None:
+        """Change existing game wrapper attributes (e.g. reward weights) of a running env, e.g. via VecEnv.env_method"""
+        for name, value in attrs.items():
+            if not hasattr(self.game_wrapper, name):
+                raise AttributeError(f"{type(self.game_wrapper).__name__} has no attribute '{name}'")
+            setattr(self.game_wrapper, name, value)
+
+    def _restore_state(self):
+        state, self._pending_state = self._pending_state, None
+        self.gba.core.reset()
+        self.gba.core.load_raw_state(ffi.new("uint8_t[]", state["core"]))
+        # same trade-off as in reset: render one frame so the framebuffer matches the loaded state
+        self.gba.core.run_frame()
+        self._step = state["step"]
+        self._total_reward = state["total_reward"]
+        self.np_random.bit_generator.state = state["np_random"]
+        if self.game_wrapper is not None and state["wrapper"] is not None:
+            self.game_wrapper.set_state(state["wrapper"])
+        reset_stack = True
+        if self._stack_buffer is not None and state["stack_buffer"] is not None \
+                and state["stack_buffer"].shape == self._stack_buffer.shape:
+            # keep the stacked history and let the refreshed frame replace the newest one
+            self._stack_buffer[:] = state["stack_buffer"]
+            self._stack_index = (state["stack_index"] - 1) % self.frame_stack
+            reset_stack = False
+        observation = self._get_observation(reset=reset_stack)
+        info = {}
+        if self.game_wrapper is not None:
             info.update(self.game_wrapper.info(self.gba, observation))
         return observation, info
 
@@ -237,3 +437,4 @@ class PyGBAEnv(gym.Env):
             pygame.quit()
             self._screen = None
             self._clock = None
+        self.gba.close()
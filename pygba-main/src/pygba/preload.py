@@ -0,0 +1,44 @@
+# File cache shared with env workers through the multiprocessing fork server: the server imports this module (and the
+# env modules passed to enable_forkserver_preload) once, reads the files named in PYGBA_PRELOAD_FILES, and every
+# worker forked from it finds the modules imported and the files in _cache (copy-on-write)
+import multiprocessing as mp
+import os
+from pathlib import Path
+
+PRELOAD_ENV_VAR = "PYGBA_PRELOAD_FILES"
+
+_cache: dict[str, bytes] = {}
+
+
+def _key(path) -> str:
+    return str(Path(path).resolve())
+
+
+def preload_files(paths) -> None:
+    for path in paths:
+        if path and _key(path) not in _cache:
+            _cache[_key(path)] = Path(path).read_bytes()
+
+
+def read_file(path) -> bytes:
+    """Contents of path, from the preload cache if it was preloaded"""
+    data = _cache.get(_key(path))
+    return data if data is not None else Path(path).read_bytes()
+
+
+def is_preloaded(path) -> bool:
+    return _key(path) in _cache
+
+
+def enable_forkserver_preload(paths, modules=()) -> None:
+    """
+    Make the fork server read paths and import pygba.gym_env plus modules (importable names; "__main__" is not
+    imported by the fork server) before it forks any worker, so workers start with both already in memory.
+    Has to run before the first forkserver process is started; the server keeps them for its lifetime.
+    """
+    os.environ[PRELOAD_ENV_VAR] = os.pathsep.join(_key(path) for path in paths if path)
+    mp.set_forkserver_preload([__name__, "pygba.gym_env", *modules])
+
+
+if os.environ.get(PRELOAD_ENV_VAR):
+    preload_files(os.environ[PRELOAD_ENV_VAR].split(os.pathsep))
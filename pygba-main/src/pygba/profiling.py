@@ -0,0 +1,177 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+
+import numpy as np
+
+# histogram bin edges in seconds: log-spaced, 8 bins per decade from 1us to 10s
+BIN_EDGES = np.logspace(-6, 1, 7 * 8 + 1)
+_BIN_EDGES = BIN_EDGES.tolist()
+
+
+class _PhaseTimer:
+    """Context manager timing one phase into its profiler (one instance per phase, reused)"""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseProfiler:
+    """Wall-time histograms of named phases (e.g. emulate / observe / reward / info of an env step)"""
+    enabled = True
+
+    def __init__(self):
+        self._timers = {}
+        self.reset()
+
+    def reset(self):
+        self._counts = {}
+        self._totals = {}
+
+    def phase(self, name: str):
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _PhaseTimer(self, name)
+        return timer
+
+    def record(self, name: str, seconds: float):
+        counts = self._counts.get(name)
+        if counts is None:
+            counts = self._counts[name] = [0] * (len(_BIN_EDGES) + 1)
+            self._totals[name] = 0.0
+        counts[bisect_left(_BIN_EDGES, seconds)] += 1
+        self._totals[name] += seconds
+
+    def summary(self, reset: bool = True) -> dict[str, dict]:
+        """Per phase count, total/mean time, histogram percentiles and the raw histogram (see BIN_EDGES)"""
+        summary = {name: summarize_histogram(counts, self._totals[name]) for name, counts in self._counts.items()}
+        if reset:
+            self.reset()
+        return summary
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off: phase() is a shared no-op context and nothing is recorded"""
+    enabled = False
+    _null = nullcontext()
+
+    def phase(self, name: str):
+        return self._null
+
+    def record(self, name: str, seconds: float):
+        pass
+
+    def reset(self):
+        pass
+
+    def summary(self, reset: bool = True) -> dict[str, dict]:
+        return {}
+
+
+def _percentile_ms(counts, total_count, q):
+    # upper edge of the bin holding the q-th sample, i.e. a conservative estimate
+    index = int(np.searchsorted(np.cumsum(counts), q * total_count))
+    return 1000 * float(BIN_EDGES[min(index, len(BIN_EDGES) - 1)])
+
+
+def summarize_histogram(counts, total: float) -> dict:
+    count = int(sum(counts))
+    return {
+        "count": count,
+        "total_s": total,
+        "mean_ms": 1000 * total / count if count else 0.0,
+        "p50_ms": _percentile_ms(counts, count, 0.5),
+        "p90_ms": _percentile_ms(counts, count, 0.9),
+        "p99_ms": _percentile_ms(counts, count, 0.99),
+        "histogram": list(counts),
+    }
+
+
+def merge_summaries(summaries: list[dict[str, dict]]) -> dict[str, dict]:
+    """Combine phase summaries (e.g. of all workers) by adding up their histograms"""
+    counts, totals = {}, {}
+    for summary in summaries:
+        for name, phase in summary.items():
+            if name not in counts:
+                counts[name] = np.zeros(len(phase["histogram"]), dtype=np.int64)
+                totals[name] = 0.0
+            counts[name] += phase["histogram"]
+            totals[name] += phase["total_s"]
+    return {name: summarize_histogram(counts[name].tolist(), totals[name]) for name in counts}
+
+
+class StackSampler:
+    """
+    Sampling profiler for one thread of this process: a background thread grabs the target thread's Python stack
+    every `interval` seconds via sys._current_frames() and counts identical stacks.
+    Time spent in C (cffi calls into mGBA, PIL) is attributed to the Python line that made the call.
+    Results are written as collapsed stacks ("root;caller;callee count" per line), the input format of
+    flamegraph.pl, speedscope and inferno.
+    """
+    def __init__(self, thread_id: int | None = None, interval: float = 0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float | None = None, output_path: str | None = None):
+        """Sample until stop() or for `duration` seconds, then write the collapsed stacks to output_path (if given)"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration, output_path), name="StackSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, duration, output_path):
+        end = time.perf_counter() + duration if duration is not None else None
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                # target thread is gone
+                break
+            self.counts[_collapse(frame)] += 1
+            self.samples += 1
+            del frame
+            if end is not None and time.perf_counter() >= end:
+                break
+        if output_path is not None:
+            self.write_collapsed(output_path)
+
+    def write_collapsed(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
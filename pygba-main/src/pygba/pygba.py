@@ -1,4 +1,8 @@
+import hashlib
+import os
+import shutil
 import tempfile
+import weakref
 from pathlib import Path
 
 import mgba.core
@@ -6,34 +10,75 @@ from mgba._pylib import ffi, lib
 
 from pygba.utils import KEY_MAP
 
+# one read-only copy per ROM content, shared by every instance (and process) on this machine
+ROM_CACHE_DIR = Path(tempfile.gettempdir()) / "pygba"
+
+
+def cached_rom_path(rom_data: bytes) -> Path:
+    """Path of the shared read-only copy of rom_data in ROM_CACHE_DIR (written atomically on first use)"""
+    path = ROM_CACHE_DIR / f"rom_{hashlib.sha256(rom_data).hexdigest()[:16]}.gba"
+    if path.exists():
+        return path
+    ROM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=ROM_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(rom_data)
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+    except OSError:
+        # another process may have won the race (replacing a read-only file fails on Windows)
+        if not path.exists():
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
 
 class PyGBA:
     @staticmethod
-    def load(gba_file: str, save_file: str | None = None) -> "PyGBA":
-        # create a temporary directory and copy the gba file into it
-        # this is necessary to prevent mgba from overwriting the save file (and to prevent crashes)
-        tmp_dir = Path(tempfile.mkdtemp())
-        tmp_gba = tmp_dir / "rom.gba"
-        tmp_gba.write_bytes(Path(gba_file).read_bytes())
-        gba_file = str(tmp_gba)
+    def load(gba_file: str, save_file: str | None = None, rom_data: bytes | None = None) -> "PyGBA":
+        # mgba loads the ROM from a shared content-addressed copy instead of the original file (and its neighbours)
+        # rom_data: contents of gba_file if already in memory (e.g. preloaded by the fork server), skips reading it
+        rom_path = cached_rom_path(rom_data if rom_data is not None else Path(gba_file).read_bytes())
+        scratch_dir = None
         if save_file is not None:
-            tmp_save = tmp_dir / "rom.sav"
-            tmp_save.write_bytes(Path(save_file).read_bytes())
-            save_file = str(tmp_save)
-
-        core = mgba.core.load_path(gba_file)
+            # mgba autoloads (and writes) the .sav next to the ROM, so a save gets a scratch dir per instance
+            # holding a link to the cached ROM and a copy of the save
+            scratch_dir = Path(tempfile.mkdtemp(prefix="pygba_"))
+            scratch_rom = scratch_dir / "rom.gba"
+            try:
+                os.link(rom_path, scratch_rom)
+            except OSError:
+                shutil.copyfile(rom_path, scratch_rom)
+            shutil.copyfile(save_file, scratch_dir / "rom.sav")
+            rom_path = scratch_rom
+
+        core = mgba.core.load_path(str(rom_path))
         if core is None:
+            if scratch_dir is not None:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
             raise ValueError(f"Failed to load GBA file: {gba_file}")
         if save_file is not None:
             core.autoload_save()
         core.reset()
-        return PyGBA(core)
-    
+        gba = PyGBA(core)
+        if scratch_dir is not None:
+            gba._scratch_cleanup = weakref.finalize(gba, shutil.rmtree, scratch_dir, ignore_errors=True)
+        return gba
+
     def __init__(self, core: mgba.core.Core):
         self.core = core
 
         self.core.add_frame_callback(self._invalidate_mem_cache)
         self._mem_cache = {}
+        self._scratch_cleanup = None
+
+    def close(self):
+        """Delete this instance's scratch save copy (if any); also happens when the instance is garbage collected"""
+        if self._scratch_cleanup is not None:
+            self._scratch_cleanup()
 
     def wait(self, frames: int):
         for _ in range(frames):
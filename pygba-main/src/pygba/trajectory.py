@@ -0,0 +1,259 @@
+import csv
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import gymnasium as gym
+import numpy as np
+
+# On-disk trajectory format, one directory per env worker:
+#   meta.json                 columns (dtype, per-row shape), chunk_steps, RAM feature names, rows written so far
+#   episodes.csv              episode index: episode, start row, length, return, terminated, truncated
+#   chunk_000000/<column>.npy one preallocated .npy file per column holding chunk_steps rows, memory-mapped while
+#                             written (np.load(..., mmap_mode="r") reads it without loading it)
+# Row t holds the observation the action was taken on (ram, frame), the action, and the reward and done flags
+# (bit 0 terminated, bit 1 truncated) the step returned. Rows of the last chunk past meta.json's "rows" are unused.
+
+DONE_TERMINATED = 1
+DONE_TRUNCATED = 2
+EPISODE_FIELDS = ["episode", "start", "length", "return", "terminated", "truncated"]
+
+
+class TrajectoryWriter:
+    """Appends rows to chunked, memory-mapped column files (see the format above); an existing directory is continued."""
+
+    def __init__(self, path: str | os.PathLike, columns: dict[str, tuple[str, tuple[int, ...]]],
+                 chunk_steps: int = 16384, extra_meta: dict[str, Any] | None = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.chunk_steps = chunk_steps
+        self.columns = {name: (np.dtype(dtype), tuple(shape)) for name, (dtype, shape) in columns.items()}
+        self.meta = {
+            "chunk_steps": chunk_steps,
+            "columns": {name: {"dtype": dtype.str, "shape": list(shape)} for name, (dtype, shape) in self.columns.items()},
+            **(extra_meta or {}),
+            "rows": 0,
+        }
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            with open(meta_path) as f:
+                previous = json.load(f)
+            if previous["columns"] != self.meta["columns"] or previous["chunk_steps"] != chunk_steps:
+                raise ValueError(f"{self.path} holds trajectories with other columns or chunk size")
+            self.meta["rows"] = previous["rows"]
+        self.rows = self.meta["rows"]
+        self._chunk = None
+        self._chunk_index = -1
+        self._write_meta()
+
+    def _open_chunk(self, index: int):
+        self._close_chunk()
+        chunk_dir = self.path / f"chunk_{index:06d}"
+        chunk_dir.mkdir(exist_ok=True)
+        self._chunk = {}
+        for name, (dtype, shape) in self.columns.items():
+            file = chunk_dir / f"{name}.npy"
+            if file.exists():
+                self._chunk[name] = np.lib.format.open_memmap(file, mode="r+")
+            else:
+                # sparse until written, so a preallocated chunk costs no disk space for rows not recorded yet
+                self._chunk[name] = np.lib.format.open_memmap(file, mode="w+", dtype=dtype, shape=(self.chunk_steps, *shape))
+        self._chunk_index = index
+
+    def _close_chunk(self):
+        if self._chunk is not None:
+            for column in self._chunk.values():
+                column.flush()
+            self._chunk = None
+
+    def append(self, **values):
+        """Writes one row (one value per column); rows land in the page cache and are written back by the OS."""
+        index, offset = divmod(self.rows, self.chunk_steps)
+        if index != self._chunk_index:
+            self._open_chunk(index)
+        for name, value in values.items():
+            self._chunk[name][offset] = value
+        self.rows += 1
+        if offset == self.chunk_steps - 1:
+            self._close_chunk()
+            self._write_meta()
+
+    def _write_meta(self):
+        self.meta["rows"] = self.rows
+        tmp_path = self.path / ".meta.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, self.path / "meta.json")
+
+    def close(self):
+        self._close_chunk()
+        self._write_meta()
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    """
+    Records a PyGBAEnv's trajectories (actions, rewards, done flags, the game wrapper's RAM feature vector and
+    optionally downscaled RGB frames) with a TrajectoryWriter and keeps the episode index.
+    Recording starts with start_recording(directory) (e.g. via VecEnv.env_method once the session directory exists)
+    and writes to directory/rank_<rank>.
+    """
+
+    def __init__(self, env: gym.Env, rank: int = 0, frames: bool = False, frame_downscale: int = 4,
+                 chunk_steps: int = 16384):
+        super().__init__(env)
+        self.rank = rank
+        self.frames = frames
+        self.frame_downscale = frame_downscale
+        self.chunk_steps = chunk_steps
+        self.writer = None
+        self.episodes_path = None
+        self._next_episode = 0
+        self._last = None
+        self._episode = None
+
+    @property
+    def recording(self) -> bool:
+        return self.writer is not None
+
+    def start_recording(self, directory: str | os.PathLike) -> str:
+        self.stop_recording()
+        gba_env = self.env.unwrapped
+        columns = {"action": ("<u2", ()), "reward": ("<f4", ()), "done": ("u1", ())}
+        if gba_env.game_wrapper is not None:
+            columns["ram"] = ("<f4", (len(gba_env.game_wrapper.ram_feature_names),))
+        if self.frames:
+            columns["frame"] = ("u1", self._frame().shape)
+        path = Path(directory) / f"rank_{self.rank:02d}"
+        self.writer = TrajectoryWriter(path, columns, self.chunk_steps, extra_meta={
+            "ram_features": list(gba_env.game_wrapper.ram_feature_names) if gba_env.game_wrapper is not None else [],
+            "frame_downscale": self.frame_downscale if self.frames else None,
+            "frameskip": gba_env.frameskip,
+        })
+        self.episodes_path = path / "episodes.csv"
+        self._next_episode, indexed_rows = self._read_index()
+        # continuing after a crash: rows of indexed episodes may lie past the rows counted in meta.json
+        self.writer.rows = max(self.writer.rows, indexed_rows)
+        # usually called right after the envs were reset, so recording starts with the current observation
+        self._last = self._observe()
+        self._episode = {"start": self.writer.rows, "length": 0, "return": 0.0}
+        return str(path)
+
+    def stop_recording(self):
+        if self.writer is not None:
+            self._end_episode(0)
+            self.writer.close()
+            self.writer = None
+
+    def _read_index(self) -> tuple[int, int]:
+        """(episodes indexed so far, row after the last indexed episode); creates the index if there is none."""
+        if not self.episodes_path.exists():
+            with open(self.episodes_path, "w", newline="") as f:
+                csv.writer(f).writerow(EPISODE_FIELDS)
+            return 0, 0
+        with open(self.episodes_path) as f:
+            episodes = list(csv.DictReader(f))
+        end = max((int(episode["start"]) + int(episode["length"]) for episode in episodes), default=0)
+        return len(episodes), end
+
+    def _frame(self) -> np.ndarray:
+        img = self.env.unwrapped._framebuffer.to_pil().convert("RGB")
+        if self.frame_downscale > 1:
+            img = img.reduce(self.frame_downscale)
+        return np.asarray(img)
+
+    def _observe(self, observation=None) -> dict[str, np.ndarray]:
+        """Columns describing the current observation (RAM features are taken from it when it has them)."""
+        gba_env = self.env.unwrapped
+        row = {}
+        if "ram" in self.writer.columns:
+            if observation is None:
+                row["ram"] = gba_env.game_wrapper.ram_features(gba_env.gba)
+            elif gba_env.observation_mode == "ram":
+                row["ram"] = observation
+            elif gba_env.observation_mode == "dict":
+                row["ram"] = observation["ram"]
+            else:
+                row["ram"] = gba_env.game_wrapper.ram_features(gba_env.gba)
+        if self.frames:
+            row["frame"] = self._frame()
+        return row
+
+    def _end_episode(self, done: int):
+        if self._episode is not None and self._episode["length"] > 0:
+            with open(self.episodes_path, "a", newline="") as f:
+                csv.writer(f).writerow([
+                    self._next_episode, self._episode["start"], self._episode["length"], self._episode["return"],
+                    int(bool(done & DONE_TERMINATED)), int(bool(done & DONE_TRUNCATED)),
+                ])
+            self._next_episode += 1
+        self._episode = None
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        if self.writer is not None:
+            # an episode cut short by a reset (e.g. restoring a savestate) is indexed with neither flag set
+            self._end_episode(0)
+            self._last = self._observe(observation)
+            self._episode = {"start": self.writer.rows, "length": 0, "return": 0.0}
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        if self.writer is not None and self._last is not None:
+            done = (DONE_TERMINATED if terminated else 0) | (DONE_TRUNCATED if truncated else 0)
+            self.writer.append(action=int(action), reward=reward, done=done, **self._last)
+            self._episode["length"] += 1
+            self._episode["return"] += float(reward)
+            if done:
+                self._end_episode(done)
+                self._last = None
+            else:
+                self._last = self._observe(observation)
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        self.stop_recording()
+        return self.env.close()
+
+
+class TrajectoryReader:
+    """Reads a TrajectoryRecorder directory (rank_<rank>): columns are memory-mapped, episodes sliced from them."""
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            self.meta = json.load(f)
+        self.chunk_steps = self.meta["chunk_steps"]
+        self.columns = list(self.meta["columns"])
+        self.episodes = []
+        if (self.path / "episodes.csv").exists():
+            with open(self.path / "episodes.csv") as f:
+                for row in csv.DictReader(f):
+                    self.episodes.append({name: float(value) if name == "return" else int(value) for name, value in row.items()})
+        # rows are only counted in meta.json per finished chunk; indexed episodes may already be further along
+        self.rows = max([self.meta["rows"]] + [episode["start"] + episode["length"] for episode in self.episodes])
+
+    def _chunk_column(self, index: int, name: str) -> np.ndarray:
+        return np.load(self.path / f"chunk_{index:06d}" / f"{name}.npy", mmap_mode="r")
+
+    def read(self, name: str, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """Rows [start, stop) of a column (one copy; slices within one chunk stay memory-mapped views)."""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        parts = []
+        row = start
+        while row < stop:
+            index, offset = divmod(row, self.chunk_steps)
+            count = min(stop - row, self.chunk_steps - offset)
+            parts.append(self._chunk_column(index, name)[offset:offset + count])
+            row += count
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            column = self.meta["columns"][name]
+            return np.zeros((0, *column["shape"]), dtype=column["dtype"])
+        return np.concatenate(parts)
+
+    def episode(self, index: int, columns: list[str] | None = None) -> dict[str, np.ndarray]:
+        episode = self.episodes[index]
+        return {name: self.read(name, episode["start"], episode["start"] + episode["length"]) for name in columns or self.columns}
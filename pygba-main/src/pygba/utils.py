@@ -1,3 +1,4 @@
+import numpy as np
 from mgba.gba import GBA
 
 KEY_MAP = {
@@ -13,6 +14,57 @@ KEY_MAP = {
     "select": GBA.KEY_SELECT,
 }
 
+def keys_to_mask(keys) -> int:
+    """Convert an iterable of key names (None entries are ignored) into a GBA key bitmask"""
+    mask = 0
+    for key in keys:
+        if key is None:
+            continue
+        if key not in KEY_MAP:
+            raise ValueError(f"Invalid key: {key}")
+        mask |= 1 << KEY_MAP[key]
+    return mask
+
+def parse_action(spec: str) -> tuple[str, ...]:
+    """Parse an action spec such as "up+A" into a tuple of key names ("" is the no-op action)"""
+    return tuple(key.strip() for key in spec.split("+") if key.strip())
+
+def rgb_to_rgb555(rgb: np.ndarray) -> np.ndarray:
+    """Map 8-bit RGB pixels (..., 3) to 15-bit GBA colour codes, which index a palette lookup table"""
+    rgb = np.asarray(rgb, dtype=np.uint16) >> 3
+    return (rgb[..., 0] << 10) | (rgb[..., 1] << 5) | rgb[..., 2]
+
+def build_palette_lut(palette: np.ndarray | None = None) -> np.ndarray:
+    """
+    Build a lookup table from every 15-bit GBA colour to a uint8 palette index.
+    Without a palette this is a fixed 3-3-2 RGB quantization, otherwise each colour maps to the
+    nearest entry of the given (N <= 256, 3) RGB palette.
+    """
+    codes = np.arange(1 << 15, dtype=np.uint16)
+    r, g, b = (codes >> 10) & 0x1F, (codes >> 5) & 0x1F, codes & 0x1F
+    if palette is None:
+        return ((r >> 2) << 5 | (g >> 2) << 2 | (b >> 3)).astype(np.uint8)
+
+    palette = np.asarray(palette, dtype=np.int32).reshape(-1, 3)
+    if not 0 < len(palette) <= 256:
+        raise ValueError(f"palette must have between 1 and 256 colours (got {len(palette)})")
+    colours = np.stack([r, g, b], axis=-1).astype(np.int32) << 3
+    lut = np.empty(len(codes), dtype=np.uint8)
+    # chunked to keep the (chunk, N, 3) distance tensor small
+    for start in range(0, len(codes), 4096):
+        dist = ((colours[start:start + 4096, None, :] - palette[None, :, :]) ** 2).sum(axis=-1)
+        lut[start:start + 4096] = dist.argmin(axis=-1)
+    return lut
+
+def learn_palette(frames, n_colors: int = 16) -> np.ndarray:
+    """Learn a small palette from sample RGB frames by keeping the n_colors most frequent GBA colours"""
+    counts = np.zeros(1 << 15, dtype=np.int64)
+    for frame in frames:
+        counts += np.bincount(rgb_to_rgb555(frame).ravel(), minlength=1 << 15)
+    codes = np.argsort(counts)[::-1][:n_colors]
+    codes = codes[counts[codes] > 0]
+    return np.stack([(codes >> 10) & 0x1F, (codes >> 5) & 0x1F, codes & 0x1F], axis=-1).astype(np.uint8) << 3
+
 class BaseCharmap:
     charmap: list[str]
     terminator: int